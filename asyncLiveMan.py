@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# coding:utf-8
+# @FileName:    asyncLiveMan.py
+# @Project:     douyinLiveWebFetcher
+
+import asyncio
+import time
+
+from websockets.asyncio.client import connect
+
+import config
+from enricher import enrich_chat_batch
+from frame_decoder import decode_pool
+from liveMan import HEARTBEAT_FRAME, DouyinLiveWebFetcher
+from room_resolver import resolver
+from room_supervisor import (BACKOFF, CONNECTING, ENDED, LIVE, RESOLVING, SIGNING, Backoff, reconnect_cause,
+                             reconnect_gate)
+from scheduler import scheduler
+
+
+class AsyncDouyinLiveWebFetcher(DouyinLiveWebFetcher):
+    """
+    asyncio版直播间弹幕抓取对象：抖音websocket连接、心跳、ack、重连全部运行在服务的事件循环上，
+    不再为每个直播间创建线程。回调约定与DouyinLiveWebFetcher一致：callback(msg)，在事件循环线程中调用。
+    阻塞操作（room_id/ttwid请求、签名、redis查询）放到默认线程池执行。
+    """
+
+    def __init__(self, live_id):
+        super().__init__(live_id)
+        self._loop = None
+        self._task = None
+        self.state = ENDED
+        self.backoff = Backoff(base=config.RECONNECT_BASE_DELAY, cap=config.RECONNECT_MAX_DELAY)
+        self.reconnects = 0
+        self.reconnect_causes = {}  # 原因 -> 次数
+        self.last_error = None
+        self._stalled = False
+        self.room_status = None
+        self._statusPoll = None
+
+    def start(self, callback):
+        """必须在事件循环中调用"""
+        self.callback = callback
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+        if config.ROOM_STATUS_INTERVAL > 0:
+            self._statusPoll = scheduler.call_every(config.ROOM_STATUS_INTERVAL, self._pollRoomStatus,
+                                                    blocking=True, name=f"status-{self.live_id}")
+
+    def connection_stats(self):
+        stats = {
+            "state": self.state,
+            "reconnects": self.reconnects,
+            "reconnect_causes": dict(self.reconnect_causes),
+            "backoff_attempt": self.backoff.attempt,
+            "last_error": self.last_error,
+            "room_status": self.room_status,
+        }
+        stats.update(self._frameStats())
+        return stats
+
+    def stop(self):
+        self._closed = True  # 标志关闭
+        if self._statusPoll is not None:
+            self._statusPoll.cancel()
+        self._releaseResources()
+        if self._task is not None and not self._task.done():
+            if self._loop is not None and self._loop.is_running():
+                # 可能从其他线程调用
+                self._loop.call_soon_threadsafe(self._task.cancel)
+
+    async def _run(self):
+        """解析 -> 签名 -> 连接 -> 接收 -> 退避 -> ... 循环，直到关闭"""
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._closed:
+                self._stalled = errored = False
+                try:
+                    await self._connectOnce()
+                    print("[抖音WebSocket] 连接关闭")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    errored = True
+                    self.last_error = str(e)
+                    print("[抖音WebSocket] 错误:", e)
+                if self._closed:
+                    return  # 避免关闭后仍重连
+                cause = reconnect_cause(self.state, self._stalled, errored)
+                self.reconnect_causes[cause] = self.reconnect_causes.get(cause, 0) + 1
+                self.state = BACKOFF
+                try:
+                    await loop.run_in_executor(None, self.get_room_status)
+                except Exception as e:
+                    print("【X】获取直播间状态失败: ", e)
+                self.reconnects += 1
+                delay = self.backoff.next()
+                print(f"[抖音WebSocket] 正在尝试重连中...（{delay:.1f}秒后）")
+                await asyncio.sleep(delay)
+        finally:
+            self.state = ENDED
+
+    async def _connectOnce(self):
+        """
+        连接抖音直播间websocket服务器，请求直播间数据，直到连接断开
+        """
+        loop = asyncio.get_running_loop()
+        # 与线程模式共用全进程的并发连接上限（非阻塞轮询，取消时不会遗留占用）
+        while not reconnect_gate.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        try:
+            self.state = RESOLVING
+            self._onRoomResolved(await loop.run_in_executor(None, resolver.room_id, self.live_id))
+            self.state = SIGNING
+            wss = await loop.run_in_executor(None, self._buildWssUrl)
+            headers = await loop.run_in_executor(None, self._wsHeaders)
+            self.state = CONNECTING
+            ws = await connect(wss,
+                               additional_headers=headers,
+                               user_agent_header=None,
+                               ping_interval=None,
+                               max_size=None,
+                               compression=None)
+        finally:
+            reconnect_gate.release()
+
+        async with ws:
+            self.ws = ws
+            self.state = LIVE
+            self.backoff.reset()
+            self.lastFrameAt = time.monotonic()
+            print("【√】WebSocket连接成功.")
+            # 心跳与ack超时检查由全局调度器触发，回到事件循环执行
+            timers = [scheduler.call_every(config.HEARTBEAT_INTERVAL, lambda: self._onLoop(self._sendHeartbeat, ws),
+                                           first=0, name=f"hb-{self.live_id}")]
+            if config.ACK_TIMEOUT > 0:
+                timers.append(scheduler.call_every(config.ACK_TIMEOUT / 2,
+                                                   lambda: self._onLoop(self._checkAckDeadline, ws),
+                                                   name=f"ack-{self.live_id}"))
+            try:
+                async for message in ws:
+                    await self._onFrame(ws, message)
+            finally:
+                for timer in timers:
+                    timer.cancel()
+
+    def _onGiftTimer(self):
+        """回调只能在事件循环线程中调用"""
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(super()._onGiftTimer)
+
+    def _flushGifts(self):
+        """stop()可能从其他线程调用，回调只能在事件循环线程中调用"""
+        events = self.gifts.flush()
+        if not events:
+            return
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._deliverGifts(events)
+        else:
+            loop.call_soon_threadsafe(self._deliverGifts, events)
+
+    def _onLoop(self, coro_fn, ws):
+        """从调度线程把协程投递到事件循环"""
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(coro_fn(ws)))
+
+    async def _sendHeartbeat(self, ws):
+        try:
+            await ws.ping(HEARTBEAT_FRAME)
+        except Exception as e:
+            print("【X】心跳包发送失败: ", e)
+
+    async def _checkAckDeadline(self, ws):
+        """超过ACK_TIMEOUT没有收到任何推送，视为连接假死，主动断开重连"""
+        idle = time.monotonic() - self.lastFrameAt
+        if self.state == LIVE and idle > config.ACK_TIMEOUT:
+            print(f"⚠️ [抖音WebSocket] {idle:.0f}秒未收到推送，断开重连")
+            self._stalled = True
+            await ws.close()
+
+    def _pollRoomStatus(self):
+        if not self._closed:
+            self.room_status = self.get_room_status()
+
+    async def _onFrame(self, ws, message):
+        """
+        监听抖音弹幕client推送的弹幕消息
+        """
+        self.lastFrameAt = time.monotonic()
+        if isinstance(message, str):
+            return
+        if self.recorder is not None:
+            self.recorder.write(message)
+        # 帧率过高时解压与信封解析放到解码线程池，事件循环只负责ack与分发
+        if 0 < config.DECODE_OFFLOAD_RATE < self.frameRate.tick():
+            self.frameStats["frames_offloaded"] += 1
+            package, response = await asyncio.get_running_loop().run_in_executor(
+                decode_pool, self._decodeFrame, message)
+        else:
+            package, response = self._decodeFrame(message)
+        if response is None:
+            return
+
+        # 返回直播间服务器链接存活确认消息，便于持续获取数据
+        ack = self._buildAck(package, response)
+        if ack:
+            await ws.send(ack)
+
+        # 根据消息类别分发给已注册的处理器，聊天消息先收集，整帧统一批量补充redis信息后再推送
+        start = time.perf_counter()
+        for method, payload in response.messages:
+            if payload is None:
+                self.registry.skip(method)
+                continue
+            if self._chatBatch and method != 'WebcastChatMessage':
+                # 先推送之前的聊天消息，保证消息顺序
+                await self._emitChatBatchAsync(self._takeChatBatch())
+            self.registry.dispatch(method, payload)
+        await self._emitChatBatchAsync(self._takeChatBatch())
+        self._dispatchSeconds.observe(time.perf_counter() - start)
+
+    async def _emitChatBatchAsync(self, batch):
+        if not batch:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, enrich_chat_batch, batch)
+        self._deliverChatBatch(batch)
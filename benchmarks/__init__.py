@@ -0,0 +1,4 @@
+# 性能基准（项目根目录运行）：
+#   python -m benchmarks.bench_pipeline   全链路吞吐与分阶段延迟（合成流量 + 进程内redis替身）
+#   python -m benchmarks.bench_decode     按需解码器 vs betterproto
+#   python -m benchmarks.bench_encode     推送编码
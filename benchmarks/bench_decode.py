@@ -0,0 +1,98 @@
+# 按需解码器 vs betterproto 完整解码 性能对比
+# 用法（项目根目录）：python -m benchmarks.bench_decode [--number 500]
+import argparse
+import json
+import timeit
+
+from protobuf.douyin import (ChatMessage, ControlMessage, GiftMessage, GiftStruct, Image, LikeMessage,
+                             MemberMessage, Text, TextPiece)
+from protobuf.fast_decode import FAST_DECODERS
+from .traffic import make_common as _common, make_user as _user
+
+
+def build_samples():
+    """构造与线上体量相近的热点消息payload"""
+    uid = 98765432101
+    return {
+        "WebcastChatMessage": bytes(ChatMessage(
+            common=_common("WebcastChatMessage", 7392094459690748001), user=_user(uid),
+            content="扣1 L码 要两件",
+            rtf_content=Text(key="chat", default_patter="{0}",
+                             pieces_list=[TextPiece(type=True, string_value="扣1 L码 要两件")]))),
+        "WebcastGiftMessage": bytes(GiftMessage(
+            common=_common("WebcastGiftMessage", 7392094459690748002), user=_user(uid), gift_id=463,
+            repeat_count=3, combo_count=3, group_count=1, group_id=1721106114633, repeat_end=0,
+            gift=GiftStruct(id=463, name="玫瑰", diamond_count=1, combo=True,
+                            image=Image(url_list_list=["https://gift.png"] * 3)))),
+        "WebcastLikeMessage": bytes(LikeMessage(
+            common=_common("WebcastLikeMessage", 7392094459690748003), user=_user(uid), count=15, total=102400)),
+        "WebcastMemberMessage": bytes(MemberMessage(
+            common=_common("WebcastMemberMessage", 7392094459690748004), user=_user(uid), member_count=3120,
+            action=1)),
+        "WebcastControlMessage": bytes(ControlMessage(
+            common=_common("WebcastControlMessage", 7392094459690748005), status=3)),
+    }
+
+
+_FULL_CLASSES = {
+    "WebcastChatMessage": ChatMessage,
+    "WebcastGiftMessage": GiftMessage,
+    "WebcastLikeMessage": LikeMessage,
+    "WebcastMemberMessage": MemberMessage,
+    "WebcastControlMessage": ControlMessage,
+}
+
+
+# 按需解码器的解码次数为 --number 的倍数
+_FAST_FACTOR = 20
+
+
+def run(number):
+    results = {}
+    for method, payload in build_samples().items():
+        cls = _FULL_CLASSES[method]
+        decoder = FAST_DECODERS[method]
+        problems = decoder.validate_against_proto()
+        if problems:
+            raise SystemExit(f"{method} 字段与douyin.proto不一致: {problems}")
+
+        # 结果一致性校验
+        full = cls().parse(payload)
+        fast = decoder.decode(payload)
+        for out_name, path in decoder.fields.items():
+            value = full
+            for part in path.split("."):
+                value = getattr(value, part)
+            assert value == fast[out_name], (method, out_name, value, fast[out_name])
+
+        # betterproto完整解码每次约毫秒级，按需解码器便宜得多，多跑几倍次数让计时稳定
+        full_time = timeit.timeit(lambda: cls().parse(payload), number=number) / number
+        fast_number = number * _FAST_FACTOR
+        fast_time = timeit.timeit(lambda: decoder.decode(payload), number=fast_number) / fast_number
+        results[method] = {
+            "payload_bytes": len(payload),
+            "betterproto_us": full_time * 1e6,
+            "fast_us": fast_time * 1e6,
+            "speedup": full_time / fast_time,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按需解码器性能对比")
+    parser.add_argument("--number", type=int, default=500, help=f"每种消息betterproto解码次数（按需解码器为{_FAST_FACTOR}倍）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'method':<24}{'bytes':>8}{'betterproto(us)':>18}{'fast(us)':>12}{'speedup':>10}")
+    for method, r in results.items():
+        print(f"{method:<24}{r['payload_bytes']:>8}{r['betterproto_us']:>18.2f}{r['fast_us']:>12.2f}"
+              f"{r['speedup']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
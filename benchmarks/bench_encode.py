@@ -0,0 +1,86 @@
+# 推送编码性能对比：现有逐客户端JSON vs 一次编码共享（JSON文本 / MessagePack）
+# 用法（项目根目录）：python -m benchmarks.bench_encode [--number 20000] [--clients 50]
+import argparse
+import json
+import timeit
+import uuid
+
+from encoded_message import EncodedMessage, encode_batch, packb
+
+
+def build_sample():
+    """与 _parseChatMsg 输出一致的弹幕数据"""
+    return {
+        "msgId": str(uuid.uuid4()),
+        "dyMsgId": "7392094459690748001",
+        "danmuUserId": "98765432101",
+        "danmuUserName": "观众98765432101",
+        "danmuContent": "扣1 L码 要两件",
+        "dyRoomId": "7400000000000000000",
+        "orderNumber": "128",
+        "blackLevel": "0",
+        "createdUsers": "[]",
+    }
+
+
+def run(number, clients):
+    data = build_sample()
+
+    def legacy():
+        # 现状：每条消息json.dumps一次，每个客户端send_text时各自utf-8编码
+        text = json.dumps(data, ensure_ascii=False)
+        for _ in range(clients):
+            text.encode("utf-8")
+
+    def shared_json():
+        message = EncodedMessage.from_data(data)
+        for _ in range(clients):
+            message.json_bytes
+
+    def shared_msgpack():
+        # 与线上一致：from_data总会生成JSON文本，msgpack在此之上额外编码
+        message = EncodedMessage.from_data(data)
+        for _ in range(clients):
+            message.msgpack
+
+    results = {}
+    sample = EncodedMessage.from_data(data)
+    for name, fn, size in (("legacy_json", legacy, len(sample.json_bytes)),
+                           ("shared_json", shared_json, len(sample.json_bytes)),
+                           ("shared_msgpack", shared_msgpack, len(packb(data)))):
+        seconds = timeit.timeit(fn, number=number)
+        results[name] = {
+            "bytes_per_message": size,
+            "cpu_us_per_message": seconds / number * 1e6,
+        }
+
+    batch = [EncodedMessage.from_data(build_sample()) for _ in range(50)]
+    results["batch_50"] = {
+        "json_bytes": len(encode_batch(batch, "json").encode("utf-8")),
+        "msgpack_bytes": len(encode_batch(batch, "msgpack")),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推送编码性能对比")
+    parser.add_argument("--number", type=int, default=20000, help="编码消息条数")
+    parser.add_argument("--clients", type=int, default=50, help="同直播间客户端数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    results = run(args.number, args.clients)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"客户端数: {args.clients}")
+    print(f"{'encoder':<18}{'bytes/msg':>12}{'cpu us/msg':>14}")
+    for name in ("legacy_json", "shared_json", "shared_msgpack"):
+        r = results[name]
+        print(f"{name:<18}{r['bytes_per_message']:>12}{r['cpu_us_per_message']:>14.2f}")
+    print(f"50条批量帧: json {results['batch_50']['json_bytes']} bytes, "
+          f"msgpack {results['batch_50']['msgpack_bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
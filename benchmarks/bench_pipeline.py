@@ -0,0 +1,297 @@
+# 全链路吞吐基准：合成推送帧经 DouyinLiveWebFetcher._wsOnMessage（解压 -> 解码分发 -> redis补充信息 -> 序列化）
+# 回调 ConnectionManager.broadcast 推送给M个客户端；redis 经 use_client 换成进程内替身
+# 用法（项目根目录）：python -m benchmarks.bench_pipeline [--frames 2000] [--per-frame 20] [--clients 50]
+#                     [--mix chat=6,gift=1,like=2,member=1] [--keywords 1000] [--preload-orders]
+#                     [--output result.json] [--compare baseline.json]
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from blacklist_filter import OFF, blacklist_filter
+from enrich_cache import enrich_cache
+from keyword_matcher import keyword_matchers
+from liveMan import DouyinLiveWebFetcher
+from main import ConnectionManager
+from metrics import DISPATCH_SECONDS, FRAME_DECODE_SECONDS
+from order_preload import order_preloads
+from redis_helper import use_client
+from replayLiveMan import ReplaySocket
+from .fake_redis import FakeRedis
+from .traffic import DEFAULT_MIX, METHODS, TrafficGenerator, parse_mix
+
+LIVE_ID = "bench"
+# 解码线程池排队的帧数达到该值时暂停送帧
+MAX_OFFLOAD_DEPTH = 64
+
+
+class FakeWebSocket:
+    """只计数的前端websocket"""
+
+    def __init__(self):
+        self.received = 0
+        self.bytes = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.received += 1
+        self.bytes += len(text)
+
+    async def send_bytes(self, data):
+        self.received += 1
+        self.bytes += len(data)
+
+    async def close(self, code=1000):
+        pass
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(durations, messages):
+    total = sum(durations)
+    return {
+        "messages": messages,
+        "total_s": total,
+        "msgs_per_s": messages / total if total else 0.0,
+        "frame_mean_us": total / len(durations) * 1e6 if durations else 0.0,
+        "frame_p50_us": _percentile(durations, 0.50) * 1e6,
+        "frame_p99_us": _percentile(durations, 0.99) * 1e6,
+        "frame_max_us": max(durations, default=0.0) * 1e6,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def _feed(fetcher, frames, cold):
+    """在独立线程中逐帧调用 _wsOnMessage（与线上收包线程一致），返回每帧耗时"""
+    socket = ReplaySocket()
+    durations = []
+    for message in frames:
+        # 解码线程池跟不上时等待积压下降，避免排队过多被丢弃
+        while fetcher.connection_stats()["offload_depth"] >= MAX_OFFLOAD_DEPTH:
+            time.sleep(0.0005)
+        if cold:
+            enrich_cache.clear()
+        t0 = time.perf_counter()
+        fetcher._wsOnMessage(socket, message)
+        durations.append(time.perf_counter() - t0)
+    fetcher.wait_idle()
+    return durations, socket.acks
+
+
+def _histogram_summary(histogram, messages):
+    """按直方图累计耗时汇总（只有均值，没有分位数）"""
+    child = histogram.labels(LIVE_ID)
+    count = sum(child.counts)
+    return {
+        "messages": messages,
+        "total_s": child.sum,
+        "msgs_per_s": messages / child.sum if child.sum else 0.0,
+        "frame_mean_us": child.sum / count * 1e6 if count else 0.0,
+    }
+
+
+async def _run(frames, clients, decode_all, cold, encoding):
+    loop = asyncio.get_running_loop()
+    fetcher = DouyinLiveWebFetcher(LIVE_ID)
+    if decode_all:
+        # 礼物/点赞/进场也按需解码（默认只订阅聊天和直播间状态，其余类型不解码）
+        for method in METHODS.values():
+            if not fetcher.registry.subscribed(method):
+                fetcher.register_handler(method, lambda message: None, fast=True)
+
+    manager = ConnectionManager()
+    manager.fetchers[LIVE_ID] = fetcher  # 不启动真实抓取器
+    sockets = [FakeWebSocket() for _ in range(clients)]
+    for ws in sockets:
+        await manager.connect(ws, LIVE_ID, encoding=encoding)
+
+    broadcast = []
+    futures = []
+
+    async def _broadcast(message):
+        t0 = time.perf_counter()
+        await manager.broadcast(LIVE_ID, message)
+        broadcast.append(time.perf_counter() - t0)
+
+    # 与 ConnectionManager._startFetcher 相同的回调：抓取线程把消息交给事件循环广播
+    fetcher.callback = lambda message: futures.append(asyncio.run_coroutine_threadsafe(_broadcast(message), loop))
+    start = time.perf_counter()
+    durations, acks = await loop.run_in_executor(None, _feed, fetcher, frames, cold)
+    await asyncio.gather(*map(asyncio.wrap_future, futures))
+    produced = time.perf_counter() - start
+    # 等待所有客户端发送完
+    delivered = len(broadcast)
+    expected = delivered + 1  # 连接时的 "LIVING"
+    while any(ws.received < expected for ws in sockets):
+        if not any(channel.depth for channel in manager.active_connections[LIVE_ID].values()):
+            break  # 队列已空但数量不足（被丢弃）
+        await asyncio.sleep(0.001)
+    drained = time.perf_counter() - start
+
+    methods = fetcher.registry.stats()
+    total_messages = sum(m["received"] for m in methods.values())
+    decoded = sum(m["decoded"] for m in methods.values())
+    stages = {
+        "receive": _summary(durations, total_messages),
+        "decode": _histogram_summary(FRAME_DECODE_SECONDS, total_messages),
+        "dispatch": _histogram_summary(DISPATCH_SECONDS, decoded),
+        "broadcast": _summary(broadcast, delivered),
+    }
+    room = manager.stats()[LIVE_ID]
+    connection = fetcher.connection_stats()
+    for ws in list(manager.active_connections[LIVE_ID]):
+        await manager.remove(ws, LIVE_ID)  # 最后一个客户端断开时停止抓取器
+    return {
+        "stages": stages,
+        "pipeline": {
+            "frames": len(frames),
+            "messages": total_messages,
+            "chat_messages": delivered,
+            "acks": acks,
+            "frames_offloaded": connection["frames_offloaded"],
+            "frames_shed": connection["frames_shed"],
+            "produce_s": produced,
+            "msgs_per_s": total_messages / produced if produced else 0.0,
+            "drain_s": drained,
+            "deliveries": sum(ws.received for ws in sockets) - len(sockets),
+            "deliveries_per_s": (sum(ws.received for ws in sockets) - len(sockets)) / drained if drained else 0.0,
+            "dropped": room["dropped"],
+        },
+        "methods": methods,
+    }
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("基准测试准备超时")
+        time.sleep(0.001)
+
+
+def run(frames=2000, per_frame=20, clients=50, mix=None, users=5000, rtt=0.0, decode_all=False, cold=False,
+        encoding="json", seed=1, keywords=0, preload_orders=False):
+    generator = TrafficGenerator(mix or DEFAULT_MIX, users=users, seed=seed)
+    redis = FakeRedis(rtt=rtt)
+    generator.populate_redis(redis)
+    generator.populate_keywords(redis, keywords)
+    previous = use_client(redis)  # 用进程内替身代替真实redis
+    try:
+        enrich_cache.invalidation_live = True  # 模拟键空间通知可用：黑名单过滤器与编号预加载才会生效
+        enrich_cache.clear()
+        room_id = str(generator.room_id)
+        # 首条弹幕前加载完成关键词、黑名单过滤器与直播间编号
+        if keyword_matchers.get(room_id) is None and keywords:
+            _wait(lambda: room_id in keyword_matchers.stats()["rooms"])
+        if blacklist_filter.mode != OFF:
+            blacklist_filter.rebuild()
+        if preload_orders:
+            order_preloads.acquire(room_id)
+            _wait(lambda: order_preloads.stats()[room_id]["loaded"])
+        redis.calls.clear()
+
+        raw_frames = generator.frames(frames, per_frame)
+        result = asyncio.run(_run(raw_frames, clients, decode_all, cold, encoding))
+        result["redis"] = {"round_trips": redis.round_trips(), "calls": dict(redis.calls), "rtt_ms": rtt * 1000}
+        result["enrich_cache"] = enrich_cache.stats()
+        result["blacklist_filter"] = blacklist_filter.stats()
+        result["order_preload"] = order_preloads.stats()
+        if preload_orders:
+            order_preloads.release(room_id)
+    finally:
+        use_client(previous)
+    result["meta"] = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            "frames": frames, "per_frame": per_frame, "clients": clients, "mix": mix or DEFAULT_MIX,
+            "users": users, "rtt_ms": rtt * 1000, "decode_all": decode_all, "cold": cold,
+            "encoding": encoding, "seed": seed, "keywords": keywords, "preload_orders": preload_orders,
+            "frame_bytes_avg": sum(map(len, raw_frames)) / len(raw_frames) if raw_frames else 0,
+        },
+        "generated": generator.counts,
+    }
+    return result
+
+
+def compare(result, baseline):
+    """与基线结果对比各阶段吞吐，返回 {阶段: 当前/基线}"""
+    ratios = {}
+    for stage, current in result["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {}).get("msgs_per_s")
+        if old:
+            ratios[stage] = current["msgs_per_s"] / old
+    old = baseline.get("pipeline", {}).get("msgs_per_s")
+    if old:
+        ratios["pipeline"] = result["pipeline"]["msgs_per_s"] / old
+    return ratios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全链路吞吐基准")
+    parser.add_argument("--frames", type=int, default=2000, help="推送帧数")
+    parser.add_argument("--per-frame", type=int, default=20, help="每帧消息数")
+    parser.add_argument("--clients", type=int, default=50, help="前端客户端数")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="消息比例，如 chat=6,gift=1,like=2,member=1")
+    parser.add_argument("--users", type=int, default=5000, help="用户池大小")
+    parser.add_argument("--redis-rtt-ms", type=float, default=0.0, help="模拟redis往返延迟（毫秒）")
+    parser.add_argument("--decode-all", action="store_true", help="礼物/点赞/进场也解码")
+    parser.add_argument("--cold", action="store_true", help="每帧清空补充信息缓存")
+    parser.add_argument("--encoding", default="json", choices=("json", "msgpack"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keywords", type=int, default=0, help="直播间关键词数量")
+    parser.add_argument("--preload-orders", action="store_true", help="预加载直播间编号（不再查询orderUser）")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--compare", help="与基线JSON文件对比")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    result = run(frames=args.frames, per_frame=args.per_frame, clients=args.clients, mix=args.mix,
+                 users=args.users, rtt=args.redis_rtt_ms / 1000, decode_all=args.decode_all, cold=args.cold,
+                 encoding=args.encoding, seed=args.seed, keywords=args.keywords, preload_orders=args.preload_orders)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf8") as f:
+            result["compare"] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'stage':<12}{'msgs/s':>14}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+    for stage, s in result["stages"].items():
+        # decode / dispatch 来自抓取器的延迟直方图，没有分位数
+        p50, p99 = (f"{s[key]:>12.1f}" if key in s else f"{'-':>12}" for key in ("frame_p50_us", "frame_p99_us"))
+        print(f"{stage:<12}{s['msgs_per_s']:>14.0f}{s['frame_mean_us']:>12.1f}{p50}{p99}")
+    p = result["pipeline"]
+    print(f"全链路: {p['messages']}条消息 {p['msgs_per_s']:.0f}条/秒，"
+          f"推送{p['deliveries']}次 {p['deliveries_per_s']:.0f}次/秒，丢弃{p['dropped']}，"
+          f"线程池处理{p['frames_offloaded']}帧（丢弃{p['frames_shed']}帧）")
+    print(f"redis往返: {result['redis']['round_trips']}")
+    for stage, ratio in result.get("compare", {}).items():
+        print(f"对比基线 {stage:<12}{ratio:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# 进程内redis替身：只实现本项目用到的命令，可模拟网络往返延迟，并统计调用次数
+import fnmatch
+import time
+
+
+class FakeRedis:
+    """
+    行为与 redis.StrictRedis(decode_responses=True) 一致的最小实现
+    :param rtt: 每次命令的模拟往返时间（秒）
+    """
+
+    def __init__(self, rtt=0.0):
+        self.rtt = rtt
+        self.data = {}
+        self.calls = {}
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+
+    def ping(self):
+        self._call("ping")
+        return True
+
+    def get(self, key):
+        self._call("get")
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self._call("set")
+        self.data[key] = value if isinstance(value, str) else str(value)
+        return True
+
+    def delete(self, *keys):
+        self._call("delete")
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def mget(self, keys, *args):
+        self._call("mget")
+        if isinstance(keys, str):
+            keys = [keys, *args]
+        return [self.data.get(key) for key in keys]
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        self._call("hset")
+        fields = self.data.setdefault(name, {})
+        if key is not None:
+            fields[key] = value
+        fields.update(mapping or {})
+        return len(mapping or {}) + (key is not None)
+
+    def hgetall(self, name):
+        self._call("hgetall")
+        value = self.data.get(name)
+        return dict(value) if isinstance(value, dict) else {}
+
+    def keys(self, pattern="*"):
+        self._call("keys")
+        return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+    def scan(self, cursor=0, match=None, count=None):
+        """cursor为已遍历的key数量，每次返回最多count个匹配的key"""
+        self._call("scan")
+        keys = list(self.data)
+        count = count or 10
+        end = min(cursor + count, len(keys))
+        batch = keys[cursor:end]
+        if match:
+            batch = [key for key in batch if fnmatch.fnmatchcase(key, match)]
+        return (0 if end >= len(keys) else end), batch
+
+    def scan_iter(self, match=None, count=None):
+        cursor = 0
+        while True:
+            cursor, batch = self.scan(cursor, match=match, count=count)
+            yield from batch
+            if cursor == 0:
+                return
+
+    def round_trips(self):
+        return sum(self.calls.values())
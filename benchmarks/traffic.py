@@ -0,0 +1,220 @@
+# 合成直播间推送流量：按配置的消息类型比例构造gzip压缩的PushFrame / Response
+import gzip
+import json
+import random
+
+from protobuf.douyin import (ChatMessage, Common, FansClub, FansClubData, GiftMessage, GiftStruct, HeadersList,
+                             Image, LikeMessage, MemberMessage, Message, PayGrade, PushFrame, Response, Text,
+                             TextPiece, User)
+
+ROOM_ID = 7400000000000000000
+
+# 默认消息类型比例
+DEFAULT_MIX = {"chat": 0.6, "gift": 0.1, "like": 0.2, "member": 0.1}
+
+METHODS = {
+    "chat": "WebcastChatMessage",
+    "gift": "WebcastGiftMessage",
+    "like": "WebcastLikeMessage",
+    "member": "WebcastMemberMessage",
+}
+
+_CONTENTS = ["扣1 L码 要两件", "主播好", "多少钱", "666", "这个颜色还有吗", "已拍", "上链接", "求讲解"]
+_GIFTS = [(463, "玫瑰", 1), (3389, "小心心", 1), (685, "粉丝团灯牌", 1), (3771, "鲜花", 10), (4213, "嘉年华", 30000)]
+
+
+def make_user(uid):
+    avatar = Image(url_list_list=[f"https://p3.douyinpic.com/aweme/100x100/{uid}.jpeg"] * 3, uri=f"{uid}")
+    return User(id=uid, short_id=uid // 7, nick_name=f"观众{uid}", gender=1, level=12,
+                avatar_thumb=avatar, avatar_medium=avatar,
+                pay_grade=PayGrade(level=23, name="荣耀等级", icon=avatar, new_im_icon_with_level=avatar),
+                fans_club=FansClub(data=FansClubData(club_name="粉丝团", level=8)),
+                badge_image_list=[avatar, avatar], display_id=f"dy{uid}", sec_uid="MS4wLjABAAAA" + "x" * 40,
+                id_str=str(uid))
+
+
+def make_common(method, msg_id, room_id=ROOM_ID):
+    return Common(method=method, msg_id=msg_id, room_id=room_id, create_time=1721106114633,
+                  is_show_msg=True, describe="", log_id="20240716" + "0" * 20)
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _num(cls, name):
+    return cls()._betterproto.meta_by_field_name[name].number
+
+
+def length_field(number, data):
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def varint_field(number, value):
+    return _varint(number << 3) + _varint(int(value)) if value else b""
+
+
+class _Encoder:
+    """
+    手工拼接热点消息的wire格式（字段编号取自douyin.py），
+    betterproto序列化大量默认字段很慢，生成上万条消息时不可用；不变的子消息（User/GiftStruct/Text）按值缓存
+    """
+
+    def __init__(self, cls, *names):
+        self.fields = {name: _num(cls, name) for name in names}
+
+    def __call__(self, **values):
+        parts = []
+        for name, value in values.items():
+            number = self.fields[name]
+            if isinstance(value, bytes):
+                parts.append(length_field(number, value))
+            elif isinstance(value, str):
+                parts.append(length_field(number, value.encode("utf-8")))
+            else:
+                parts.append(varint_field(number, value))
+        return b"".join(parts)
+
+
+_USER = _Encoder(User, "id", "short_id", "nick_name", "display_id", "id_str")
+_COMMON = _Encoder(Common, "method", "msg_id", "room_id", "create_time", "is_show_msg", "log_id")
+_CHAT = _Encoder(ChatMessage, "common", "user", "content", "rtf_content")
+_GIFT = _Encoder(GiftMessage, "common", "user", "gift_id", "repeat_count", "combo_count", "group_count",
+                 "group_id", "repeat_end", "gift")
+_LIKE = _Encoder(LikeMessage, "common", "user", "count", "total")
+_MEMBER = _Encoder(MemberMessage, "common", "user", "member_count", "action")
+_MESSAGE = _Encoder(Message, "method", "payload", "msg_id")
+_RESPONSE = _Encoder(Response, "cursor", "internal_ext", "need_ack")
+_MESSAGES_FIELD = _num(Response, "messages_list")
+
+
+def parse_mix(text):
+    """解析 "chat=6,gift=1,like=2,member=1" 形式的比例"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in METHODS:
+            raise ValueError(f"未知的消息类型: {kind}，可选 {', '.join(METHODS)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+class TrafficGenerator:
+    """
+    按比例随机生成聊天/礼物/点赞/进场消息，用户从固定大小的用户池中抽取（便于命中redis与缓存）
+    相同seed生成相同的流量
+    """
+
+    def __init__(self, mix=None, users=5000, room_id=ROOM_ID, seed=1):
+        mix = mix or DEFAULT_MIX
+        self.kinds = [k for k, w in mix.items() if w > 0]
+        self.weights = [mix[k] for k in self.kinds]
+        self.user_ids = [98765432101 + i * 7919 for i in range(users)]
+        self.room_id = room_id
+        self.random = random.Random(seed)
+        self._msg_id = 7392094459690748000
+        self._users = {}
+        self._parts = {}
+        # 头像、等级、粉丝团等不随用户变化的部分只序列化一次
+        avatar = Image(url_list_list=["https://p3.douyinpic.com/aweme/100x100/default.jpeg"] * 3, uri="default")
+        self._userTemplate = bytes(User(
+            gender=1, level=12, avatar_thumb=avatar, avatar_medium=avatar,
+            pay_grade=PayGrade(level=23, name="荣耀等级", icon=avatar, new_im_icon_with_level=avatar),
+            fans_club=FansClub(data=FansClubData(club_name="粉丝团", level=8)),
+            badge_image_list=[avatar, avatar], sec_uid="MS4wLjABAAAA" + "x" * 40))
+        self.counts = {k: 0 for k in self.kinds}
+
+    def _user(self, uid):
+        user = self._users.get(uid)
+        if user is None:
+            user = self._users[uid] = self._userTemplate + _USER(
+                id=uid, short_id=uid // 7, nick_name=f"观众{uid}", display_id=f"dy{uid}", id_str=str(uid))
+        return user
+
+    def _cached(self, key, build):
+        value = self._parts.get(key)
+        if value is None:
+            value = self._parts[key] = bytes(build())
+        return value
+
+    def payload(self, kind):
+        self._msg_id += 1
+        method = METHODS[kind]
+        common = _COMMON(method=method, msg_id=self._msg_id, room_id=self.room_id, create_time=1721106114633,
+                         is_show_msg=True, log_id="20240716" + "0" * 20)
+        user = self._user(self.random.choice(self.user_ids))
+        if kind == "chat":
+            content = self.random.choice(_CONTENTS)
+            rtf = self._cached(("text", content), lambda: Text(
+                key="chat", default_patter="{0}", pieces_list=[TextPiece(type=True, string_value=content)]))
+            payload = _CHAT(common=common, user=user, content=content, rtf_content=rtf)
+        elif kind == "gift":
+            gift_id, name, diamonds = self.random.choice(_GIFTS)
+            gift = self._cached(("gift", gift_id), lambda: GiftStruct(
+                id=gift_id, name=name, diamond_count=diamonds, combo=True,
+                image=Image(url_list_list=["https://gift.png"] * 3)))
+            repeat = self.random.randint(1, 10)
+            payload = _GIFT(common=common, user=user, gift_id=gift_id, repeat_count=repeat, combo_count=repeat,
+                            group_count=1, group_id=self._msg_id // 10,
+                            repeat_end=int(self.random.random() < 0.2), gift=gift)
+        elif kind == "like":
+            payload = _LIKE(common=common, user=user, count=self.random.randint(1, 20),
+                            total=self._msg_id % 1000000)
+        else:
+            payload = _MEMBER(common=common, user=user, member_count=self.random.randint(1000, 5000), action=1)
+        return method, payload
+
+    def message(self):
+        """一条Response.messages_list中的Message（已编码）"""
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        self.counts[kind] += 1
+        method, payload = self.payload(kind)
+        return _MESSAGE(method=method, payload=payload, msg_id=self._msg_id)
+
+    def response(self, size):
+        """一个Response（未压缩），包含size条消息"""
+        messages = b"".join(length_field(_MESSAGES_FIELD, self.message()) for _ in range(size))
+        return messages + _RESPONSE(cursor=f"t-{self._msg_id}", internal_ext=f"internal_src:dim|seq:{self._msg_id}",
+                                    need_ack=True)
+
+    def frame(self, size):
+        """一帧与线上一致的PushFrame（payload为gzip压缩的Response）"""
+        return bytes(PushFrame(log_id=self._msg_id, payload_type="msg", payload_encoding="pb",
+                               headers_list=[HeadersList(key="compress_type", value="gzip")],
+                               payload=gzip.compress(self.response(size))))
+
+    def frames(self, count, size):
+        return [self.frame(size) for _ in range(count)]
+
+    def populate_keywords(self, client, count):
+        """为直播间写入count个关键词（包含会命中的常见词，其余为商品编码），返回写入数量"""
+        keywords = {"扣1": "order", "L码": "size", "多少钱": "price", "上链接": "link"}
+        for i in range(max(0, count - len(keywords))):
+            keywords[f"SKU{i:06d}"] = f"sku{i}"
+        keywords = dict(list(keywords.items())[:count])
+        if keywords:
+            client.hset(f"keyword:dy_room_id:{self.room_id}", mapping=keywords)
+        return len(keywords)
+
+    def populate_redis(self, client, order_ratio=0.3, black_ratio=0.05):
+        """为用户池写入orderUser / black数据，返回写入的key数量"""
+        written = 0
+        for uid in self.user_ids:
+            if self.random.random() < order_ratio:
+                client.set(f"orderUser:dy_room_id_user:{self.room_id}:{uid}", json.dumps({
+                    "id": str(uid), "orderNameId": "1", "orderNumber": str(written + 1), "orderAmounts": "99",
+                }))
+                written += 1
+            if self.random.random() < black_ratio:
+                client.set(f"black:{uid}", json.dumps({
+                    "orderNameId": "1", "blackLevel": self.random.randint(1, 3),
+                    "createdUsers": ["java.util.ArrayList", ["admin"]],
+                }))
+                written += 1
+        return written
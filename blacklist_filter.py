@@ -0,0 +1,245 @@
+# blacklist_filter.py
+"""
+黑名单成员过滤：绝大多数弹幕用户不在黑名单中，先在进程内判断，只有可能在黑名单中的用户才查询 black:{user_id}
+- bloom：布隆过滤器，内存固定（容量与误判率可配置），误判只会多一次redis查询
+- set：整数集合，没有误判，内存随黑名单人数增长
+启动时 SCAN black:* 构建，之后通过redis键空间通知增量添加。
+只有键空间通知可用、且构建后没有重新订阅过（没有漏掉通知）时才使用过滤器；否则全部查询redis，
+新增的黑名单与补充信息缓存一样在短TTL内生效，不会因过滤器过期而漏查。
+被移出黑名单的用户在下一次定时重建前仍会被判定为可能存在（仍查询redis，结果正确）
+"""
+import hashlib
+import math
+import threading
+import time
+
+import config
+from enrich_cache import enrich_cache, invalidator
+from redis_helper import redis_client
+from room_analytics import hash64
+from scheduler import scheduler
+
+BLOOM = "bloom"
+INT_SET = "set"
+OFF = "off"
+
+BLACK_PREFIX = "black:"
+
+
+def user_int(user_id):
+    """用户id转为整数（抖音用户id均为数字，其他形式取稳定哈希）"""
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return int.from_bytes(hashlib.blake2b(str(user_id).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class BloomFilter:
+    """
+    :param capacity: 预计元素数量
+    :param fp_rate: 元素数量不超过capacity时的误判率
+    """
+
+    def __init__(self, capacity, fp_rate):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.bits = max(8, math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, value):
+        # 双重哈希生成k个位置
+        h1 = hash64(value)
+        h2 = hash64(value ^ 0x9E3779B97F4A7C15) | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, value):
+        array = self._array
+        for i in self._indexes(value):
+            array[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        array = self._array
+        for i in self._indexes(value):
+            if not array[i >> 3] & (1 << (i & 7)):
+                return False
+        return True
+
+    @property
+    def memory(self):
+        return len(self._array)
+
+    def estimated_fp_rate(self):
+        """按已添加数量估算的当前误判率"""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class IntSet:
+    """没有误判的整数集合，接口与BloomFilter一致"""
+
+    def __init__(self):
+        self._items = set()
+
+    def add(self, value):
+        self._items.add(value)
+
+    def __contains__(self, value):
+        return value in self._items
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    @property
+    def memory(self):
+        # set本身 + 每个int对象（约32字节）
+        return self._items.__sizeof__() + 32 * len(self._items)
+
+    def estimated_fp_rate(self):
+        return 0.0
+
+
+class BlacklistFilter:
+    """
+    进程级黑名单成员过滤（单例 blacklist_filter），构建完成前might_contain总是返回True（全部查询redis）
+    :param mode: bloom / set / off
+    :param capacity: 布隆过滤器最小容量，重建时至少为黑名单人数的2倍
+    :param rebuild_interval: 定时重建间隔（秒），清除已移出黑名单的用户
+    :param fallback_interval: 检查通知是否恢复/重新订阅的间隔（秒），期间过滤器不使用，全部查询redis
+    """
+
+    def __init__(self, mode=BLOOM, capacity=100000, fp_rate=0.001, rebuild_interval=600.0, fallback_interval=60.0,
+                 scan_count=1000):
+        if mode not in (BLOOM, INT_SET, OFF):
+            raise ValueError(f"未知的黑名单过滤模式: {mode}")
+        self.mode = mode
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.rebuild_interval = rebuild_interval
+        self.fallback_interval = fallback_interval
+        self.scan_count = scan_count
+        self._filter = None  # 构建完成前为None
+        self._lock = threading.Lock()
+        self._building = None  # 重建期间收到的新增用户，构建完成后补加
+        self._timer = None
+        self._subscriptions = 0  # 上次构建时失效订阅的次数
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.last_build = None
+        self.errors = 0
+        self.lookups = 0
+        self.skipped = 0  # 判定不在黑名单、省去的redis查询
+        self.false_positives = 0  # 判定可能存在但redis中没有
+
+    @property
+    def ready(self):
+        return self._filter is not None
+
+    @property
+    def usable(self):
+        """键空间通知可用且构建后没有重新订阅（新增黑名单都已通过通知加入过滤器）"""
+        return enrich_cache.invalidation_live and invalidator.subscriptions == self._subscriptions
+
+    def start(self):
+        """后台首次构建，之后定时重建；键空间通知可用时新增黑名单实时生效"""
+        if self.mode == OFF or self._timer is not None:
+            return
+        invalidator.add_listener(self._onKeyChanged)
+        self._timer = scheduler.call_every(min(self.rebuild_interval, self.fallback_interval), self._periodic,
+                                           first=0, blocking=True, name="blacklist")
+
+    def might_contain(self, user_id):
+        current = self._filter
+        if current is None or not self.usable:
+            return True
+        self.lookups += 1
+        if user_int(user_id) in current:
+            return True
+        self.skipped += 1
+        return False
+
+    def record_false_positive(self):
+        self.false_positives += 1
+
+    def add(self, user_id):
+        value = user_int(user_id)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(value)
+            if self._building is not None:
+                self._building.append(value)
+
+    def _periodic(self):
+        # 通知不可用时过滤器不使用，不必SCAN；重新订阅过（可能漏掉通知）时尽快重建，否则按间隔清理已移出的用户
+        if not enrich_cache.invalidation_live:
+            return
+        if (self.last_build is None or invalidator.subscriptions != self._subscriptions
+                or time.monotonic() - self.last_build >= self.rebuild_interval * 0.9):
+            self.rebuild()
+
+    def rebuild(self):
+        """SCAN black:* 构建新的过滤器并整体替换"""
+        start = time.perf_counter()
+        subscriptions = invalidator.subscriptions
+        with self._lock:
+            self._building = []
+        try:
+            users = [user_int(key[len(BLACK_PREFIX):])
+                     for key in redis_client.scan_iter(match=BLACK_PREFIX + "*", count=self.scan_count)]
+        except Exception as e:
+            self.errors += 1
+            with self._lock:
+                self._building = None
+            print(f"❌ 黑名单过滤器构建失败: {e}")
+            return
+        if self.mode == BLOOM:
+            new = BloomFilter(max(self.capacity, 2 * len(users)), self.fp_rate)
+        else:
+            new = IntSet()
+        for value in users:
+            new.add(value)
+        with self._lock:
+            for value in self._building:
+                new.add(value)
+            self._building = None
+            self._filter = new
+        self._subscriptions = subscriptions
+        self.builds += 1
+        self.last_build = time.monotonic()
+        self.build_seconds = time.perf_counter() - start
+        print(f"✅ 黑名单过滤器已构建：{len(users)}人，{new.memory / 1024:.0f}KB，{self.build_seconds:.2f}秒")
+
+    def _onKeyChanged(self, key, event):
+        if key.startswith(BLACK_PREFIX) and event in ("set", "publish"):
+            self.add(key[len(BLACK_PREFIX):])
+
+    def stats(self):
+        current = self._filter
+        return {
+            "mode": self.mode,
+            "ready": current is not None,
+            "usable": self.usable,
+            "entries": current.count if current is not None else 0,
+            "capacity": getattr(current, "capacity", None),
+            "hashes": getattr(current, "hashes", None),
+            "memory_bytes": current.memory if current is not None else 0,
+            "fp_rate_target": self.fp_rate if self.mode == BLOOM else 0.0,
+            "fp_rate_estimated": current.estimated_fp_rate() if current is not None else None,
+            "fp_rate_observed": self.false_positives / self.lookups if self.lookups else 0.0,
+            "lookups": self.lookups,
+            "skipped": self.skipped,
+            "false_positives": self.false_positives,
+            "builds": self.builds,
+            "build_seconds": self.build_seconds,
+            "errors": self.errors,
+        }
+
+
+# 全局黑名单过滤器（单例）
+blacklist_filter = BlacklistFilter(config.BLACKLIST_FILTER, config.BLACKLIST_CAPACITY, config.BLACKLIST_FP_RATE,
+                                   config.BLACKLIST_REBUILD_INTERVAL, config.BLACKLIST_FALLBACK_INTERVAL,
+                                   config.BLACKLIST_SCAN_COUNT)
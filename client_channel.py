@@ -0,0 +1,138 @@
+# client_channel.py
+import asyncio
+from collections import deque
+
+from fastapi import WebSocket
+
+from encoded_message import ENCODING_JSON, ENCODING_MSGPACK, ENCODINGS, EncodedMessage, encode_batch
+
+# 队列满时的处理策略
+DROP_OLDEST = "drop_oldest"  # 丢弃最旧的消息
+DROP_NEWEST = "drop_newest"  # 丢弃新消息
+DISCONNECT = "disconnect"  # 断开慢客户端
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+
+class ClientChannel:
+    """
+    前端客户端的有界发送队列 + 独立发送协程
+    广播只负责入队，慢客户端不会拖慢同直播间的其他客户端
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue=1000, policy=DROP_OLDEST, on_failed=None,
+                 encoding=ENCODING_JSON, analytics=False):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的队列溢出策略: {policy}")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"未知的编码: {encoding}")
+        self.websocket = websocket
+        self.encoding = encoding
+        self.analytics = analytics  # 是否接收直播间统计汇总帧
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_failed = on_failed  # 发送失败/被判定为慢客户端时回调 on_failed(channel)
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._sender())
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def enqueue(self, message: EncodedMessage) -> bool:
+        """
+        消息入队，不等待发送
+        :return: False 表示按DISCONNECT策略需要断开该客户端（只返回一次，之后视为已关闭）
+        """
+        if self.closed:
+            return True
+        if len(self._queue) >= self.max_queue:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return True
+            if self.policy == DISCONNECT:
+                self.dropped += 1
+                self.closed = True  # 断开由调用方安排，之后的消息直接忽略
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(message)
+        self._wakeup.set()
+        return True
+
+    async def _sender(self):
+        try:
+            await self._drain()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"❌ 发送失败: {str(e)[:200]}")  # 截断长错误信息
+            self.closed = True
+            if self.on_failed:
+                await self.on_failed(self)
+
+    async def _drain(self):
+        while not self.closed:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            message = self._queue.popleft()
+            await self._send(message.encoded(self.encoding))
+            self.sent += 1
+
+    async def _send(self, frame):
+        """frame为str时发送文本帧，bytes时发送二进制帧"""
+        if self.encoding == ENCODING_MSGPACK:
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(frame)
+
+    def close(self):
+        self.closed = True
+        self._queue.clear()
+        if not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def stats(self):
+        return {"depth": self.depth, "sent": self.sent, "dropped": self.dropped}
+
+
+class BatchingClientChannel(ClientChannel):
+    """
+    批量推送：窗口期内（或攒满batch_max条）的消息合并为一个数组帧（JSON数组 / MessagePack数组）发送
+    仅对连接时声明batch的客户端启用
+    """
+
+    def __init__(self, websocket: WebSocket, batch_window=0.05, batch_max=100, **kwargs):
+        self.batch_window = batch_window
+        self.batch_max = max(1, batch_max)
+        super().__init__(websocket, **kwargs)
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # 第一条消息到达后开始计时，窗口结束或攒满后一次发出
+            deadline = loop.time() + self.batch_window
+            while len(self._queue) < self.batch_max and not self.closed:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            count = min(len(self._queue), self.batch_max)
+            if not count:
+                continue
+            batch = [self._queue.popleft() for _ in range(count)]
+            await self._send(encode_batch(batch, self.encoding))
+            self.sent += count
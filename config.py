@@ -0,0 +1,154 @@
+# config.py
+import os
+
+# 全局配置，均可通过同名环境变量覆盖
+
+# ---- 签名服务 ----
+# 预先加载sign.js的V8上下文数量（所有直播间共享）
+SIGN_POOL_SIZE = int(os.getenv("SIGN_POOL_SIZE", "2"))
+# 签名结果缓存条数上限
+SIGN_CACHE_SIZE = int(os.getenv("SIGN_CACHE_SIZE", "1024"))
+# 签名结果缓存有效期（秒）
+SIGN_CACHE_TTL = float(os.getenv("SIGN_CACHE_TTL", "600"))
+
+# ---- 弹幕补充信息缓存 ----
+# 缓存条数上限
+ENRICH_CACHE_SIZE = int(os.getenv("ENRICH_CACHE_SIZE", "100000"))
+# 失效通知可用时的缓存有效期（秒）
+ENRICH_CACHE_TTL = float(os.getenv("ENRICH_CACHE_TTL", "300"))
+# 失效通知不可用时的缓存有效期（秒）
+ENRICH_CACHE_FALLBACK_TTL = float(os.getenv("ENRICH_CACHE_FALLBACK_TTL", "1"))
+# 业务方主动失效缓存的pub/sub频道，消息内容为redis key
+ENRICH_INVALIDATE_CHANNEL = os.getenv("ENRICH_INVALIDATE_CHANNEL", "enrich:invalidate")
+# 键空间通知未开启时是否执行 CONFIG SET notify-keyspace-events 开启（修改的是整个redis实例的配置，默认不修改）
+ENRICH_NOTIFY_CONFIG_SET = os.getenv("ENRICH_NOTIFY_CONFIG_SET", "0").lower() in ("1", "true", "yes")
+
+# ---- 抓取器 ----
+# thread: 每个直播间一个websocket线程；async: 所有直播间运行在服务的事件循环上；
+# process: 直播间按一致性哈希分配到多个抓取进程；replay: 回放录制的原始推送帧（离线压测/回归）
+FETCHER_MODE = os.getenv("FETCHER_MODE", "thread")
+# process模式的抓取进程数
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 2)))
+# process模式主进程与抓取进程通信的Unix socket路径
+WORKER_SOCKET = os.getenv("WORKER_SOCKET", "/tmp/douyin-room-workers.sock")
+# 抓取进程上报直播间统计的间隔（秒）
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "5"))
+# 抓取进程待发往主进程的消息上限，主进程读取跟不上时丢弃新消息（不阻塞收包线程）
+WORKER_OUTBOX_SIZE = int(os.getenv("WORKER_OUTBOX_SIZE", "50000"))
+
+# ---- 录制与回放 ----
+# 录制原始推送帧的目录，为空则不录制
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+# 单个录制文件大小上限（字节），超过后滚动到新文件
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", str(256 * 1024 * 1024)))
+# 每个直播间最多保留的录制文件数，0为不限制
+RECORD_MAX_FILES = int(os.getenv("RECORD_MAX_FILES", "0"))
+# replay模式读取录制文件的目录
+REPLAY_DIR = os.getenv("REPLAY_DIR", "recordings")
+# replay模式回放速度：1原速，N为N倍速，0为最快速度
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))
+# replay模式补充信息使用的redis：fake 进程内空redis（不访问网络，结果可重复），live 线上redis
+REPLAY_REDIS = os.getenv("REPLAY_REDIS", "fake")
+
+# ---- 推送帧解码 ----
+# 单个直播间每秒帧数超过该值时，解码与分发交给线程池执行（ack仍在收包线程立即发送），0为不启用
+DECODE_OFFLOAD_RATE = float(os.getenv("DECODE_OFFLOAD_RATE", "50"))
+# 解码线程池大小（所有直播间共享）
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "4"))
+# 单个直播间排队等待解码的帧数上限，超出时丢弃最早的帧，0为不限
+DECODE_MAX_DEPTH = int(os.getenv("DECODE_MAX_DEPTH", "1000"))
+
+# ---- 前端推送 ----
+# 每个前端客户端的发送队列长度上限
+CLIENT_QUEUE_SIZE = int(os.getenv("CLIENT_QUEUE_SIZE", "1000"))
+# 队列满时的处理策略：drop_oldest / drop_newest / disconnect
+CLIENT_OVERFLOW_POLICY = os.getenv("CLIENT_OVERFLOW_POLICY", "drop_oldest")
+# 批量协议默认窗口（毫秒）与每帧最多消息数，客户端可在连接参数中覆盖
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "50"))
+BATCH_MAX = int(os.getenv("BATCH_MAX", "100"))
+
+# ---- 最近消息回放 ----
+# 每个直播间缓存最近多少条已推送消息，新客户端连接时补发，0为不缓存
+BACKLOG_SIZE = int(os.getenv("BACKLOG_SIZE", "200"))
+# 只补发最近多少秒内的消息，0为不按时间淘汰
+BACKLOG_SECONDS = float(os.getenv("BACKLOG_SECONDS", "300"))
+# 直播间最后一个客户端断开后缓存保留多久（秒），期间重连的客户端可续传
+BACKLOG_RETAIN = float(os.getenv("BACKLOG_RETAIN", "120"))
+
+# ---- 直播间统计 ----
+# 消息速率与近期发言人数的滑动窗口（秒）
+ANALYTICS_WINDOW = float(os.getenv("ANALYTICS_WINDOW", "300"))
+# 统计的活跃用户数
+ANALYTICS_TOP_K = int(os.getenv("ANALYTICS_TOP_K", "10"))
+# 向订阅了统计的前端客户端推送汇总帧的间隔（秒），0为不推送
+ANALYTICS_INTERVAL = float(os.getenv("ANALYTICS_INTERVAL", "10"))
+
+# ---- 礼物 ----
+# 是否解码并推送礼物消息（连击合并后推送）
+GIFT_EVENTS = os.getenv("GIFT_EVENTS", "1").lower() in ("1", "true", "yes")
+# 连击超过该时间（秒）没有新消息视为结束并推送
+GIFT_COMBO_TIMEOUT = float(os.getenv("GIFT_COMBO_TIMEOUT", "3"))
+# 每个直播间同时合并中的连击数上限
+GIFT_COMBO_MAX_PENDING = int(os.getenv("GIFT_COMBO_MAX_PENDING", "1000"))
+# 送礼榜人数
+GIFT_TOP_K = int(os.getenv("GIFT_TOP_K", "10"))
+
+# ---- 弹幕关键词 ----
+# 是否按直播间关键词（redis hash keyword:dy_room_id:{room_id}）给弹幕打标签
+KEYWORD_MATCH = os.getenv("KEYWORD_MATCH", "1").lower() in ("1", "true", "yes")
+# 关键词定时刷新间隔（秒），键空间通知可用时变更会立即生效
+KEYWORD_REFRESH_INTERVAL = float(os.getenv("KEYWORD_REFRESH_INTERVAL", "60"))
+# 直播间超过该时间（秒）没有弹幕则释放其关键词自动机
+KEYWORD_IDLE_TTL = float(os.getenv("KEYWORD_IDLE_TTL", "600"))
+
+# ---- 黑名单过滤 ----
+# 进程内黑名单成员判断，只为可能在黑名单中的用户查询 black:{user_id}：bloom（布隆过滤器）/ set（整数集合）/ off
+BLACKLIST_FILTER = os.getenv("BLACKLIST_FILTER", "bloom")
+# 布隆过滤器最小容量（重建时至少为黑名单人数的2倍）与目标误判率，内存约 容量 * -ln(误判率) / 0.48 位
+BLACKLIST_CAPACITY = int(os.getenv("BLACKLIST_CAPACITY", "100000"))
+BLACKLIST_FP_RATE = float(os.getenv("BLACKLIST_FP_RATE", "0.001"))
+# 定时SCAN重建的间隔（秒），清除已移出黑名单的用户
+BLACKLIST_REBUILD_INTERVAL = float(os.getenv("BLACKLIST_REBUILD_INTERVAL", "600"))
+# 检查键空间通知是否恢复/重新订阅的间隔（秒）；通知不可用时不使用过滤器，全部查询redis
+BLACKLIST_FALLBACK_INTERVAL = float(os.getenv("BLACKLIST_FALLBACK_INTERVAL", "60"))
+# SCAN每批数量
+BLACKLIST_SCAN_COUNT = int(os.getenv("BLACKLIST_SCAN_COUNT", "1000"))
+
+# ---- 编号预加载 ----
+# room_id解析后一次性SCAN+MGET预加载直播间全部 orderUser 编号，之后按键空间通知增量更新
+ORDER_PRELOAD = os.getenv("ORDER_PRELOAD", "1").lower() in ("1", "true", "yes")
+# 单个直播间最多预加载的key数量，超过则回退到按需查询
+ORDER_PRELOAD_MAX_KEYS = int(os.getenv("ORDER_PRELOAD_MAX_KEYS", "200000"))
+# SCAN / MGET 每批数量
+ORDER_PRELOAD_BATCH = int(os.getenv("ORDER_PRELOAD_BATCH", "500"))
+# 检查通知中断、重试加载失败的间隔（秒）
+ORDER_PRELOAD_CHECK_INTERVAL = float(os.getenv("ORDER_PRELOAD_CHECK_INTERVAL", "30"))
+
+# ---- 消息去重 ----
+# 每个直播间记住最近多少个msg_id（固定内存）
+DEDUPE_WINDOW = int(os.getenv("DEDUPE_WINDOW", "4096"))
+
+# ---- ttwid / room_id 解析 ----
+# ttwid缓存有效期（秒）
+TTWID_TTL = float(os.getenv("TTWID_TTL", "3600"))
+# live_id -> room_id 缓存有效期（秒），下播后room_id会变化
+ROOM_ID_TTL = float(os.getenv("ROOM_ID_TTL", "300"))
+# 请求失败重试次数
+RESOLVE_RETRIES = int(os.getenv("RESOLVE_RETRIES", "3"))
+
+# ---- 连接监管 ----
+# 全进程同时进行的连接（解析+签名+握手）数量上限
+MAX_CONCURRENT_CONNECTS = int(os.getenv("MAX_CONCURRENT_CONNECTS", "8"))
+# 重连退避初始/最大等待（秒）
+RECONNECT_BASE_DELAY = float(os.getenv("RECONNECT_BASE_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", "60"))
+# 抖音websocket心跳间隔（秒）
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "5"))
+# 超过该时间（秒）未收到任何推送视为连接假死并重连，0为不检查
+ACK_TIMEOUT = float(os.getenv("ACK_TIMEOUT", "30"))
+# 定时查询直播间开播状态的间隔（秒），0为不查询
+ROOM_STATUS_INTERVAL = float(os.getenv("ROOM_STATUS_INTERVAL", "60"))
+
+# ---- 定时调度 ----
+# 调度器执行阻塞任务（开播状态查询等）的线程数
+SCHEDULER_IO_WORKERS = int(os.getenv("SCHEDULER_IO_WORKERS", "4"))
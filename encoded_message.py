@@ -0,0 +1,176 @@
+# encoded_message.py
+import json
+import struct
+
+try:
+    import msgpack  # 可选依赖，安装后使用C实现
+except ImportError:
+    msgpack = None
+
+# 前端可协商的编码
+ENCODING_JSON = "json"  # 文本帧，JSON
+ENCODING_MSGPACK = "msgpack"  # 二进制帧，MessagePack
+ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK)
+
+
+def _pack_str(value, out):
+    raw = value.encode("utf-8")
+    n = len(raw)
+    if n < 32:
+        out.append(0xA0 | n)
+    elif n < 0x100:
+        out += b"\xd9" + bytes((n,))
+    elif n < 0x10000:
+        out += b"\xda" + struct.pack(">H", n)
+    else:
+        out += b"\xdb" + struct.pack(">I", n)
+    out += raw
+
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif 0 <= value < 0x100:
+        out += b"\xcc" + bytes((value,))
+    elif 0 <= value < 0x10000:
+        out += b"\xcd" + struct.pack(">H", value)
+    elif 0 <= value < 0x100000000:
+        out += b"\xce" + struct.pack(">I", value)
+    elif 0 <= value < 1 << 64:
+        out += b"\xcf" + struct.pack(">Q", value)
+    elif -0x80 <= value < 0:
+        out += b"\xd0" + struct.pack(">b", value)
+    elif -0x8000 <= value < 0:
+        out += b"\xd1" + struct.pack(">h", value)
+    elif -0x80000000 <= value < 0:
+        out += b"\xd2" + struct.pack(">i", value)
+    elif -(1 << 63) <= value < 0:
+        out += b"\xd3" + struct.pack(">q", value)
+    else:
+        raise OverflowError("整数超出MessagePack范围")
+
+
+def array_header(n):
+    if n < 16:
+        return bytes((0x90 | n,))
+    if n < 0x10000:
+        return b"\xdc" + struct.pack(">H", n)
+    return b"\xdd" + struct.pack(">I", n)
+
+
+def _pack(value, out):
+    # 快速路径：弹幕数据几乎全是 str -> str 的dict
+    if value.__class__ is str:
+        _pack_str(value, out)
+    elif value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out += b"\xcb" + struct.pack(">d", value)
+    elif isinstance(value, dict):
+        n = len(value)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += b"\xde" + struct.pack(">H", n)
+        else:
+            out += b"\xdf" + struct.pack(">I", n)
+        for k, v in value.items():
+            _pack(k, out)
+            _pack(v, out)
+    elif isinstance(value, (list, tuple)):
+        out += array_header(len(value))
+        for v in value:
+            _pack(v, out)
+    elif isinstance(value, str):
+        _pack_str(value, out)
+    elif isinstance(value, (bytes, bytearray)):
+        n = len(value)
+        if n < 0x100:
+            out += b"\xc4" + bytes((n,))
+        elif n < 0x10000:
+            out += b"\xc5" + struct.pack(">H", n)
+        else:
+            out += b"\xc6" + struct.pack(">I", n)
+        out += value
+    else:
+        raise TypeError(f"无法MessagePack编码的类型: {type(value)}")
+
+
+def packb(value):
+    """MessagePack编码（已安装msgpack时使用其C实现）"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+class EncodedMessage:
+    """
+    推送给前端的消息，每条消息只序列化一次，所有订阅的客户端共享同一份编码结果
+    text为JSON文本（文本帧），json_bytes / msgpack 为按需生成并缓存的二进制编码
+    msg_id为消息的msgId（用于断线续传），只有JSON文本时（多进程模式）由子进程随批量帧一起传递
+    """
+
+    __slots__ = ("data", "text", "msg_id", "_json_bytes", "_msgpack", "_fields")
+
+    def __init__(self, text, data=None, msg_id=None):
+        _set = object.__setattr__
+        _set(self, "data", data)
+        _set(self, "text", text)
+        if msg_id is None and isinstance(data, dict):
+            msg_id = data.get("msgId")
+        _set(self, "msg_id", msg_id)
+        _set(self, "_json_bytes", None)
+        _set(self, "_msgpack", None)
+        _set(self, "_fields", data)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(json.dumps(data, ensure_ascii=False), data)
+
+    @property
+    def json_bytes(self):
+        if self._json_bytes is None:
+            object.__setattr__(self, "_json_bytes", self.text.encode("utf-8"))
+        return self._json_bytes
+
+    @property
+    def fields(self):
+        """消息内容（dict / int），只有JSON文本时（多进程模式）按需解析并缓存"""
+        if self._fields is None:
+            object.__setattr__(self, "_fields", json.loads(self.text))
+        return self._fields
+
+    @property
+    def msgpack(self):
+        if self._msgpack is None:
+            object.__setattr__(self, "_msgpack", packb(self.fields))
+        return self._msgpack
+
+    def encoded(self, encoding):
+        """返回指定编码的帧内容：json为str，msgpack为bytes"""
+        if encoding == ENCODING_MSGPACK:
+            return self.msgpack
+        return self.text
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EncodedMessage 不可修改")
+
+    def __repr__(self):
+        return f"EncodedMessage({self.text[:80]!r})"
+
+
+def encode_batch(messages, encoding):
+    """把多条已编码消息拼成一个数组帧，不重新序列化"""
+    if encoding == ENCODING_MSGPACK:
+        return array_header(len(messages)) + b"".join(m.msgpack for m in messages)
+    return "[" + ",".join(m.text for m in messages) + "]"
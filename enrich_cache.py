@@ -0,0 +1,214 @@
+# enrich_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from redis_helper import redis_client
+
+MISSING = object()
+
+# 需要的键空间事件：$ 字符串（orderUser / black）、h hash（关键词）、g 通用（del等）、x 过期
+_REQUIRED_EVENTS = "$ghx"
+
+
+class EnrichCache:
+    """
+    弹幕补充信息（orderUser / black 解析结果）的进程内LRU + TTL缓存，所有直播间共享
+    通过redis键空间通知（或自定义pub/sub频道）失效，通知不可用时退化为短TTL
+    """
+
+    def __init__(self, max_size=100000, ttl=300.0, fallback_ttl=1.0, max_tombstones=10000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.max_tombstones = max_tombstones
+        self.invalidation_live = False  # 失效通知是否可用
+        self._data = OrderedDict()  # key -> (写入时间, 解析结果)
+        self._lock = threading.Lock()
+        # 每次失效自增；按key记录失效时的序号（墓碑），只有该key在读取redis之后失效过的回填才放弃，
+        # 其他key的失效不影响回填
+        self._version = 0
+        self._tombstones = OrderedDict()  # key -> 失效时的序号
+        self._floor = 0  # 读取时序号小于该值的回填一律放弃（清空缓存或墓碑被淘汰时提高）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        """命中返回解析结果（可能为None，表示redis中无此key），未命中返回MISSING"""
+        ttl = self.ttl if self.invalidation_live else self.fallback_ttl
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISSING
+            stored_at, value = item
+            if time.monotonic() - stored_at > ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version):
+        """version为读取redis前的self.version，期间该key失效过则放弃写入"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version < self._floor or self._tombstones.get(key, 0) > version:
+                return
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            self.invalidations += 1
+            self._data.pop(key, None)
+            self._tombstones[key] = self._version
+            self._tombstones.move_to_end(key)
+            while len(self._tombstones) > self.max_tombstones:
+                # 淘汰的墓碑无法再逐key判断，之前开始的回填全部放弃
+                self._floor = self._tombstones.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._floor = self._version
+            self._tombstones.clear()
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "tombstones": len(self._tombstones),
+                "invalidation_live": self.invalidation_live,
+            }
+
+
+class CacheInvalidator:
+    """
+    订阅redis键空间通知(__keyspace@db__:orderUser:* / black:*)以及自定义失效频道，
+    收到变更后立即剔除对应缓存；断线期间缓存退化为短TTL，重连后清空缓存
+    """
+
+    def __init__(self, cache, patterns=("orderUser:*", "black:*"), channel="enrich:invalidate"):
+        self.cache = cache
+        self.patterns = tuple(patterns)
+        self.channel = channel
+        self.db = redis_client.connection_pool.connection_kwargs.get("db", 0)
+        self._prefix = f"__keyspace@{self.db}__:"
+        self._listeners = []
+        self._thread = None
+        self.subscriptions = 0  # 成功订阅的次数，变化说明中间可能漏掉了通知
+        self._closed = False
+
+    def add_listener(self, fn, pattern=None):
+        """
+        额外的key变更监听 fn(key, event)，event为set/del/expired等，自定义频道为'publish'
+        :param pattern: 额外订阅的键空间通知pattern（如 keyword:*），需在start()前添加
+        """
+        self._listeners.append(fn)
+        if pattern and pattern not in self.patterns:
+            self.patterns += (pattern,)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._closed = True
+
+    def _ensure_notifications(self):
+        """
+        检查键空间通知是否开启，未开启时只依赖自定义频道 + 短TTL；
+        CONFIG SET修改的是整个redis实例（影响其他业务），只在ENRICH_NOTIFY_CONFIG_SET开启时执行
+        """
+        try:
+            flags = redis_client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+            if "K" in flags and ("A" in flags or all(c in flags for c in _REQUIRED_EVENTS)):
+                return True
+            if not config.ENRICH_NOTIFY_CONFIG_SET:
+                print(f"⚠️ redis未开启键空间通知（notify-keyspace-events需包含K{_REQUIRED_EVENTS}），"
+                      f"缓存将使用{self.cache.fallback_ttl}秒短TTL")
+                return False
+            redis_client.config_set("notify-keyspace-events", "".join(sorted(set(flags + "K" + _REQUIRED_EVENTS))))
+            return True
+        except Exception as e:
+            print(f"⚠️ 无法确认redis键空间通知，缓存将使用{self.cache.fallback_ttl}秒短TTL: {e}")
+            return False
+
+    def _run(self):
+        while not self._closed:
+            pubsub = None
+            try:
+                live = self._ensure_notifications()
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(*[self._prefix + p for p in self.patterns])
+                pubsub.subscribe(self.channel)
+                # 订阅前可能漏掉的变更全部作废
+                self.cache.clear()
+                self.cache.invalidation_live = live
+                self.subscriptions += 1
+                while not self._closed:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._handle(message)
+            except Exception as e:
+                self.cache.invalidation_live = False
+                print(f"❌ 缓存失效订阅异常，3秒后重试: {e}")
+                time.sleep(3)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+        self.cache.invalidation_live = False
+
+    def _handle(self, message):
+        channel = message.get("channel") or ""
+        data = message.get("data")
+        if channel == self.channel:
+            key, event = data, "publish"
+        elif channel.startswith(self._prefix):
+            key, event = channel[len(self._prefix):], data
+        else:
+            return
+        if not isinstance(key, str):
+            return
+        self.cache.invalidate(key)
+        for fn in self._listeners:
+            try:
+                fn(key, event)
+            except Exception as e:
+                print(f"❌ key变更监听执行失败: {e}")
+
+
+# 全局缓存（单例）
+enrich_cache = EnrichCache(max_size=config.ENRICH_CACHE_SIZE,
+                           ttl=config.ENRICH_CACHE_TTL,
+                           fallback_ttl=config.ENRICH_CACHE_FALLBACK_TTL)
+invalidator = CacheInvalidator(enrich_cache, channel=config.ENRICH_INVALIDATE_CHANNEL)
@@ -0,0 +1,130 @@
+# enricher.py
+import time
+
+import config
+from FsBlackRedisVo import FsBlackRedisVo
+from TagUserVo import TagUserVo
+from blacklist_filter import blacklist_filter
+from enrich_cache import MISSING, enrich_cache
+from keyword_matcher import keyword_matchers
+from metrics import ENRICH_SECONDS, REDIS_ERRORS, REDIS_REQUESTS, REDIS_SECONDS
+from order_preload import order_preloads
+from redis_helper import redis_client
+
+_MGET_SECONDS = REDIS_SECONDS.labels("mget")
+_MGET_REQUESTS = REDIS_REQUESTS.labels("mget")
+_MGET_ERRORS = REDIS_ERRORS.labels("mget")
+
+
+def order_key(room_id, user_id):
+    return f"orderUser:dy_room_id_user:{room_id}:{user_id}"
+
+
+def black_key(user_id):
+    return f"black:{user_id}"
+
+
+def parse_record(key, value):
+    """把redis原始值解析为TagUserVo / FsBlackRedisVo，无值时为None"""
+    if not value:
+        return None
+    if key.startswith("black:"):
+        return FsBlackRedisVo.parse_from_redis(value)
+    return TagUserVo.parse_from_redis(value)
+
+
+def apply_order(data, tag_user):
+    """把orderUser解析结果写入弹幕数据"""
+    if tag_user:
+        data["orderNumber"] = tag_user.orderNumber or ""
+    else:
+        data["orderNumber"] = ""
+
+
+def apply_black(data, black_vo):
+    """把black解析结果写入弹幕数据"""
+    if black_vo:
+        data["blackLevel"] = str(black_vo.blackLevel)
+        data["createdUsers"] = black_vo.createdUsers
+    else:
+        data["blackLevel"] = "0"
+        data["createdUsers"] = "[]"
+
+
+def fetch_records(keys):
+    """
+    批量获取key对应的解析结果：先查进程内缓存，未命中的key一次MGET
+    :return: {key: 解析结果或None}
+    """
+    records = {}
+    missing = []
+    for key in keys:
+        if key in records:
+            continue
+        record = enrich_cache.get(key)
+        if record is MISSING:
+            records[key] = None
+            missing.append(key)
+        else:
+            records[key] = record
+
+    if missing:
+        version = enrich_cache.version
+        _MGET_REQUESTS.inc()
+        start = time.perf_counter()
+        try:
+            values = redis_client.mget(missing)
+        except Exception:
+            _MGET_ERRORS.inc()
+            raise
+        _MGET_SECONDS.observe(time.perf_counter() - start)
+        for key, value in zip(missing, values):
+            record = parse_record(key, value)
+            records[key] = record
+            enrich_cache.put(key, record, version)
+    return records
+
+
+def enrich_chat_batch(batch):
+    """
+    批量补充弹幕用户的编号、黑名单信息、关键词标签
+    一个PushFrame内的所有聊天消息最多发起一次MGET，缓存命中及同一用户的key不重复查询，
+    编号已预加载的直播间不查询编号key
+    :param batch: 弹幕数据列表，每项需包含 dyRoomId / danmuUserId
+    """
+    if not batch:
+        return
+
+    start = time.perf_counter()
+    keys = []
+    for data in batch:
+        user_id = data["danmuUserId"]
+        number = order_preloads.lookup(data["dyRoomId"], user_id)
+        if number is MISSING:
+            keys.append(order_key(data["dyRoomId"], user_id))
+        else:
+            data["orderNumber"] = number  # 直播间编号已预加载，不查询redis
+        if blacklist_filter.might_contain(user_id):
+            keys.append(black_key(user_id))  # 确定不在黑名单中的用户不查询
+
+    try:
+        records = fetch_records(keys)
+        for data in batch:
+            user_id = data["danmuUserId"]
+            # 1.弹幕用户编号信息
+            key = order_key(data["dyRoomId"], user_id)
+            if key in records:
+                apply_order(data, records[key])
+            # 2.黑名单信息
+            key = black_key(user_id)
+            black_vo = records.get(key)
+            if black_vo is None and key in records and blacklist_filter.ready:
+                blacklist_filter.record_false_positive()
+            apply_black(data, black_vo)
+    except Exception as e:
+        print(f"❌ 标签信息获取失败: {e}")
+    if config.KEYWORD_MATCH:
+        # 3.关键词标签
+        for data in batch:
+            data["matchedTags"] = keyword_matchers.match(data["dyRoomId"], data.get("danmuContent"))
+    ENRICH_SECONDS.observe(time.perf_counter() - start)
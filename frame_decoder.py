@@ -0,0 +1,127 @@
+# frame_decoder.py
+import gzip
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from protobuf.fast_decode import scan_push_frame, scan_response
+
+_ISIZE = struct.Struct("<I")
+_MAX_RATIO = 64  # ISIZE超过压缩长度的该倍数视为不可信
+_MAX_PREALLOC = 8 * 1024 * 1024
+
+
+def inflate(payload):
+    """
+    解压gzip payload：用gzip尾部记录的原始长度（ISIZE）作为输出缓冲大小，
+    一次zlib调用完成，避免gzip.decompress逐块扩容和Python层的头部解析。
+    ISIZE来自上游、不可信，超过上限时不预分配，交回标准库逐块解压
+    """
+    if len(payload) < 18:
+        return gzip.decompress(payload)
+    size = _ISIZE.unpack_from(payload, len(payload) - 4)[0]
+    if size > min(len(payload) * _MAX_RATIO, _MAX_PREALLOC):
+        return gzip.decompress(payload)
+    try:
+        raw = zlib.decompress(payload, 31, size or 16384)
+    except zlib.error:
+        return gzip.decompress(payload)
+    if len(raw) != size:
+        return gzip.decompress(payload)  # 多member等情况，交回标准库处理
+    return raw
+
+
+def decode_frame(message, wanted):
+    """
+    解析一帧推送
+    :param wanted: wanted(method) 为False的消息不复制payload
+    :return: (FrameEnvelope, ResponseEnvelope)，非msg帧（没有Response）返回 (frame, None)
+    """
+    frame = scan_push_frame(message)
+    if frame.payload_type != "msg" or not frame.payload:
+        return frame, None
+    compress = frame.headers.get("compress_type", "gzip")
+    payload = inflate(frame.payload) if compress == "gzip" else frame.payload
+    return frame, scan_response(payload, wanted)
+
+
+class RateMeter:
+    """按固定窗口估算每秒帧数"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.rate = 0.0
+        self._count = 0
+        self._start = time.monotonic()
+
+    def tick(self):
+        now = time.monotonic()
+        self._count += 1
+        elapsed = now - self._start
+        if elapsed >= self.window:
+            self.rate = self._count / elapsed
+            self._count = 0
+            self._start = now
+        return max(self.rate, self._count / self.window)
+
+
+class SerialLane:
+    """
+    在共享线程池上按提交顺序逐个执行同一直播间的任务
+    :param max_depth: 排队任务上限，处理跟不上时丢弃最早排队的任务（直播消息新的比旧的有用），0为不限
+    """
+
+    def __init__(self, executor, max_depth=0):
+        self._executor = executor
+        self.max_depth = max_depth
+        self._queue = deque()
+        self.shed = 0  # 因积压丢弃的任务数
+        self._lock = threading.Lock()
+        self._running = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+    @property
+    def busy(self):
+        return self._running
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self.max_depth and len(self._queue) >= self.max_depth:
+                self._queue.popleft()
+                self.shed += 1
+            self._queue.append((fn, args))
+            if self._running:
+                return
+            self._running = True
+            self._idle.clear()
+        self._executor.submit(self._drain)
+
+    def wait_idle(self, timeout=None):
+        """等待已提交的任务全部执行完"""
+        return self._idle.wait(timeout)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._running = False
+                    self._idle.set()
+                    return
+                fn, args = self._queue.popleft()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"❌ 消息解码分发失败: {e}")
+
+
+# 高帧率直播间的解码/分发线程池（所有直播间共享）
+decode_pool = ThreadPoolExecutor(max_workers=config.DECODE_WORKERS, thread_name_prefix="decode")
@@ -0,0 +1,165 @@
+# frame_recorder.py
+"""
+原始PushFrame录制与回放
+文件格式：8字节文件头 DYFRAME1，之后为若干条记录：
+    8字节接收时间（time_ns，小端int64） + 4字节长度（小端uint32） + 原始websocket二进制消息
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"DYFRAME1"
+SUFFIX = ".dyframes"
+_RECORD = struct.Struct("<qI")
+
+
+class FrameRecorder:
+    """追加写入原始推送帧，单文件超过max_bytes后滚动，最多保留max_files个文件（0为不限制）"""
+
+    def __init__(self, directory, live_id, max_bytes=256 * 1024 * 1024, max_files=0):
+        self.directory = directory
+        self.live_id = live_id
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.frames = 0
+        self.bytes = 0
+        self.errors = 0  # 写入失败（磁盘满、无权限等）丢弃的帧数
+        self._file = None
+        self._size = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        # 同一秒内重启时文件名可能相同，只创建新文件，不在已有文件中间追加文件头
+        while True:
+            self._seq += 1
+            name = f"{self.live_id}-{time.strftime('%Y%m%d-%H%M%S')}-{self._seq:04d}{SUFFIX}"
+            try:
+                self._file = open(os.path.join(self.directory, name), "xb")
+                break
+            except FileExistsError:
+                continue
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        self._prune()
+
+    def _prune(self):
+        if self.max_files <= 0:
+            return
+        files = recorded_files(self.directory, self.live_id)
+        for path in files[:-self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def write(self, message, ts=None):
+        """写入失败只计数，不影响收包线程（之后的ack、解码照常进行）"""
+        record = _RECORD.pack(time.time_ns() if ts is None else ts, len(message))
+        with self._lock:
+            try:
+                if self._file is None or self._size >= self.max_bytes:
+                    self._close()
+                    self._open()
+                self._file.write(record)
+                self._file.write(message)
+            except OSError as e:
+                if self.errors % 1000 == 0:
+                    print(f"❌ 录制写入失败 {self.live_id}: {e}")
+                self.errors += 1
+                self._discard()  # 可能写了半条记录，下一帧换新文件
+                return
+            self._size += len(record) + len(message)
+            self.frames += 1
+            self.bytes += len(message)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _discard(self):
+        try:
+            self._close()
+        except OSError:
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def stats(self):
+        return {"frames": self.frames, "bytes": self.bytes, "errors": self.errors,
+                "file": self._file.name if self._file else None}
+
+
+def recorded_files(directory, live_id):
+    """按录制顺序返回某直播间的录制文件"""
+    prefix = f"{live_id}-"
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.startswith(prefix) and n.endswith(SUFFIX))
+    return [os.path.join(directory, n) for n in names]
+
+
+def read_frames(path):
+    """内存映射方式逐条读取录制文件，返回 (接收时间time_ns, 消息bytes)，不会把整个文件读入内存"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} 不是录制文件")
+            pos, end = len(MAGIC), len(mm)
+            while pos + _RECORD.size <= end:
+                ts, length = _RECORD.unpack_from(mm, pos)
+                pos += _RECORD.size
+                if pos + length > end:
+                    break  # 录制进程异常退出时最后一条可能不完整
+                yield ts, mm[pos:pos + length]
+                pos += length
+
+
+class FrameReplay:
+    """
+    按录制时间间隔回放帧
+    :param speed: 1为原速，N为N倍速，0为不等待（最快速度）
+    """
+
+    def __init__(self, paths, speed=1.0):
+        self.paths = list(paths)
+        self.speed = speed
+        self.frames = 0
+        self.bytes = 0
+        self.lag = 0.0  # 实际回放时间落后于计划时间的最大值（秒）
+
+    def play(self, on_frame, stopped=None):
+        """逐帧调用 on_frame(message)，stopped为threading.Event时可提前结束"""
+        first_ts = None
+        start = time.monotonic()
+        for path in self.paths:
+            for ts, message in read_frames(path):
+                if stopped is not None and stopped.is_set():
+                    return
+                if self.speed > 0:
+                    if first_ts is None:
+                        first_ts = ts
+                    due = start + (ts - first_ts) / 1e9 / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        if stopped is not None:
+                            if stopped.wait(delay):
+                                return
+                        else:
+                            time.sleep(delay)
+                    else:
+                        self.lag = max(self.lag, -delay)
+                on_frame(message)
+                self.frames += 1
+                self.bytes += len(message)
+
+    def stats(self):
+        return {"frames": self.frames, "bytes": self.bytes, "speed": self.speed, "lag_max": self.lag}
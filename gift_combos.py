@@ -0,0 +1,154 @@
+# gift_combos.py
+"""
+礼物连击合并与直播间礼物账本
+抖音连击礼物每连击一次推送一条GiftMessage（repeat_count累加），按 (用户, 礼物, group_id) 合并为一条事件：
+连击过程中原地更新，收到repeat_end或超过timeout没有新的连击时才推送
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from room_analytics import SpaceSaving
+
+
+class _Combo:
+    __slots__ = ("data", "repeat", "updated")
+
+    def __init__(self, data, updated):
+        self.data = data  # 推送给前端的事件，连击过程中原地更新
+        self.repeat = 0  # 已计入账本的repeat_count
+        self.updated = updated
+
+
+class GiftComboTracker:
+    """
+    线程安全：observe在抓取线程中调用，expire由调度线程定时调用
+    :param timeout: 连击超过该时间（秒）没有更新则视为结束
+    :param max_pending: 同时合并中的连击数上限，超出时提前推送最久未更新的连击
+    :param top_k: 送礼榜人数，内部跟踪 top_k * 100 个用户
+    """
+
+    def __init__(self, timeout=3.0, max_pending=1000, top_k=10):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.top_k = top_k
+        self._pending = OrderedDict()  # key -> _Combo，按最近更新时间排序
+        self._finished = OrderedDict()  # 最近结束的连击 key -> 最终repeat_count，迟到的连击消息不重复计数
+        self._gifters = SpaceSaving(top_k * 100)
+        self._names = {}  # 只保存送礼榜跟踪中的用户昵称
+        self._lock = threading.Lock()
+        self.ticks = 0  # 收到的礼物消息数
+        self.emitted = 0  # 推送的礼物事件数
+        self.gifts = 0  # 礼物总个数
+        self.diamonds = 0  # 钻石总数
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def observe(self, gift, now=None):
+        """
+        :param gift: GIFT_DECODER解码结果
+        :return: 需要立即推送的礼物事件列表
+        """
+        now = time.monotonic() if now is None else now
+        key = (gift["user_id"], gift["gift_id"], gift["group_id"])
+        repeat = max(gift["repeat_count"], 1)
+        group = max(gift["group_count"], 1)
+        ended = bool(gift["repeat_end"]) or not gift["combo"]
+        ready = []
+        with self._lock:
+            self.ticks += 1
+            combo = self._pending.get(key)
+            if combo is None:
+                if repeat <= self._finished.get(key, 0):
+                    return ready  # 连击已结束后迟到的消息
+                combo = _Combo({
+                    "type": "gift",
+                    "msgId": str(uuid.uuid4()),
+                    "dyMsgId": str(gift["msg_id"]),
+                    "giftUserId": str(gift["user_id"]),
+                    "giftUserName": gift["nick_name"],
+                    "giftId": str(gift["gift_id"]),
+                    "giftName": gift["gift_name"],
+                    "diamondCount": gift["diamond_count"],
+                    "groupCount": group,
+                    "repeatCount": 0,
+                    "giftCount": 0,
+                    "diamonds": 0,
+                    "comboEnd": False,
+                    "dyRoomId": str(gift["room_id"]),
+                }, now)
+                self._pending[key] = combo
+            else:
+                combo.updated = now
+                self._pending.move_to_end(key)
+            if repeat > combo.repeat:
+                self._credit(gift, combo, repeat, group)
+            if ended:
+                combo.data["comboEnd"] = True
+                ready.append(self._finish(key))
+            elif len(self._pending) > self.max_pending:
+                ready.append(self._finish(next(iter(self._pending))))
+        return ready
+
+    def _credit(self, gift, combo, repeat, group):
+        """按repeat_count增量记账，连击中途的消息也实时计入"""
+        count = (repeat - combo.repeat) * group
+        diamonds = count * gift["diamond_count"]
+        combo.repeat = repeat
+        data = combo.data
+        data["dyMsgId"] = str(gift["msg_id"])
+        data["repeatCount"] = repeat
+        data["giftCount"] += count
+        data["diamonds"] += diamonds
+        self.gifts += count
+        self.diamonds += diamonds
+        if diamonds:
+            user_id = gift["user_id"]
+            evicted = self._gifters.add(user_id, diamonds)
+            if evicted is not None:
+                self._names.pop(evicted, None)
+            self._names[user_id] = gift["nick_name"]
+
+    def _finish(self, key):
+        combo = self._pending.pop(key)
+        self._finished[key] = combo.repeat
+        if len(self._finished) > self.max_pending:
+            self._finished.popitem(last=False)
+        self.emitted += 1
+        return combo.data
+
+    def expire(self, now=None):
+        """返回超过timeout没有更新的连击事件"""
+        now = time.monotonic() if now is None else now
+        deadline = now - self.timeout
+        ready = []
+        with self._lock:
+            while self._pending:
+                key, combo = next(iter(self._pending.items()))
+                if combo.updated > deadline:
+                    break
+                ready.append(self._finish(key))
+        return ready
+
+    def flush(self):
+        """返回全部合并中的连击事件（直播间关闭时）"""
+        with self._lock:
+            return [self._finish(key) for key in list(self._pending)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ticks": self.ticks,
+                "emitted": self.emitted,
+                "pending": len(self._pending),
+                "gifts": self.gifts,
+                "diamonds": self.diamonds,
+                "topGifters": [
+                    {"userId": str(user_id), "userName": self._names.get(user_id, ""), "diamonds": diamonds,
+                     "error": error}
+                    for user_id, diamonds, error in self._gifters.top(self.top_k)
+                ],
+            }
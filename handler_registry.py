@@ -0,0 +1,165 @@
+# handler_registry.py
+import threading
+
+from protobuf.douyin import (ChatMessage, CommonTextMessage, ControlMessage, EmojiChatMessage, EpisodeChatMessage,
+                             FansclubMessage, GiftMessage, LikeMessage, LiveShoppingMessage,
+                             MatchAgainstScoreMessage, MemberMessage, ProductChangeMessage, RoomMessage,
+                             RoomRankMessage, RoomStatsMessage, RoomStreamAdaptationMessage, RoomUserSeqMessage,
+                             SocialMessage, UpdateFanTicketMessage)
+from protobuf.fast_decode import FAST_DECODERS
+
+# 抖音推送的method -> protobuf消息类
+METHOD_CLASSES = {
+    "WebcastChatMessage": ChatMessage,  # 聊天
+    "WebcastEmojiChatMessage": EmojiChatMessage,  # 表情聊天
+    "WebcastGiftMessage": GiftMessage,  # 礼物
+    "WebcastLikeMessage": LikeMessage,  # 点赞
+    "WebcastMemberMessage": MemberMessage,  # 进入直播间
+    "WebcastSocialMessage": SocialMessage,  # 关注/分享
+    "WebcastRoomUserSeqMessage": RoomUserSeqMessage,  # 在线观众排行
+    "WebcastRoomStatsMessage": RoomStatsMessage,  # 直播间统计
+    "WebcastUpdateFanTicketMessage": UpdateFanTicketMessage,  # 粉丝票
+    "WebcastCommonTextMessage": CommonTextMessage,
+    "WebcastFansclubMessage": FansclubMessage,  # 粉丝团
+    "WebcastRoomRankMessage": RoomRankMessage,  # 直播间排行榜
+    "WebcastRoomMessage": RoomMessage,
+    "WebcastRoomStreamAdaptationMessage": RoomStreamAdaptationMessage,
+    "WebcastControlMessage": ControlMessage,  # 直播间状态
+    "WebcastMatchAgainstScoreMessage": MatchAgainstScoreMessage,
+    "WebcastEpisodeChatMessage": EpisodeChatMessage,
+    "WebcastProductChangeMessage": ProductChangeMessage,  # 商品变更
+    "WebcastLiveShoppingMessage": LiveShoppingMessage,  # 带货
+}
+
+
+_FULL_DECODERS = {}
+
+
+def full_decoder(method):
+    """betterproto完整解码（同一method返回同一个解码函数，便于共享解码结果）"""
+    decoder = _FULL_DECODERS.get(method)
+    if decoder is None:
+        cls = METHOD_CLASSES.get(method)
+        if cls is None:
+            raise ValueError(f"未知的消息类型: {method}")
+        decoder = _FULL_DECODERS.setdefault(method, lambda payload: cls().parse(payload))
+    return decoder
+
+
+def fast_decoder(method):
+    """按需字段解码（仅热点类型），返回dict"""
+    decoder = FAST_DECODERS.get(method)
+    if decoder is None:
+        raise ValueError(f"{method} 没有按需解码器")
+    return decoder.decode
+
+
+class _MethodCounter:
+    __slots__ = ("received", "decoded", "skipped", "errors", "last_error")
+
+    def __init__(self):
+        self.received = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+
+
+class HandlerRegistry:
+    """
+    单个直播间的消息处理器注册表
+    - 按method注册处理器，同一method、同一解码器的多个处理器共享一次解码
+    - 没有处理器订阅的method直接跳过，payload不解码
+    - 按method统计收到/解码/跳过/出错次数
+    """
+
+    def __init__(self):
+        self._handlers = {}  # method -> [(decoder, [handler, ...]), ...]
+        self._counters = {}  # method -> _MethodCounter
+        self._lock = threading.Lock()
+
+    def register(self, method, handler, decoder=None, fast=False):
+        """
+        注册处理器 handler(message)
+        :param decoder: 自定义解码函数 payload -> message，默认betterproto完整解码
+        :param fast: 使用按需字段解码器（message为dict）
+        """
+        if decoder is None:
+            decoder = fast_decoder(method) if fast else full_decoder(method)
+        with self._lock:
+            groups = [(d, list(hs)) for d, hs in self._handlers.get(method, [])]
+            for d, hs in groups:
+                if d == decoder:
+                    hs.append(handler)
+                    break
+            else:
+                groups.append((decoder, [handler]))
+            # 整体替换，dispatch无需加锁
+            self._handlers[method] = groups
+
+    def unregister(self, method, handler):
+        with self._lock:
+            groups = []
+            for d, hs in self._handlers.get(method, []):
+                hs = [h for h in hs if h != handler]
+                if hs:
+                    groups.append((d, hs))
+            if groups:
+                self._handlers[method] = groups
+            else:
+                self._handlers.pop(method, None)
+
+    def subscribed(self, method):
+        return method in self._handlers
+
+    def _counter(self, method):
+        counter = self._counters.get(method)
+        if counter is None:
+            counter = self._counters.setdefault(method, _MethodCounter())
+        return counter
+
+    def skip(self, method):
+        """记录一条在解析信封时已跳过（未复制payload）的消息"""
+        counter = self._counter(method)
+        counter.received += 1
+        counter.skipped += 1
+
+    def dispatch(self, method, payload):
+        """
+        按method分发消息
+        :return: 是否有处理器处理
+        """
+        counter = self._counter(method)
+        counter.received += 1
+        groups = self._handlers.get(method)
+        if not groups:
+            counter.skipped += 1
+            return False
+        for decoder, handlers in groups:
+            try:
+                message = decoder(payload)
+            except Exception as e:
+                counter.errors += 1
+                counter.last_error = f"解码失败: {e}"
+                continue
+            counter.decoded += 1
+            for handler in handlers:
+                try:
+                    handler(message)
+                except Exception as e:
+                    counter.errors += 1
+                    counter.last_error = f"处理失败: {e}"
+        return True
+
+    def stats(self):
+        return {
+            method: {
+                "subscribed": method in self._handlers,
+                "received": c.received,
+                "decoded": c.decoded,
+                "skipped": c.skipped,
+                "errors": c.errors,
+                "last_error": c.last_error,
+            }
+            for method, c in list(self._counters.items())
+        }
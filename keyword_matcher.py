@@ -0,0 +1,230 @@
+# keyword_matcher.py
+"""
+弹幕关键词多模式匹配（Aho-Corasick自动机），匹配耗时只与弹幕长度有关，与关键词数量无关
+关键词按直播间保存在redis hash中：
+    keyword:dy_room_id:{room_id}  字段为关键词，值为标签（为空时标签即关键词）
+    keyword:global                 所有直播间共用的关键词
+关键词在后台加载、重建自动机并整体替换引用，匹配不加锁、不访问redis
+"""
+import threading
+import time
+from collections import deque
+
+import config
+from enrich_cache import invalidator
+from redis_helper import redis_client
+from scheduler import scheduler
+
+KEY_PREFIX = "keyword:dy_room_id:"
+GLOBAL_KEY = "keyword:global"
+
+
+def keyword_key(room_id):
+    return f"{KEY_PREFIX}{room_id}"
+
+
+class AhoCorasick:
+    """
+    不区分大小写的多关键词匹配
+    :param patterns: {关键词: 标签}
+    """
+
+    def __init__(self, patterns):
+        goto = [{}]
+        out = [()]
+        for keyword, tag in patterns.items():
+            keyword = keyword.casefold()
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            if tag not in out[state]:
+                out[state] += (tag,)
+
+        # 广度优先计算失败指针，并把失败链上的输出合并到每个状态
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, s in goto[r].items():
+                queue.append(s)
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(ch, 0)
+                out[s] += tuple(t for t in out[fail[s]] if t not in out[s])
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self.size = len(patterns)
+
+    def _run(self, text, first_only):
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        state = 0
+        tags = []
+        for ch in text.casefold():
+            if state == 0:
+                state = root.get(ch, 0)
+            else:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            if out[state]:
+                for tag in out[state]:
+                    if tag not in tags:
+                        tags.append(tag)
+                if first_only:
+                    break
+        return tags
+
+    def find(self, text):
+        """返回命中的标签（按首次出现顺序去重）"""
+        return self._run(text, False)
+
+    def contains(self, text):
+        """是否命中任一关键词"""
+        return bool(self._run(text, True))
+
+
+class _RoomKeywords:
+    __slots__ = ("automaton", "patterns", "loaded_at", "used_at")
+
+    def __init__(self, automaton, patterns, now):
+        self.automaton = automaton
+        self.patterns = patterns
+        self.loaded_at = now
+        self.used_at = now
+
+
+class KeywordMatchers:
+    """
+    各直播间的关键词自动机，首次匹配时在后台加载（加载完成前不打标签），之后由调度器定时刷新，
+    redis键空间通知到达时立即在后台重新加载对应直播间。读取redis与构建自动机都不在弹幕处理线程中进行
+    """
+
+    def __init__(self, refresh_interval=60.0, idle_ttl=600.0):
+        self.refresh_interval = refresh_interval
+        self.idle_ttl = idle_ttl
+        self._rooms = {}  # room_id -> _RoomKeywords
+        self._global = None  # 全局关键词，首次加载前为None
+        self._lock = threading.Lock()  # 只保护加载状态与替换，不在持有期间访问redis
+        self._loading = {}  # 正在加载的room_id -> 加载期间是否又有变更（完成后再加载一次）
+        self._timer = None
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.errors = 0
+
+    def get(self, room_id):
+        """返回直播间当前的自动机（没有关键词或尚未加载完成时为None）"""
+        room_id = str(room_id)
+        entry = self._rooms.get(room_id)
+        if entry is None:
+            if room_id not in self._loading:
+                self._request(room_id)
+            return None
+        entry.used_at = time.monotonic()
+        return entry.automaton
+
+    def match(self, room_id, text):
+        automaton = self.get(room_id)
+        return automaton.find(text) if automaton is not None and text else []
+
+    def _read(self, room_id):
+        """读取直播间关键词（合并全局关键词，直播间优先）"""
+        patterns = dict(self._global or {})
+        patterns.update(redis_client.hgetall(keyword_key(room_id)) or {})
+        return {keyword: tag or keyword for keyword, tag in patterns.items()}
+
+    def _request(self, room_id):
+        """在调度器线程池中加载直播间关键词，同一直播间同时只有一个加载任务"""
+        with self._lock:
+            if room_id in self._loading:
+                self._loading[room_id] = True
+                return
+            self._loading[room_id] = False
+            if self._timer is None and self.refresh_interval > 0:
+                self._timer = scheduler.call_every(self.refresh_interval, self.refresh, blocking=True,
+                                                   name="keywords")
+        scheduler.call_later(0, lambda: self._load(room_id), blocking=True, name="keywords")
+
+    def _load(self, room_id):
+        try:
+            self._build(room_id)
+        finally:
+            with self._lock:
+                again = self._loading.pop(room_id, False)
+            if again:
+                self._request(room_id)
+
+    def _build(self, room_id):
+        try:
+            if self._global is None:
+                self._global = redis_client.hgetall(GLOBAL_KEY) or {}
+            patterns = self._read(room_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 关键词加载失败 {room_id}: {e}")
+            with self._lock:
+                # 保留旧的自动机；首次加载失败时记录为空，等定时刷新重试
+                self._rooms.setdefault(room_id, _RoomKeywords(None, {}, time.monotonic()))
+            return
+        entry = self._rooms.get(room_id)
+        if entry is not None and entry.patterns == patterns:
+            entry.loaded_at = time.monotonic()
+            return
+        start = time.perf_counter()
+        automaton = AhoCorasick(patterns) if patterns else None
+        self.build_seconds += time.perf_counter() - start
+        self.builds += 1
+        new_entry = _RoomKeywords(automaton, patterns, time.monotonic())
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is not None:
+                new_entry.used_at = entry.used_at
+            self._rooms[room_id] = new_entry  # 整体替换，正在匹配的线程继续使用旧自动机
+
+    def refresh(self):
+        """调度线程（阻塞任务）调用：重新加载全局与活跃直播间的关键词，释放长时间未使用的直播间"""
+        try:
+            self._global = redis_client.hgetall(GLOBAL_KEY) or {}
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 全局关键词加载失败: {e}")
+            return
+        now = time.monotonic()
+        for room_id, entry in list(self._rooms.items()):
+            if now - entry.used_at > self.idle_ttl:
+                self._rooms.pop(room_id, None)
+            else:
+                self._request(room_id)
+
+    def on_key_changed(self, key, event):
+        """键空间通知：关键词变更后在后台重新加载"""
+        if key == GLOBAL_KEY:
+            scheduler.call_later(0, self.refresh, blocking=True, name="keywords")
+        elif key.startswith(KEY_PREFIX):
+            room_id = key[len(KEY_PREFIX):]
+            if room_id in self._rooms:
+                self._request(room_id)
+
+    def stats(self):
+        return {
+            "rooms": {room_id: len(entry.patterns) for room_id, entry in list(self._rooms.items())},
+            "global": len(self._global or {}),
+            "builds": self.builds,
+            "build_seconds": self.build_seconds,
+            "errors": self.errors,
+        }
+
+
+# 全局关键词匹配器（单例）
+keyword_matchers = KeywordMatchers(config.KEYWORD_REFRESH_INTERVAL, config.KEYWORD_IDLE_TTL)
+invalidator.add_listener(keyword_matchers.on_key_changed, pattern="keyword:*")
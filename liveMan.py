@@ -1,36 +1,40 @@
 #!/usr/bin/python
 # coding:utf-8
-import asyncio
 # @FileName:    liveMan.py
 # @Time:        2024/1/2 21:51
 # @Author:      bubu
 # @Project:     douyinLiveWebFetcher
 
-import codecs
-import gzip
 import hashlib
-import random
-import re
-import string
 import subprocess
 import threading
 import time
 import urllib.parse
-import json
 import uuid
 from contextlib import contextmanager
-from typing import Optional
 from unittest.mock import patch
 
-import requests
 import websocket
-from py_mini_racer import MiniRacer
 
-from FsBlackRedisVo import FsBlackRedisVo
-from TagUserVo import TagUserVo
+import config
+from encoded_message import EncodedMessage
+from enricher import enrich_chat_batch
+from frame_decoder import RateMeter, SerialLane, decode_frame, decode_pool
+from frame_recorder import FrameRecorder
+from gift_combos import GiftComboTracker
+from handler_registry import HandlerRegistry
+from metrics import DISPATCH_SECONDS, FRAME_DECODE_SECONDS
+from msg_dedupe import MsgIdDeduper
+from order_preload import order_preloads
 from protobuf.douyin import *
-from redis_helper import redis_client
+from room_analytics import RoomAnalytics
+from room_resolver import LIVE_URL, USER_AGENT, resolver
+from room_supervisor import RoomSupervisor
+from scheduler import scheduler
+from sign_pool import get_signer
 
+# 心跳包内容固定，只序列化一次
+HEARTBEAT_FRAME = PushFrame(payload_type='hb').SerializeToString()
 
 
 @contextmanager
@@ -60,15 +64,10 @@ def generateSignature(wss, script_file='sign.js'):
     md5 = hashlib.md5()
     md5.update(param.encode())
     md5_param = md5.hexdigest()
-    
-    with codecs.open(script_file, 'r', encoding='utf8') as f:
-        script = f.read()
-    
-    ctx = MiniRacer()
-    ctx.eval(script)
-    
+
+    # 使用进程级共享的签名池（预热的V8上下文 + md5结果缓存）
     try:
-        signature = ctx.call("get_sign", md5_param)
+        signature = get_signer(script_file).sign(md5_param)
         return signature
     except Exception as e:
         print(e)
@@ -80,20 +79,6 @@ def generateSignature(wss, script_file='sign.js'):
     # return ret.get('X-Bogus')
 
 
-def generateMsToken(length=107):
-    """
-    产生请求头部cookie中的msToken字段，其实为随机的107位字符
-    :param length:字符位数
-    :return:msToken
-    """
-    random_str = ''
-    base_str = string.ascii_letters + string.digits + '=_'
-    _len = len(base_str) - 1
-    for _ in range(length):
-        random_str += base_str[random.randint(0, _len)]
-    return random_str
-
-
 class DouyinLiveWebFetcher:
 
     def __init__(self, live_id):
@@ -103,26 +88,93 @@ class DouyinLiveWebFetcher:
                         其中的261378947940即是live_id
         """
         self._closed = False  # ✅ 新增：关闭标志
-        self.__ttwid = None
-        self.__room_id = None
         self.live_id = live_id
-        self.live_url = "https://live.douyin.com/"
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
-                          "Chrome/120.0.0.0 Safari/537.36"
+        self.live_url = LIVE_URL
+        self.user_agent = USER_AGENT
         self.callback = None  # 消息回调函数
+        self.supervisor = None  # 连接监管（线程模式）
+        self.lastFrameAt = 0.0  # 最近一次收到推送的时间（monotonic），用于ack超时检查
+        self._chatBatch = []  # 当前帧内待批量补充信息的聊天消息
+        # 按common.msg_id去重，重连后重放的弹幕不再重复推送（跨重连保留）
+        self.deduper = MsgIdDeduper(config.DEDUPE_WINDOW)
+        # 消息处理器注册表，未订阅的消息类型不解码
+        self.registry = HandlerRegistry()
+        self.registry.register('WebcastChatMessage', self._parseChatMsg, fast=True)  # 聊天消息
+        self.registry.register('WebcastControlMessage', self._parseControlMsg, fast=True)  # 直播间状态消息
+        # 礼物连击合并与钻石账本
+        self.gifts = GiftComboTracker(config.GIFT_COMBO_TIMEOUT, config.GIFT_COMBO_MAX_PENDING, config.GIFT_TOP_K)
+        self._giftTimer = None
+        self._orderRoom = None  # 已预加载编号的room_id
+        self._orderLock = threading.Lock()  # 与stop()互斥，避免关闭后再acquire导致引用泄漏
+        if config.GIFT_EVENTS:
+            self.registry.register('WebcastGiftMessage', self._parseGiftMsg, fast=True)  # 礼物消息
+        # 聊天速率、去重发言人数、活跃用户（固定内存）
+        self.analytics = RoomAnalytics(config.ANALYTICS_WINDOW, config.ANALYTICS_TOP_K)
+        self.frameRate = RateMeter()
+        self.frameStats = {"frames": 0, "frames_skipped": 0, "frames_offloaded": 0}
+        # 高帧率时在共享线程池上按顺序解码分发
+        self._lane = SerialLane(decode_pool, config.DECODE_MAX_DEPTH)
+        # 预先绑定直播间标签的延迟直方图
+        self._decodeSeconds = FRAME_DECODE_SECONDS.labels(live_id)
+        self._dispatchSeconds = DISPATCH_SECONDS.labels(live_id)
+        # 录制原始推送帧，用于离线回放
+        self.recorder = FrameRecorder(config.RECORD_DIR, live_id, max_bytes=config.RECORD_MAX_BYTES,
+                                      max_files=config.RECORD_MAX_FILES) if config.RECORD_DIR else None
+
+    def register_handler(self, method, handler, decoder=None, fast=False):
+        """
+        为本直播间注册消息处理器 handler(message)，如 'WebcastGiftMessage'
+        :param fast: 使用按需字段解码器（message为dict），默认betterproto完整解码
+        """
+        self.registry.register(method, handler, decoder=decoder, fast=fast)
 
+    def unregister_handler(self, method, handler):
+        self.registry.unregister(method, handler)
 
     def start(self, callback):
         self.callback = callback
-        threading.Thread(target=self._connectWebSocket, daemon=True).start()
+        self.supervisor = RoomSupervisor(self)
+        self.supervisor.start()
 
     def stop(self):
         self._closed = True  # 标志关闭
         try:
-            if hasattr(self, 'ws'):
-                self.ws.close()
+            if self.supervisor is not None:
+                self.supervisor.stop()
         except Exception as e:
             print(f"关闭WebSocket出错: {e}")
+        self._releaseResources()
+
+    def wait_idle(self, timeout=None):
+        """等待已交给解码线程池的帧处理完（回放、基准测试用）"""
+        return self._lane.wait_idle(timeout)
+
+    def _releaseResources(self):
+        """关闭录制文件、停止礼物连击定时器并推送未结束的连击、释放预加载的编号、删除本直播间的指标"""
+        if self.recorder is not None:
+            self.recorder.close()
+        if self._giftTimer is not None:
+            self._giftTimer.cancel()
+        self._flushGifts()
+        with self._orderLock:
+            if self._orderRoom is not None:
+                order_preloads.release(self._orderRoom)
+                self._orderRoom = None
+        FRAME_DECODE_SECONDS.remove(self.live_id)
+        DISPATCH_SECONDS.remove(self.live_id)
+
+    def connection_stats(self):
+        """连接状态、重连次数、帧解码统计"""
+        stats = self.supervisor.stats() if self.supervisor is not None else {}
+        stats.update(self._frameStats())
+        return stats
+
+    def _frameStats(self):
+        stats = dict(self.frameStats, frame_rate=self.frameRate.rate, offload_depth=self._lane.depth,
+                     frames_shed=self._lane.shed)
+        if self.recorder is not None:
+            stats["recorder"] = self.recorder.stats()
+        return stats
 
     @property
     def ttwid(self):
@@ -130,52 +182,40 @@ class DouyinLiveWebFetcher:
         产生请求头部cookie中的ttwid字段，访问抖音网页版直播间首页可以获取到响应cookie中的ttwid
         :return: ttwid
         """
-        if self.__ttwid:
-            return self.__ttwid
-        headers = {
-            "User-Agent": self.user_agent,
-        }
         try:
-            response = requests.get(self.live_url, headers=headers)
-            response.raise_for_status()
+            return resolver.ttwid()
         except Exception as err:
             print("【X】Request the live url error: ", err)
-        else:
-            self.__ttwid = response.cookies.get('ttwid')
-            return self.__ttwid
 
     @property
     def room_id(self):
         """
-        根据直播间的地址获取到真正的直播间roomId，有时会有错误，可以重试请求解决
+        根据直播间的地址获取到真正的直播间roomId，进程内共享TTL缓存，失败自动重试
         :return:room_id
         """
-        if self.__room_id:
-            return self.__room_id
-        url = self.live_url + self.live_id
-        headers = {
-            "User-Agent": self.user_agent,
-            "cookie": f"ttwid={self.ttwid}&msToken={generateMsToken()}; __ac_nonce=0123407cc00a9e438deb4",
-        }
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+            return resolver.room_id(self.live_id)
         except Exception as err:
             print("【X】Request the live room url error: ", err)
-        else:
-            match = re.search(r'roomId\\":\\"(\d+)\\"', response.text)
-            if match is None or len(match.groups()) < 1:
-                print("【X】No match found for roomId")
-
-            self.__room_id = match.group(1)
 
-            return self.__room_id
+    def _onRoomResolved(self, room_id):
+        """room_id解析后（每次重连）调用，下播再开播room_id变化时切换预加载的直播间"""
+        if not config.ORDER_PRELOAD:
+            return
+        with self._orderLock:
+            if self._closed or room_id == self._orderRoom:
+                return
+            order_preloads.acquire(room_id)
+            if self._orderRoom is not None:
+                order_preloads.release(self._orderRoom)
+            self._orderRoom = room_id
 
     def get_room_status(self):
         """
         获取直播间开播状态:
         room_status: 2 直播已结束
         room_status: 0 直播进行中
+        :return: room_status，获取失败为None
         """
         url = ('https://live.douyin.com/webcast/room/web/enter/?aid=6383'
                '&app_name=douyin_web&live_id=1&device_platform=web&language=zh-CN&enter_from=web_live'
@@ -185,7 +225,7 @@ class DouyinLiveWebFetcher:
                f'&room_id_str={self.room_id}'
                '&enter_source=&is_need_double_stream=false&insert_task_id=&live_reason='
                '&msToken=&a_bogus=')
-        resp = requests.get(url, headers={
+        resp = resolver.session.get(url, timeout=resolver.timeout, headers={
             'User-Agent': self.user_agent,
             'Cookie': f'ttwid={self.ttwid};'
         })
@@ -196,10 +236,11 @@ class DouyinLiveWebFetcher:
             user_id = user.get('id_str')
             nickname = user.get('nickname')
             print(f"【{nickname}】[{user_id}]直播间：{['正在直播', '已结束'][bool(room_status)]}.")
+            return room_status
 
-    def _connectWebSocket(self):
+    def _buildWssUrl(self):
         """
-        连接抖音直播间websocket服务器，请求直播间数据
+        拼接并签名抖音直播间websocket地址
         """
         wss = ("wss://webcast5-ws-web-hl.douyin.com/webcast/im/push/v2/?app_name=douyin_web"
                "&version_code=180800&webcast_sdk_version=1.0.14-beta.0"
@@ -219,156 +260,174 @@ class DouyinLiveWebFetcher:
 
         signature = generateSignature(wss)
         wss += f"&signature={signature}"
+        return wss
 
-        headers = {
+    def _wsHeaders(self):
+        return {
             "cookie": f"ttwid={self.ttwid}",
             'user-agent': self.user_agent,
         }
-        self.ws = websocket.WebSocketApp(wss,
-                                         header=headers,
-                                         on_open=self._wsOnOpen,
-                                         on_message=self._wsOnMessage,
-                                         on_error=self._wsOnError,
-                                         on_close=self._wsOnClose)
-        try:
-            self.ws.run_forever()
-        except Exception:
-            self.stop()
-            raise
 
     def _sendHeartbeat(self):
-        while not self._closed:
-            try:
-                heartbeat = PushFrame(payload_type='hb').SerializeToString()
-                self.ws.send(heartbeat, websocket.ABNF.OPCODE_PING)
-            except Exception as e:
-                print("【X】心跳包发送失败: ", e)
-                break
-            time.sleep(5)
+        """发送一次心跳包，由全局调度器定时调用"""
+        try:
+            self.ws.send(HEARTBEAT_FRAME, websocket.ABNF.OPCODE_PING)
+        except Exception as e:
+            print("【X】心跳包发送失败: ", e)
 
     """
       抖音client连接建立成功
     """
     def _wsOnOpen(self, ws):
         print("【√】WebSocket连接成功.")
-        threading.Thread(target=self._sendHeartbeat).start()
 
     """
       监听抖音弹幕client推送的弹幕消息
     """
     def _wsOnMessage(self, ws, message):
-        # 根据proto结构体解析对象
-        package = PushFrame().parse(message)
-        response = Response().parse(gzip.decompress(package.payload))
+        self.lastFrameAt = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.write(message)
+        package, response = self._decodeFrame(message)
+        if response is None:
+            return
 
         # 返回直播间服务器链接存活确认消息，便于持续获取数据
-        if response.need_ack:
-            ack = PushFrame(log_id=package.log_id,
-                            payload_type='ack',
-                            payload=response.internal_ext.encode('utf-8')
-                            ).SerializeToString()
+        ack = self._buildAck(package, response)
+        if ack:
             ws.send(ack, websocket.ABNF.OPCODE_BINARY)
 
-        # 根据消息类别解析消息体
-        for msg in response.messages_list:
-            method = msg.method
-            try:
-                {
-                    'WebcastControlMessage': self._parseControlMsg,  # 直播间状态消息
-                    'WebcastChatMessage': self._parseChatMsg,  # 聊天消息
-                }.get(method)(msg.payload)
-            except Exception:
-                pass
+        # 帧率过高时把消息解码、补充信息、序列化交给线程池，收包线程只负责解压与ack；
+        # 已有任务排队时继续排队，保证消息顺序
+        rate = self.frameRate.tick()
+        if self._lane.busy or 0 < config.DECODE_OFFLOAD_RATE < rate:
+            self.frameStats["frames_offloaded"] += 1
+            self._lane.submit(self._dispatchMessages, response.messages)
+        else:
+            self._dispatchMessages(response.messages)
+
+    def _dispatchMessages(self, messages):
+        # 根据消息类别分发给已注册的处理器，聊天消息先收集，整帧统一批量补充redis信息后再推送
+        start = time.perf_counter()
+        for method, payload in messages:
+            if payload is None:
+                self.registry.skip(method)
+                continue
+            if self._chatBatch and method != 'WebcastChatMessage':
+                # 先推送之前的聊天消息，保证消息顺序
+                self._emitChatBatch(self._takeChatBatch())
+            self.registry.dispatch(method, payload)
+        self._emitChatBatch(self._takeChatBatch())
+        self._dispatchSeconds.observe(time.perf_counter() - start)
+
+    def _decodeFrame(self, message):
+        """
+        解析PushFrame与Response信封，未订阅的消息不复制payload；非msg帧返回 (frame, None)
+        """
+        self.frameStats["frames"] += 1
+        start = time.perf_counter()
+        package, response = decode_frame(message, self.registry.subscribed)
+        self._decodeSeconds.observe(time.perf_counter() - start)
+        if response is None:
+            self.frameStats["frames_skipped"] += 1
+        return package, response
+
+    @staticmethod
+    def _buildAck(package, response):
+        if not response.need_ack:
+            return None
+        return PushFrame(log_id=package.log_id,
+                         payload_type='ack',
+                         payload=response.internal_ext.encode('utf-8')
+                         ).SerializeToString()
 
     """
         [抖音WebSocket] 错误
     """
     def _wsOnError(self, ws, error):
         print("[抖音WebSocket] 错误:", error)
-        self._reconnect()
 
     """
         [抖音WebSocket] 连接关闭
     """
     def _wsOnClose(self, ws, *args):
-        self.get_room_status()
+        # 是否重连由RoomSupervisor决定
+        try:
+            self.get_room_status()
+        except Exception as e:
+            print("【X】获取直播间状态失败: ", e)
         print("[抖音WebSocket] 连接关闭")
-        self._reconnect()
 
     """
        #监听抖音直播间状态变化
     """
-    def _parseControlMsg(self, payload):
-        message = ControlMessage().parse(payload)
+    def _parseControlMsg(self, message):
+        status = message["status"]
         # 推送直播间状态给客户端
-        self.callback(str(message.status))
-        if message.status == 3:
+        self.callback(EncodedMessage.from_data(status))
+        if status == 3:
             print("直播间已结束")
+            resolver.invalidate_room(self.live_id)  # 再次开播room_id会变化
             self.stop()
 
-    """
-      抖音client重连
-    """
-    def _reconnect(self, delay=3):
-        if self._closed:
-            return  # 避免关闭后仍重连
-        print(f"[抖音WebSocket] 正在尝试重连中...（{delay}秒后）")
-        time.sleep(delay)
-        try:
-            self._connectWebSocket()
-        except Exception as e:
-            # 可增加重试次数限制，防止无限重试
-            print("[抖音WebSocket] 重连失败:", e)
-
-    def _parseChatMsg(self, payload):
-        """聊天消息"""
-        message = ChatMessage().parse(payload)
-        user_name = message.user.nick_name
-        user_id = message.user.id
-        content = message.content
-        dy_live_Id = message.common.room_id
+    def _parseChatMsg(self, message):
+        """聊天消息（按需字段解码，跳过User/Text等大块子消息）"""
+        if self.deduper.is_duplicate(message["msg_id"]):
+            return  # 重复消息在补充redis信息、序列化之前丢弃
+        self.analytics.observe_chat(message["user_id"], message["nick_name"])
         data = {
             "msgId": str(uuid.uuid4()),
-            "dyMsgId": str(message.common.msg_id),
-            "danmuUserId": str(message.user.id),
-            "danmuUserName": message.user.nick_name,
-            "danmuContent": message.content,
-            "dyRoomId": str(message.common.room_id)
+            "dyMsgId": str(message["msg_id"]),
+            "danmuUserId": str(message["user_id"]),
+            "danmuUserName": message["nick_name"],
+            "danmuContent": message["content"],
+            "dyRoomId": str(message["room_id"])
         }
-
-        try:
-            # 1.从redis中获取弹幕用户编号信息
-            order_key = f"orderUser:dy_room_id_user:{dy_live_Id}:{user_id}"
-            tag_user_str = redis_client.get(order_key)
-            tag_user = TagUserVo.parse_from_redis(tag_user_str) if tag_user_str else None
-            if tag_user:
-                data["orderNumber"] = tag_user.orderNumber or ""
-            else:
-                data["orderNumber"] = ""
-
-            # 2. 获取黑名单信息
-            black_str = redis_client.get(f"black:{user_id}")
-            if black_str:
-                black_vo = FsBlackRedisVo.parse_from_redis(black_str)
-            else:
-                black_vo = None
-
-            if black_vo:
-                data["blackLevel"] = str(black_vo.blackLevel)
-                data["createdUsers"] = black_vo.createdUsers
-            else:
-                data["blackLevel"] = "0"
-                data["createdUsers"] = "[]"
-
-        except Exception as e:
-            print(f"❌ 标签信息获取失败: {e}")
-
-        json_data = json.dumps(data, ensure_ascii=False)  # 转换为JSON字符串
-        if self.callback:
+        self._chatBatch.append(data)
+
+    def _parseGiftMsg(self, message):
+        """礼物消息：连击按 (用户, 礼物, group_id) 合并，结束时推送一条"""
+        if self.deduper.is_duplicate(message["msg_id"]):
+            return
+        self._deliverGifts(self.gifts.observe(message))
+        if self._giftTimer is None and self.gifts.pending:
+            # 首个连击出现时才启动超时检查
+            self._giftTimer = scheduler.call_every(max(self.gifts.timeout / 2, 0.1), self._onGiftTimer,
+                                                   name=f"gift-{self.live_id}")
+
+    def _onGiftTimer(self):
+        """调度线程调用：推送超时未更新的连击"""
+        self._deliverGifts(self.gifts.expire())
+
+    def _flushGifts(self):
+        """关闭时推送全部合并中的连击，否则最后一个连击窗口内的礼物不会推送"""
+        self._deliverGifts(self.gifts.flush())
+
+    def _deliverGifts(self, events):
+        for data in events:
+            if self.callback:
                 try:
-                    self.callback(json_data)
+                    self.callback(EncodedMessage.from_data(data))
                 except Exception as e:
                     print(f"回调执行失败: {e}")
 
-
-
+    def _takeChatBatch(self):
+        batch, self._chatBatch = self._chatBatch, []
+        return batch
+
+    def _emitChatBatch(self, batch):
+        """批量补充redis标签信息后逐条推送"""
+        if not batch:
+            return
+        enrich_chat_batch(batch)
+        self._deliverChatBatch(batch)
+
+    def _deliverChatBatch(self, batch):
+        """序列化并回调推送已补充信息的弹幕"""
+        for data in batch:
+            message = EncodedMessage.from_data(data)  # 只序列化一次，所有客户端共享
+            if self.callback:
+                try:
+                    self.callback(message)
+                except Exception as e:
+                    print(f"回调执行失败: {e}")
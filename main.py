@@ -2,68 +2,209 @@ import asyncio
 import json
 import threading
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from typing import Dict, Set
+from fastapi.responses import PlainTextResponse
+from typing import Dict
 from starlette.middleware.cors import CORSMiddleware
+
+import config
+from asyncLiveMan import AsyncDouyinLiveWebFetcher
+from blacklist_filter import blacklist_filter
+from client_channel import BatchingClientChannel, ClientChannel
+from encoded_message import ENCODING_JSON, ENCODINGS, EncodedMessage
+from enrich_cache import enrich_cache, invalidator
+from keyword_matcher import keyword_matchers
 from liveMan import DouyinLiveWebFetcher
+from message_backlog import MessageBacklog
+from message_filter import FilterGroups, MessageFilter, compile_filter
+from metrics import MetricFamily, registry as metrics_registry, render
+from order_preload import order_preloads
 from redis_helper import redis_client
+from replayLiveMan import ReplayDouyinLiveWebFetcher, use_replay_redis
+from room_resolver import resolver
+from room_workers import worker_pool
+from scheduler import scheduler
+from sign_pool import get_signer
 
 app = FastAPI()
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.active_connections: Dict[str, Dict[WebSocket, ClientChannel]] = {}
+        self.room_dropped: Dict[str, int] = {}  # 已断开客户端累计丢弃的消息数
         self.fetchers: Dict[str, DouyinLiveWebFetcher] = {}
+        self.backlogs: Dict[str, MessageBacklog] = {}  # 最近推送的消息，新客户端连接时补发
+        self.room_filters: Dict[str, FilterGroups] = {}  # 按订阅过滤条件分组的客户端
         self.lock = threading.Lock()
         self.loop = asyncio.get_event_loop()
 
-    async def connect(self, websocket: WebSocket, live_id: str):
+    def _startFetcher(self, live_id: str) -> DouyinLiveWebFetcher:
+        """
+        根据 FETCHER_MODE 创建抓取器：thread 每个直播间一个线程；async 运行在当前事件循环上；
+        process 运行在抓取子进程中（消息回调在当前事件循环上执行）；replay 回放录制文件
+        """
+        if config.FETCHER_MODE == "process":
+            fetcher = worker_pool.fetcher(live_id)
+            fetcher.start(callback=lambda msg: self.loop.create_task(self.broadcast(live_id, msg)))
+        elif config.FETCHER_MODE == "async":
+            fetcher = AsyncDouyinLiveWebFetcher(live_id)
+            fetcher.start(callback=lambda msg: self.loop.create_task(self.broadcast(live_id, msg)))
+        else:
+            # replay 回放录制文件，回调与线程模式一样在抓取线程中执行
+            fetcher = ReplayDouyinLiveWebFetcher(live_id) if config.FETCHER_MODE == "replay" \
+                else DouyinLiveWebFetcher(live_id)
+            fetcher.start(
+                callback=lambda msg: asyncio.run_coroutine_threadsafe(
+                    self.broadcast(live_id, msg),
+                    self.loop
+                )
+            )
+        return fetcher
+
+    async def connect(self, websocket: WebSocket, live_id: str, batch: bool = False,
+                      batch_window: float = None, batch_max: int = None, encoding: str = ENCODING_JSON,
+                      since: str = None, analytics: bool = False, message_filter: MessageFilter = None):
+        """
+        :param message_filter: 连接时即生效的订阅过滤条件（补发的最近消息也按此过滤），连接后可再发送filter修改
+        :param analytics: 是否定时接收直播间统计汇总帧
+        :param since: 客户端最后收到的msgId，重连时只补发之后的消息；为空则补发全部缓存
+        :param encoding: 推送编码，json（文本帧）或 msgpack（二进制帧）
+        :param batch: 客户端是否使用批量协议（JSON数组帧）
+        :param batch_window: 批量窗口（秒），默认 BATCH_WINDOW_MS
+        :param batch_max: 每帧最多消息数，默认 BATCH_MAX
+        """
         await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+
+        # 先于注册客户端发送，保证 "LIVING" 是第一帧；不能在持有线程锁时 await，其他协程进入 remove 会卡死事件循环
+        await websocket.send_text("LIVING")
 
         with self.lock:
             if live_id not in self.active_connections:
-                self.active_connections[live_id] = set()
+                self.active_connections[live_id] = {}
+                self.room_dropped[live_id] = 0
+                self.room_filters[live_id] = FilterGroups()
                 # 仅当没有抓取器时才创建新实例
                 if live_id not in self.fetchers:
-                    self.fetchers[live_id] = DouyinLiveWebFetcher(live_id)
-                    self.fetchers[live_id].start(
-                        callback=lambda msg: asyncio.run_coroutine_threadsafe(
-                            self.broadcast(live_id, msg),
-                            self.loop
-                        )
-                    )
-            # 如果已经有抓取器，说明直播正在运行，直接给新连接发送 "LIVING"
-            await websocket.send_text("LIVING")
-            self.active_connections[live_id].add(websocket)
+                    self.fetchers[live_id] = self._startFetcher(live_id)
+                if config.BACKLOG_SIZE > 0 and live_id not in self.backlogs:
+                    self.backlogs[live_id] = MessageBacklog(config.BACKLOG_SIZE, config.BACKLOG_SECONDS)
+            options = dict(
+                max_queue=config.CLIENT_QUEUE_SIZE,
+                policy=config.CLIENT_OVERFLOW_POLICY,
+                on_failed=lambda channel: self.remove(channel.websocket, live_id),
+                encoding=encoding,
+                analytics=analytics,
+            )
+            if batch:
+                channel = BatchingClientChannel(
+                    websocket,
+                    batch_window=config.BATCH_WINDOW_MS / 1000 if batch_window is None else batch_window,
+                    batch_max=config.BATCH_MAX if batch_max is None else batch_max,
+                    **options,
+                )
+            else:
+                channel = ClientChannel(websocket, **options)
+            self.active_connections[live_id][websocket] = channel
             # print(f"🟢 新客户端连接 ({len(self.active_connections[live_id])}个): {live_id}")
+            self.room_filters[live_id].set(channel, message_filter)
+            backlog = self.backlogs.get(live_id)
+            if backlog is not None:
+                # 与注册客户端在同一步完成，补发与后续广播之间不会遗漏或乱序
+                for message in backlog.since(since):
+                    if message_filter is None or message_filter.matches(message):
+                        channel.enqueue(message)
 
-    async def broadcast(self, live_id: str, message: str):  # 注意参数类型改为dict
+    def set_filter(self, websocket: WebSocket, live_id: str, spec):
+        """
+        修改客户端的订阅过滤条件，之后的消息生效
+        :raises ValueError: 条件格式错误
+        """
+        message_filter = compile_filter(spec)
+        channel = self.active_connections.get(live_id, {}).get(websocket)
+        if channel is not None:
+            self.room_filters[live_id].set(channel, message_filter)
+        return message_filter
+
+    async def broadcast(self, live_id: str, message: EncodedMessage):
+        """只负责入队，由每个客户端自己的发送协程推送；消息已预先编码，所有客户端共享"""
         if live_id not in self.active_connections:
             print(f"⚠️ 无活跃连接: {live_id}")
             return
 
-        clients = list(self.active_connections[live_id])
-        # print(f"📢 准备向 {len(clients)} 个客户端广播消息")
+        backlog = self.backlogs.get(live_id)
+        if backlog is not None:
+            backlog.append(message)
+        # 条件相同的客户端每条消息只判断一次
+        for channel in self.room_filters[live_id].recipients(message):
+            if not channel.enqueue(message):
+                print(f"🐢 客户端消费过慢，断开连接: {live_id}")
+                self.loop.create_task(self._disconnectSlow(channel, live_id))
 
-        for connection in clients:
-            try:
-                # 确保转换为JSON字符串
-                # json_message = json.dumps(message, ensure_ascii=False)
-                # print(f"✉️ 发送消息: {json_message[:100]}...")  # 打印前100字符
-                await connection.send_text(message)
-                # print("✅ 发送成功")
-            except Exception as e:
-                print(f"❌ 发送失败: {str(e)[:200]}")  # 截断长错误信息
-                await self.remove(connection, live_id)
+    def push_analytics(self):
+        """调度线程调用：在事件循环上给订阅了统计的客户端推送汇总帧"""
+        asyncio.run_coroutine_threadsafe(self._pushAnalytics(), self.loop)
+
+    async def _pushAnalytics(self):
+        for live_id, channels in list(self.active_connections.items()):
+            subscribers = [channel for channel in channels.values() if channel.analytics]
+            fetcher = self.fetchers.get(live_id)
+            if not subscribers or fetcher is None:
+                continue
+            summary = {"type": "analytics", "liveId": live_id}
+            summary.update(fetcher.analytics.stats())
+            message = EncodedMessage.from_data(summary)  # 不进入最近消息缓存
+            for channel in subscribers:
+                channel.enqueue(message)
+
+    async def _disconnectSlow(self, channel: ClientChannel, live_id: str):
+        await self.remove(channel.websocket, live_id)
+        try:
+            await channel.websocket.close(code=1013)
+        except Exception:
+            pass
 
     async def remove(self, websocket: WebSocket, live_id: str):
         with self.lock:
             if live_id in self.active_connections:
-                self.active_connections[live_id].discard(websocket)
+                channel = self.active_connections[live_id].pop(websocket, None)
+                if channel is not None:
+                    channel.close()
+                    self.room_filters[live_id].discard(channel)
+                    self.room_dropped[live_id] += channel.dropped
                 if not self.active_connections[live_id]:
                     print(f"💤 没有客户端了，关闭 {live_id} 的抓取器")
                     self.fetchers[live_id].stop()
                     del self.fetchers[live_id]
                     del self.active_connections[live_id]
+                    del self.room_dropped[live_id]
+                    del self.room_filters[live_id]
+                    backlog = self.backlogs.get(live_id)
+                    if backlog is not None:
+                        scheduler.call_later(config.BACKLOG_RETAIN,
+                                             lambda: self._dropBacklog(live_id, backlog),
+                                             name=f"backlog-{live_id}")
+
+    def _dropBacklog(self, live_id: str, backlog: MessageBacklog):
+        """保留期内没有客户端重新连接则释放缓存"""
+        with self.lock:
+            if live_id not in self.active_connections and self.backlogs.get(live_id) is backlog:
+                del self.backlogs[live_id]
+
+    def stats(self):
+        """每个直播间的客户端队列深度与丢弃数"""
+        rooms = {}
+        for live_id, channels in list(self.active_connections.items()):
+            clients = [channel.stats() for channel in list(channels.values())]
+            rooms[live_id] = {
+                "clients": len(clients),
+                "queue_depth": sum(c["depth"] for c in clients),
+                "queue_depth_max": max((c["depth"] for c in clients), default=0),
+                "dropped": self.room_dropped.get(live_id, 0) + sum(c["dropped"] for c in clients),
+                "client_queues": clients,
+                "backlog": self.backlogs[live_id].stats() if live_id in self.backlogs else None,
+                "filters": self.room_filters[live_id].stats() if live_id in self.room_filters else None,
+            }
+        return rooms
 
 # 添加 CORS 中间件
 app.add_middleware(
@@ -81,9 +222,52 @@ async def reject_root(websocket: WebSocket):
     await websocket.accept()
     await websocket.close(code=4001)
 
+async def _handleClientCommand(websocket: WebSocket, live_id: str, data: str):
+    """客户端发送的JSON指令，目前只有 {"filter": {...} | null}"""
+    try:
+        command = json.loads(data)
+    except ValueError:
+        return
+    if not isinstance(command, dict) or "filter" not in command:
+        return
+    try:
+        message_filter = manager.set_filter(websocket, live_id, command["filter"])
+        reply = {"type": "filter", "ok": True, "filter": message_filter.spec() if message_filter else None}
+    except ValueError as e:
+        reply = {"type": "filter", "ok": False, "error": str(e)}
+    channel = manager.active_connections.get(live_id, {}).get(websocket)
+    if channel is not None:
+        channel.enqueue(EncodedMessage.from_data(reply))  # 与推送消息走同一发送队列，保证顺序
+
+
 @app.websocket("/ws/{live_id}")
 async def websocket_endpoint(websocket: WebSocket, live_id: str):
-    await manager.connect(websocket, live_id)
+    # 可选批量协议：/ws/{live_id}?batch=1&batch_ms=50&batch_max=100
+    # 可选二进制编码：/ws/{live_id}?encoding=msgpack
+    # 重连续传：/ws/{live_id}?since=<最后收到的msgId>，只补发之后的消息
+    # 直播间统计汇总帧：/ws/{live_id}?analytics=1
+    # 订阅过滤：/ws/{live_id}?filter=<JSON>，或连接后发送 {"filter": {...}}（见message_filter.py）
+    params = websocket.query_params
+    encoding = params.get("encoding", ENCODING_JSON).lower()
+    if encoding not in ENCODINGS:
+        encoding = ENCODING_JSON
+    batch = params.get("batch", "0").lower() in ("1", "true", "yes")
+    analytics = params.get("analytics", "0").lower() in ("1", "true", "yes")
+    try:
+        batch_ms = params.get("batch_ms")
+        batch_window = min(max(float(batch_ms), 1.0), 1000.0) / 1000 if batch_ms else None
+        batch_max = params.get("batch_max")
+        batch_max = min(max(int(batch_max), 1), 1000) if batch_max else None
+    except ValueError:
+        batch_window, batch_max = None, None
+    try:
+        message_filter = compile_filter(json.loads(params["filter"])) if params.get("filter") else None
+    except ValueError as e:
+        print(f"⚠️ 客户端过滤条件无效，不过滤: {e}")
+        message_filter = None
+    await manager.connect(websocket, live_id, batch=batch, batch_window=batch_window, batch_max=batch_max,
+                         encoding=encoding, since=params.get("since"), analytics=analytics,
+                         message_filter=message_filter)
     try:
         while True:
             # 维持连接活跃
@@ -93,6 +277,8 @@ async def websocket_endpoint(websocket: WebSocket, live_id: str):
                 print(f"收到客户端[{live_id}]心跳ping")
                 await websocket.send_text("pong")  # 发送pong响应
                 continue
+            if data.startswith("{"):
+                await _handleClientCommand(websocket, live_id, data)
     except WebSocketDisconnect:
         print("前端客户端主动断开")
         await manager.remove(websocket, live_id)
@@ -102,6 +288,10 @@ async def websocket_endpoint(websocket: WebSocket, live_id: str):
 
 
 
+# replay模式默认使用进程内redis，不订阅键空间通知、不构建黑名单过滤器
+_FAKE_REDIS = config.FETCHER_MODE == "replay" and use_replay_redis()
+
+
 @app.on_event("startup")
 def init_redis_check():
     try:
@@ -110,7 +300,209 @@ def init_redis_check():
     except Exception as e:
         print("❌ Redis 连接失败:", e)
 
+@app.on_event("startup")
+def warm_up_signer():
+    # 后台预热签名池，首个直播间连接时无需再等待V8上下文创建
+    if config.FETCHER_MODE == "process":
+        return  # 签名在抓取进程中进行
+    def _warm():
+        try:
+            get_signer().warm_up()
+            print("✅ 签名池预热完成")
+        except Exception as e:
+            print("❌ 签名池预热失败:", e)
+    threading.Thread(target=_warm, daemon=True).start()
+
+
+@app.on_event("startup")
+def start_cache_invalidator():
+    # 订阅redis变更通知，及时失效进程内的弹幕补充信息缓存
+    if not _FAKE_REDIS:
+        invalidator.start()
+
+
+@app.on_event("startup")
+def start_blacklist_filter():
+    # 后台SCAN black:* 构建黑名单过滤器，之后干净用户不再查询redis
+    if config.FETCHER_MODE != "process" and not _FAKE_REDIS:
+        blacklist_filter.start()  # 弹幕在抓取进程中补充信息
+
+
+@app.on_event("startup")
+async def start_analytics_push():
+    if config.ANALYTICS_INTERVAL > 0:
+        manager.loop = asyncio.get_running_loop()
+        scheduler.call_every(config.ANALYTICS_INTERVAL, manager.push_analytics, name="analytics")
+
+
+@app.on_event("startup")
+async def start_worker_pool():
+    if config.FETCHER_MODE == "process":
+        await worker_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_worker_pool():
+    if config.FETCHER_MODE == "process":
+        await worker_pool.close()
+
+
+@app.get("/stats/rooms")
+def room_stats():
+    return manager.stats()
+
+
+@app.get("/stats/methods/{live_id}")
+def method_stats(live_id: str):
+    """直播间各消息类型的收到/解码/跳过/出错次数"""
+    fetcher = manager.fetchers.get(live_id)
+    return fetcher.registry.stats() if fetcher else {}
+
+
+@app.get("/stats/connection/{live_id}")
+def connection_stats(live_id: str):
+    """直播间上游连接状态（resolving/signing/connecting/live/backoff/ended）与重连次数"""
+    fetcher = manager.fetchers.get(live_id)
+    return fetcher.connection_stats() if fetcher else {}
+
+
+@app.get("/stats/dedupe/{live_id}")
+def dedupe_stats(live_id: str):
+    """直播间msg_id去重窗口命中数"""
+    fetcher = manager.fetchers.get(live_id)
+    return fetcher.deduper.stats() if fetcher else {}
+
+
+@app.get("/stats/analytics/{live_id}")
+def analytics_stats(live_id: str):
+    """直播间消息速率、去重发言人数（全场/近期）、最活跃的发言用户"""
+    fetcher = manager.fetchers.get(live_id)
+    return fetcher.analytics.stats() if fetcher else {}
+
+
+@app.get("/stats/gifts/{live_id}")
+def gift_stats(live_id: str):
+    """直播间礼物账本：礼物数、钻石数、送礼榜、合并中的连击数"""
+    fetcher = manager.fetchers.get(live_id)
+    return fetcher.gifts.stats() if fetcher else {}
+
+
+@app.get("/stats/enrich")
+def enrich_stats():
+    return enrich_cache.stats()
+
+
+@app.get("/stats/keywords")
+def keyword_stats():
+    """各直播间关键词数量与自动机重建次数"""
+    return keyword_matchers.stats()
+
+
+@app.get("/stats/blacklist")
+def blacklist_stats():
+    """黑名单过滤器人数、内存、目标/估算/实测误判率、省去的redis查询数"""
+    return blacklist_filter.stats()
+
+
+@app.get("/stats/orders")
+def order_preload_stats():
+    """各直播间预加载的编号数量、加载耗时、命中/回退redis次数"""
+    return order_preloads.stats()
+
+
+@app.get("/stats/resolver")
+def resolver_stats():
+    return resolver.stats
+
+
+@app.get("/stats/signer")
+def signer_stats():
+    return get_signer().stats()
+
+
+@app.get("/stats/workers")
+def worker_stats():
+    return worker_pool.stats()
+
+
+def collect_metrics():
+    """抓取时从现有统计生成直播间、客户端、调度器、缓存指标，热路径不做任何记录"""
+    rooms = MetricFamily("douyin_rooms", "gauge", "正在抓取的直播间数")
+    clients = MetricFamily("douyin_clients", "gauge", "前端客户端连接数")
+    depth = MetricFamily("douyin_client_queue_depth", "gauge", "前端发送队列积压消息数（直播间合计）")
+    depth_max = MetricFamily("douyin_client_queue_depth_max", "gauge", "前端发送队列最大积压")
+    dropped = MetricFamily("douyin_client_dropped", "counter", "前端发送队列丢弃的消息数")
+    backlog = MetricFamily("douyin_backlog_messages", "gauge", "直播间最近消息缓存条数")
+    replayed = MetricFamily("douyin_backlog_replayed", "counter", "连接时补发的消息数")
+    frames = MetricFamily("douyin_upstream_frames", "counter", "收到的抖音推送帧数")
+    skipped = MetricFamily("douyin_upstream_frames_skipped", "counter", "未解压直接跳过的推送帧数")
+    offloaded = MetricFamily("douyin_upstream_frames_offloaded", "counter", "交给解码线程池的推送帧数")
+    offload_depth = MetricFamily("douyin_upstream_offload_depth", "gauge", "排队等待解码线程池处理的推送帧数")
+    shed = MetricFamily("douyin_upstream_frames_shed", "counter", "解码积压超过上限而丢弃的推送帧数")
+    frame_rate = MetricFamily("douyin_upstream_frame_rate", "gauge", "最近一秒推送帧率")
+    live = MetricFamily("douyin_room_live", "gauge", "抖音websocket是否已连接")
+    reconnects = MetricFamily("douyin_reconnects", "counter", "按原因统计的重连次数")
+    diamonds = MetricFamily("douyin_gift_diamonds", "counter", "直播间收到的礼物钻石数")
+    messages = MetricFamily("douyin_messages", "counter", "按method统计收到的消息数")
+    decoded = MetricFamily("douyin_messages_decoded", "counter", "按method统计已解码的消息数")
+    errors = MetricFamily("douyin_message_errors", "counter", "按method统计解码/处理失败数")
+
+    room_stats = manager.stats()
+    rooms.add(len(manager.fetchers))
+    for live_id, room in room_stats.items():
+        clients.add(room["clients"], room=live_id)
+        depth.add(room["queue_depth"], room=live_id)
+        depth_max.add(room["queue_depth_max"], room=live_id)
+        dropped.add(room["dropped"], room=live_id)
+        if room["backlog"] is not None:
+            backlog.add(room["backlog"]["size"], room=live_id)
+            replayed.add(room["backlog"]["replayed"], room=live_id)
+    for live_id, fetcher in list(manager.fetchers.items()):
+        conn = fetcher.connection_stats()
+        frames.add(conn.get("frames", 0), room=live_id)
+        skipped.add(conn.get("frames_skipped", 0), room=live_id)
+        offloaded.add(conn.get("frames_offloaded", 0), room=live_id)
+        offload_depth.add(conn.get("offload_depth", 0), room=live_id)
+        shed.add(conn.get("frames_shed", 0), room=live_id)
+        frame_rate.add(conn.get("frame_rate", 0.0), room=live_id)
+        live.add(int(conn.get("state") == "live"), room=live_id)
+        for cause, count in conn.get("reconnect_causes", {}).items():
+            reconnects.add(count, room=live_id, cause=cause)
+        diamonds.add(fetcher.gifts.stats().get("diamonds", 0), room=live_id)
+        for method, counter in fetcher.registry.stats().items():
+            messages.add(counter["received"], room=live_id, method=method)
+            decoded.add(counter["decoded"], room=live_id, method=method)
+            errors.add(counter["errors"], room=live_id, method=method)
+
+    lag = MetricFamily("douyin_scheduler_lag_seconds", "gauge", "定时调度延迟")
+    sched = scheduler.stats()
+    for stat in ("last", "avg", "max"):
+        lag.add(sched[f"lag_{stat}"], stat=stat)
+
+    cache = enrich_cache.stats()
+    cache_size = MetricFamily("douyin_enrich_cache_size", "gauge", "弹幕补充信息缓存条数").add(cache["size"])
+    cache_hits = MetricFamily("douyin_enrich_cache_hits", "counter", "补充信息缓存命中数").add(cache["hits"])
+    cache_misses = MetricFamily("douyin_enrich_cache_misses", "counter", "补充信息缓存未命中数").add(cache["misses"])
+    return [rooms, clients, depth, depth_max, dropped, backlog, replayed, frames, skipped, offloaded, offload_depth, shed,
+            frame_rate, live, reconnects, diamonds, messages, decoded, errors, lag, cache_size, cache_hits, cache_misses]
+
+
+metrics_registry.add_collector(collect_metrics)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    families = metrics_registry.collect()
+    if config.FETCHER_MODE == "process":
+        families.extend(worker_pool.metric_families())
+    return PlainTextResponse(render(families), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/stats/scheduler")
+def scheduler_stats():
+    return scheduler.stats()
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8765)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8765)
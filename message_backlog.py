@@ -0,0 +1,82 @@
+# message_backlog.py
+import time
+from collections import deque
+from itertools import islice
+
+from encoded_message import EncodedMessage
+
+class MessageBacklog:
+    """
+    直播间最近推送消息的环形缓冲，新客户端连接时补发
+    保存的是已编码的EncodedMessage（与广播共享同一对象），补发不需要重新序列化
+    :param max_messages: 最多保留的消息条数
+    :param max_seconds: 最多保留的时长（秒），0为不按时间淘汰
+    """
+
+    def __init__(self, max_messages, max_seconds=0.0):
+        self.max_messages = max_messages
+        self.max_seconds = max_seconds
+        self._entries = deque()  # (seq, 入队时间, msgId, message)
+        self._index = {}  # msgId -> seq
+        self._seq = 0
+        self.replayed = 0  # 补发的消息数
+        self.resumed = 0  # 按msgId续传成功次数
+        self.missed = 0  # msgId已被淘汰，只能补发全部缓冲的次数
+
+    def __len__(self):
+        return len(self._entries)
+
+    def append(self, message: EncodedMessage, now=None):
+        now = time.monotonic() if now is None else now
+        self._seq += 1
+        msg_id = message.msg_id
+        if msg_id is not None:
+            self._index[msg_id] = self._seq
+        self._entries.append((self._seq, now, msg_id, message))
+        if len(self._entries) > self.max_messages:
+            self._evict()
+        self._expire(now)
+
+    def _evict(self):
+        _, _, msg_id, _ = self._entries.popleft()
+        if msg_id is not None:
+            self._index.pop(msg_id, None)
+
+    def _expire(self, now):
+        if self.max_seconds <= 0:
+            return
+        deadline = now - self.max_seconds
+        while self._entries and self._entries[0][1] < deadline:
+            self._evict()
+
+    def since(self, msg_id=None, now=None):
+        """
+        返回需要补发的消息（按推送顺序）
+        :param msg_id: 客户端最后收到的msgId，只返回其后的消息；为空或已被淘汰时返回全部缓冲
+        """
+        self._expire(time.monotonic() if now is None else now)
+        start = 0
+        if msg_id:
+            seq = self._index.get(msg_id)
+            if seq is None:
+                self.missed += 1
+            else:
+                self.resumed += 1
+                start = seq - self._entries[0][0] + 1
+        messages = [entry[3] for entry in islice(self._entries, start, None)]
+        self.replayed += len(messages)
+        return messages
+
+    def clear(self):
+        self._entries.clear()
+        self._index.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_messages": self.max_messages,
+            "max_seconds": self.max_seconds,
+            "replayed": self.replayed,
+            "resumed": self.resumed,
+            "missed": self.missed,
+        }
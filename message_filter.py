@@ -0,0 +1,174 @@
+# message_filter.py
+"""
+前端WebSocket的服务端订阅过滤
+客户端连接后发送 {"filter": {"types": ["chat"], "minBlackLevel": 1, "hasOrderNumber": true, "keywords": ["扣1"]}}，
+{"filter": null} 取消过滤。过滤条件编译一次，同一直播间条件相同的客户端归为一组，每条消息每组只判断一次
+"""
+from encoded_message import EncodedMessage
+from keyword_matcher import AhoCorasick
+
+# 可过滤的消息类型
+TYPE_CHAT = "chat"
+TYPE_GIFT = "gift"
+TYPE_STATUS = "status"
+MESSAGE_TYPES = (TYPE_CHAT, TYPE_GIFT, TYPE_STATUS)
+
+_MAX_KEYWORDS = 100
+_MISSING = object()
+
+
+def message_type(fields):
+    """聊天消息没有type字段，直播间状态为整数"""
+    if isinstance(fields, dict):
+        return fields.get("type", TYPE_CHAT)
+    return TYPE_STATUS
+
+
+class MessageFilter:
+    """
+    编译后的过滤条件，所有条件同时满足才推送
+    :param types: 消息类型，为空不限
+    :param min_black_level: 只推送blackLevel >= 该值的聊天消息
+    :param has_order_number: 只推送有orderNumber的聊天消息
+    :param keywords: 弹幕内容包含任一关键词（不区分大小写）
+    """
+
+    def __init__(self, types=(), min_black_level=0, has_order_number=False, keywords=()):
+        self.types = frozenset(types)
+        self.min_black_level = min_black_level
+        self.has_order_number = has_order_number
+        self.keywords = tuple(sorted(set(keywords)))
+        # 相同条件的key相同，用于分组
+        self.key = (tuple(sorted(self.types)), self.min_black_level, self.has_order_number, self.keywords)
+        self._checks = self._compile()
+
+    def _compile(self):
+        """按开销从低到高排列的判断函数"""
+        checks = []
+        if self.types:
+            types = self.types
+            checks.append(lambda fields: message_type(fields) in types)
+        if self.has_order_number or self.min_black_level > 0 or self.keywords:
+            checks.append(lambda fields: isinstance(fields, dict))  # 以下条件只对聊天等dict消息有意义
+        if self.has_order_number:
+            checks.append(lambda fields: bool(fields.get("orderNumber")))
+        if self.min_black_level > 0:
+            level = self.min_black_level
+            checks.append(lambda fields: _int(fields.get("blackLevel")) >= level)
+        if self.keywords:
+            automaton = AhoCorasick({k: k for k in self.keywords})
+            checks.append(lambda fields: automaton.contains(fields.get("danmuContent", "")))
+        return tuple(checks)
+
+    def matches(self, message: EncodedMessage):
+        if not self._checks:
+            return True
+        fields = message.fields
+        for check in self._checks:
+            if not check(fields):
+                return False
+        return True
+
+    def spec(self):
+        return {
+            "types": sorted(self.types),
+            "minBlackLevel": self.min_black_level,
+            "hasOrderNumber": self.has_order_number,
+            "keywords": list(self.keywords),
+        }
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def compile_filter(spec):
+    """
+    解析客户端发送的过滤条件，为空返回None（不过滤）
+    :raises ValueError: 条件格式错误
+    """
+    if not spec:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError("filter必须是对象")
+    unknown = set(spec) - {"types", "minBlackLevel", "hasOrderNumber", "keyword", "keywords"}
+    if unknown:
+        raise ValueError(f"未知的过滤条件: {', '.join(sorted(unknown))}")
+    types = spec.get("types") or ()
+    if isinstance(types, str):
+        types = (types,)
+    for t in types:
+        if t not in MESSAGE_TYPES:
+            raise ValueError(f"未知的消息类型: {t}，可选 {', '.join(MESSAGE_TYPES)}")
+    keywords = spec.get("keywords") or spec.get("keyword") or ()
+    if isinstance(keywords, str):
+        keywords = (keywords,)
+    keywords = [k for k in keywords if isinstance(k, str) and k]
+    if len(keywords) > _MAX_KEYWORDS:
+        raise ValueError(f"关键词最多{_MAX_KEYWORDS}个")
+    try:
+        min_black_level = int(spec.get("minBlackLevel") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("minBlackLevel必须是整数")
+    compiled = MessageFilter(types, min_black_level, bool(spec.get("hasOrderNumber")), keywords)
+    return compiled if compiled._checks else None
+
+
+class FilterGroup:
+    __slots__ = ("filter", "channels")
+
+    def __init__(self, message_filter):
+        self.filter = message_filter
+        self.channels = set()
+
+
+class FilterGroups:
+    """一个直播间内按过滤条件分组的客户端，只在事件循环线程中使用"""
+
+    def __init__(self):
+        self._groups = {}  # 过滤条件key（不过滤为None） -> FilterGroup
+        self._channelKeys = {}  # channel -> key
+        self.evaluations = 0  # 实际执行的过滤判断次数
+        self.saved = 0  # 分组共享后省去的判断次数
+
+    def set(self, channel, message_filter=None):
+        self.discard(channel)
+        key = None if message_filter is None else message_filter.key
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = FilterGroup(message_filter)
+        group.channels.add(channel)
+        self._channelKeys[channel] = key
+
+    def discard(self, channel):
+        key = self._channelKeys.pop(channel, _MISSING)
+        if key is _MISSING:
+            return
+        group = self._groups[key]
+        group.channels.discard(channel)
+        if not group.channels:
+            del self._groups[key]
+
+    def recipients(self, message: EncodedMessage):
+        """返回应收到该消息的客户端"""
+        channels = []
+        for group in list(self._groups.values()):
+            if group.filter is not None:
+                self.evaluations += 1
+                self.saved += len(group.channels) - 1
+                if not group.filter.matches(message):
+                    continue
+            channels.extend(group.channels)
+        return channels
+
+    def stats(self):
+        return {
+            "groups": len(self._groups),
+            "filtered_clients": sum(len(g.channels) for k, g in self._groups.items() if k is not None),
+            "evaluations": self.evaluations,
+            "saved": self.saved,
+        }
+
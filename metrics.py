@@ -0,0 +1,225 @@
+# metrics.py
+"""
+轻量Prometheus指标（文本格式0.0.4），不依赖prometheus_client
+- 热路径使用labels()预先绑定的子指标，每次记录只做一次加法/二分查找，不分配dict
+- 直播间、客户端队列等状态类指标在抓取时由collector读取现有统计生成，不在热路径维护
+- collect()返回可JSON序列化的结构，多进程模式下抓取进程的指标经IPC汇总到主进程
+"""
+import bisect
+import math
+import threading
+
+# 延迟直方图默认分桶（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个为+Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """返回绑定标签值的子指标，热路径应保存返回值重复使用"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """删除子指标（如直播间关闭后），避免标签无限增长"""
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _samples(self, labels, child):
+        raise NotImplementedError
+
+    def collect(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            samples.extend(self._samples(list(zip(self.labelnames, values)), child))
+        return [self.name, self.kind, self.documentation, samples]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _samples(self, labels, child):
+        return [[self.name + "_total", labels, child.value]]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _samples(self, labels, child):
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            total += count
+            samples.append([self.name + "_bucket", labels + [["le", _format_value(float(bound))]], total])
+        samples.append([self.name + "_sum", labels, child.sum])
+        samples.append([self.name + "_count", labels, total])
+        return samples
+
+
+class MetricFamily:
+    """抓取时临时生成的一组样本（gauge / counter），供collector使用"""
+
+    def __init__(self, name, kind, documentation):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.samples = []
+        self._sample_name = name + "_total" if kind == "counter" else name
+
+    def add(self, value, **labels):
+        self.samples.append([self._sample_name, [[k, v] for k, v in labels.items()], value])
+        return self
+
+    def collect(self):
+        return [self.name, self.kind, self.documentation, self.samples]
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """fn() 返回 MetricFamily 列表，在每次抓取时调用"""
+        self._collectors.append(fn)
+
+    def collect(self):
+        families = [metric.collect() for metric in self._metrics]
+        for fn in self._collectors:
+            try:
+                families.extend(family.collect() for family in fn())
+            except Exception as e:
+                print(f"❌ 指标收集失败: {e}")
+        return families
+
+
+def with_label(families, name, value):
+    """给一组collect()结果的所有样本追加标签（如多进程模式的worker编号）"""
+    return [[n, kind, doc, [[s, [[name, value]] + list(labels), v] for s, labels, v in samples]]
+            for n, kind, doc, samples in families]
+
+
+def render(families):
+    """按Prometheus文本格式输出，同名指标族合并"""
+    merged = {}
+    for name, kind, documentation, samples in families:
+        family = merged.get(name)
+        if family is None:
+            merged[name] = [kind, documentation, list(samples)]
+        else:
+            family[2].extend(samples)
+    lines = []
+    for name, (kind, documentation, samples) in merged.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if labels:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表（单例）
+registry = Registry()
+
+# ---- 热路径指标 ----
+FRAME_DECODE_SECONDS = registry.histogram(
+    "douyin_frame_decode_seconds", "推送帧解压与信封解析耗时", ("room",))
+DISPATCH_SECONDS = registry.histogram(
+    "douyin_frame_dispatch_seconds", "一帧内消息解码、处理与推送耗时", ("room",))
+ENRICH_SECONDS = registry.histogram(
+    "douyin_enrich_seconds", "一批弹幕补充redis标签信息耗时")
+REDIS_SECONDS = registry.histogram(
+    "douyin_redis_seconds", "redis命令耗时", ("op",))
+REDIS_REQUESTS = registry.counter(
+    "douyin_redis_requests", "redis命令次数", ("op",))
+REDIS_ERRORS = registry.counter(
+    "douyin_redis_errors", "redis命令失败次数", ("op",))
@@ -0,0 +1,41 @@
+# msg_dedupe.py
+from array import array
+
+
+class MsgIdDeduper:
+    """
+    固定内存的msg_id去重窗口：环形缓冲区记录最近capacity个msg_id，哈希集合用于O(1)查重
+    重连后抖音会重放最近的消息（need_persist_msg_count），用于丢弃重复弹幕
+    """
+
+    __slots__ = ("capacity", "hits", "_ring", "_seen", "_pos", "_size")
+
+    def __init__(self, capacity=4096):
+        self.capacity = max(1, capacity)
+        self.hits = 0  # 命中（被丢弃）的重复消息数
+        self._ring = array("Q", bytes(8 * self.capacity))
+        self._seen = set()
+        self._pos = 0
+        self._size = 0
+
+    def is_duplicate(self, msg_id):
+        """
+        判断并记录msg_id
+        :return: True 表示窗口内已出现过，应丢弃
+        """
+        if not msg_id:
+            return False  # 没有msg_id的消息不去重
+        if msg_id in self._seen:
+            self.hits += 1
+            return True
+        if self._size == self.capacity:
+            self._seen.discard(self._ring[self._pos])
+        else:
+            self._size += 1
+        self._ring[self._pos] = msg_id
+        self._seen.add(msg_id)
+        self._pos = (self._pos + 1) % self.capacity
+        return False
+
+    def stats(self):
+        return {"capacity": self.capacity, "size": self._size, "hits": self.hits}
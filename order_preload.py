@@ -0,0 +1,245 @@
+# order_preload.py
+"""
+直播间编号信息预加载：room_id解析后 SCAN + MGET 一次性读取 orderUser:dy_room_id_user:{room_id}:* ，
+保存为 用户id(int) -> orderNumber 的字典，之后通过redis键空间通知增量更新。
+加载完成且通知可用时，补充编号信息不再访问redis（不在字典中即没有编号）。
+键空间通知不可用时预加载的结果无法保持最新、不会被使用，因此不加载，等通知可用后由定时检查加载
+"""
+import itertools
+import threading
+import time
+
+import config
+from TagUserVo import TagUserVo
+from enrich_cache import MISSING, invalidator
+from redis_helper import redis_client
+from scheduler import scheduler
+
+ORDER_PREFIX = "orderUser:dy_room_id_user:"
+
+
+def _order_number(value):
+    tag_user = TagUserVo.parse_from_redis(value) if value else None
+    return (tag_user.orderNumber or "") if tag_user else ""
+
+
+class RoomOrders:
+    """单个直播间的 用户id -> orderNumber，只有加载完成（loaded）后才可作为依据"""
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.refs = 0
+        self.numbers = {}  # int用户id -> orderNumber（只保存有编号的用户）
+        self.dirty = {}  # 收到变更通知、尚未重新读取的用户 -> 通知序号，查询时回退到redis
+        self.refetch_pending = False  # 已排队的重新读取任务，同一直播间只保留一个
+        self.loaded = False
+        self.loading = False
+        self.subscriptions = -1  # 加载时失效订阅的次数，不一致说明可能漏掉了通知
+        self.load_seconds = 0.0
+        self.loads = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.too_large = False
+
+    def prefix(self):
+        return f"{ORDER_PREFIX}{self.room_id}:"
+
+
+class OrderPreloads:
+    """
+    各直播间的预加载编号（单例 order_preloads），acquire / release 按引用计数管理
+    :param max_keys: 单个直播间最多预加载的key数量，超过则放弃预加载（回退到按需查询）
+    :param batch: 每次MGET的key数量
+    """
+
+    def __init__(self, max_keys=200000, batch=500, check_interval=30.0):
+        self.max_keys = max_keys
+        self.batch = batch
+        self.check_interval = check_interval
+        self._rooms = {}  # room_id(str) -> RoomOrders
+        self._lock = threading.Lock()
+        self._timer = None
+        self._listening = False
+        self._seq = itertools.count(1)
+        self.errors = 0
+
+    def acquire(self, room_id):
+        """room_id解析后调用，后台开始预加载"""
+        room_id = str(room_id)
+        with self._lock:
+            if not self._listening:
+                invalidator.add_listener(self._onKeyChanged)
+                self._listening = True
+            if self._timer is None and self.check_interval > 0:
+                self._timer = scheduler.call_every(self.check_interval, self._check, blocking=True,
+                                                   name="order-preload")
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = self._rooms[room_id] = RoomOrders(room_id)
+            room.refs += 1
+            if room.loaded or room.loading or not invalidator.cache.invalidation_live:
+                return
+            room.loading = True
+        scheduler.call_later(0, lambda: self._load(room), blocking=True, name=f"order-preload-{room_id}")
+
+    def release(self, room_id):
+        room_id = str(room_id)
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                return
+            room.refs -= 1
+            if room.refs <= 0:
+                del self._rooms[room_id]
+
+    def lookup(self, room_id, user_id):
+        """
+        返回用户的orderNumber（没有编号为""）；直播间未加载完成、通知不可靠或该用户刚有变更时返回MISSING
+        """
+        room = self._rooms.get(str(room_id))
+        if room is None or not room.loaded:
+            return MISSING
+        try:
+            uid = int(user_id)
+        except (TypeError, ValueError):
+            return MISSING
+        if uid in room.dirty or not self._reliable(room):
+            room.fallbacks += 1
+            return MISSING
+        room.hits += 1
+        return room.numbers.get(uid, "")
+
+    @staticmethod
+    def _reliable(room):
+        return invalidator.cache.invalidation_live and invalidator.subscriptions == room.subscriptions
+
+    def _load(self, room):
+        """SCAN + 分批MGET读取直播间全部编号"""
+        start = time.perf_counter()
+        subscriptions = invalidator.subscriptions
+        with self._lock:
+            room.dirty.clear()  # 加载期间的变更重新记录，加载完成后再读取
+        numbers = None
+        try:
+            numbers = self._scan(room)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 直播间{room.room_id}编号预加载失败: {e}")
+        with self._lock:
+            room.loading = False
+            if numbers is None or self._rooms.get(room.room_id) is not room:
+                return  # 加载失败 / 编号过多 / 加载期间直播间已关闭
+            room.numbers = numbers
+            room.subscriptions = subscriptions
+            room.loaded = True
+        room.loads += 1
+        room.load_seconds = time.perf_counter() - start
+        print(f"✅ 直播间{room.room_id}编号预加载完成：{len(numbers)}人，{room.load_seconds:.2f}秒")
+        if room.dirty:
+            self._refetch(room)
+
+    def _scan(self, room):
+        """返回 用户id -> orderNumber，key数量超过max_keys时返回None"""
+        numbers = {}
+        keys = []
+        uids = []
+        prefix = room.prefix()
+        for key in redis_client.scan_iter(match=prefix + "*", count=self.batch):
+            try:
+                uids.append(int(key[len(prefix):]))
+            except ValueError:
+                continue  # 不是 {prefix}{用户id} 格式的key，跳过
+            keys.append(key)
+            if len(keys) > self.max_keys:
+                room.too_large = True
+                print(f"⚠️ 直播间{room.room_id}编号数量超过{self.max_keys}，不预加载")
+                return None
+        for i in range(0, len(keys), self.batch):
+            chunk = keys[i:i + self.batch]
+            for uid, value in zip(uids[i:i + self.batch], redis_client.mget(chunk)):
+                number = _order_number(value)
+                if number:
+                    numbers[uid] = number
+        return numbers
+
+    def _refetch(self, room):
+        """重新读取有变更的用户；读取期间再次变更的用户保留在dirty中，由下一次任务读取"""
+        with self._lock:
+            room.refetch_pending = False  # 之后的通知重新排队
+            snapshot = dict(room.dirty)
+        if not snapshot:
+            return
+        uids = list(snapshot)
+        prefix = room.prefix()
+        try:
+            values = redis_client.mget([f"{prefix}{uid}" for uid in uids])
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 直播间{room.room_id}编号更新失败: {e}")
+            return  # 保留dirty，查询继续回退到redis，下一次通知或重新加载时再读取
+        with self._lock:
+            if room.loading:
+                return  # 重新加载中，dirty已清空，加载完成后统一读取
+            for uid, value in zip(uids, values):
+                # 只写入读取期间没有再次变更的用户；否则该值可能已过期，由更新的任务写入
+                if room.dirty.get(uid) != snapshot[uid]:
+                    continue
+                del room.dirty[uid]
+                number = _order_number(value)
+                if number:
+                    room.numbers[uid] = number
+                else:
+                    room.numbers.pop(uid, None)
+
+    def _check(self):
+        """调度线程（阻塞任务）：通知恢复或中断过的直播间重新加载，加载失败的重试"""
+        if not invalidator.cache.invalidation_live:
+            return  # 加载了也不会被使用
+        for room in list(self._rooms.values()):
+            with self._lock:
+                if room.loading or room.too_large:
+                    continue
+                stale = not room.loaded or (invalidator.cache.invalidation_live
+                                            and invalidator.subscriptions != room.subscriptions)
+                if stale:
+                    room.loading = True
+            if stale:
+                self._load(room)
+
+    def _onKeyChanged(self, key, event):
+        if not key.startswith(ORDER_PREFIX):
+            return
+        room_id, _, user_id = key[len(ORDER_PREFIX):].rpartition(":")
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        try:
+            uid = int(user_id)
+        except ValueError:
+            return
+        with self._lock:
+            room.dirty[uid] = next(self._seq)
+            if not room.loaded or room.refetch_pending:
+                return  # 加载完成后统一读取 / 已有排队中的任务
+            room.refetch_pending = True
+        scheduler.call_later(0, lambda: self._refetch(room), blocking=True, name=f"order-update-{room_id}")
+
+    def stats(self):
+        return {
+            room_id: {
+                "loaded": room.loaded,
+                "entries": len(room.numbers),
+                "dirty": len(room.dirty),
+                "too_large": room.too_large,
+                "loads": room.loads,
+                "load_seconds": room.load_seconds,
+                "hits": room.hits,
+                "fallbacks": room.fallbacks,
+            }
+            for room_id, room in list(self._rooms.items())
+        }
+
+
+# 全局编号预加载（单例）
+order_preloads = OrderPreloads(config.ORDER_PRELOAD_MAX_KEYS, config.ORDER_PRELOAD_BATCH,
+                               config.ORDER_PRELOAD_CHECK_INTERVAL)
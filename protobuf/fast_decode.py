@@ -0,0 +1,393 @@
+# 按需字段解码器：直接遍历protobuf wire格式，只取出指定路径的字段，其余字段整体跳过
+# 字段编号/类型取自betterproto生成的douyin.py元数据，并可用validate_against_proto()与douyin.proto核对
+import os
+import re
+import struct
+import typing
+
+from .douyin import ChatMessage, ControlMessage, GiftMessage, LikeMessage, MemberMessage
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH = 2
+_WIRE_FIXED32 = 5
+
+_LEAF = 0
+_MESSAGE = 1
+
+_DEFAULTS = {
+    "string": "",
+    "bytes": b"",
+    "bool": False,
+    "float": 0.0,
+    "double": 0.0,
+}
+
+def _wire_type(proto_type):
+    """字段应有的wire类型，收到的wire类型不一致（数据异常）时跳过该字段"""
+    if proto_type in ("string", "bytes", "message"):
+        return _WIRE_LENGTH
+    if proto_type in ("fixed64", "sfixed64", "double"):
+        return _WIRE_FIXED64
+    if proto_type in ("fixed32", "sfixed32", "float"):
+        return _WIRE_FIXED32
+    return _WIRE_VARINT
+
+
+_SIGNED_VARINT = {"int32", "int64", "enum"}
+_ZIGZAG = {"sint32", "sint64"}
+_FIXED = {
+    "fixed64": struct.Struct("<Q"),
+    "sfixed64": struct.Struct("<q"),
+    "double": struct.Struct("<d"),
+    "fixed32": struct.Struct("<I"),
+    "sfixed32": struct.Struct("<i"),
+    "float": struct.Struct("<f"),
+}
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _field_info(cls, name):
+    """返回 (字段编号, proto类型, 子消息类)"""
+    meta = cls()._betterproto
+    if name not in meta.meta_by_field_name:
+        raise ValueError(f"{cls.__name__} 没有字段 {name}")
+    field_meta = meta.meta_by_field_name[name]
+    hint = typing.get_type_hints(cls)[name]
+    if typing.get_origin(hint) in (list, dict) or field_meta.map_types:
+        raise ValueError(f"{cls.__name__}.{name} 是repeated/map字段，不支持按需解码")
+    return field_meta.number, field_meta.proto_type, meta.cls_by_field.get(name)
+
+
+class FieldDecoder:
+    """
+    只解码指定字段路径的解码器
+    例：FieldDecoder(ChatMessage, {"msg_id": "common.msg_id", "content": "content"}).decode(payload)
+        -> {"msg_id": ..., "content": ...}，缺失字段取proto3默认值
+    """
+
+    def __init__(self, message_cls, fields):
+        self.message_cls = message_cls
+        self.fields = dict(fields)
+        self._tree = {}
+        self._defaults = {}
+        self._paths = {}  # 输出名 -> [(消息类, 字段名, 编号, proto类型)]，供核对proto使用
+        for out_name, path in self.fields.items():
+            self._add_path(out_name, path)
+
+    def _add_path(self, out_name, path):
+        node = self._tree
+        cls = self.message_cls
+        parts = path.split(".")
+        resolved = []
+        for i, part in enumerate(parts):
+            number, proto_type, child_cls = _field_info(cls, part)
+            resolved.append((cls, part, number, proto_type))
+            last = i == len(parts) - 1
+            if last:
+                if proto_type == "message":
+                    raise ValueError(f"{path} 指向子消息，请指定到标量字段")
+                if number in node:
+                    raise ValueError(f"{path} 与其他字段路径冲突")
+                node[number] = (_LEAF, out_name, proto_type, _wire_type(proto_type))
+                self._defaults[out_name] = _DEFAULTS.get(proto_type, 0)
+            else:
+                if proto_type != "message":
+                    raise ValueError(f"{path} 中 {part} 不是子消息")
+                target = node.get(number)
+                if target is None:
+                    target = (_MESSAGE, {}, proto_type, _WIRE_LENGTH)
+                    node[number] = target
+                elif target[0] != _MESSAGE:
+                    raise ValueError(f"{path} 与其他字段路径冲突")
+                node = target[1]
+                cls = child_cls
+        self._paths[out_name] = resolved
+
+    def decode(self, data):
+        out = dict(self._defaults)
+        self._walk(data, 0, len(data), self._tree, out)
+        return out
+
+    def _walk(self, buf, pos, end, node, out):
+        while pos < end:
+            key = buf[pos]
+            if key < 0x80:
+                pos += 1
+            else:
+                key, pos = _read_varint(buf, pos)
+            wire_type = key & 7
+            target = node.get(key >> 3)
+            if target is not None and target[3] != wire_type:
+                target = None  # wire类型与字段定义不符，按未知字段跳过
+
+            if wire_type == _WIRE_VARINT:
+                if target is None:
+                    while buf[pos] >= 0x80:
+                        pos += 1
+                    pos += 1
+                    continue
+                value, pos = _read_varint(buf, pos)
+                proto_type = target[2]
+                if proto_type == "bool":
+                    value = bool(value)
+                elif proto_type in _SIGNED_VARINT:
+                    if value >= 1 << 63:
+                        value -= 1 << 64
+                elif proto_type in _ZIGZAG:
+                    value = (value >> 1) ^ -(value & 1)
+                out[target[1]] = value
+            elif wire_type == _WIRE_LENGTH:
+                length, pos = _read_varint(buf, pos)
+                next_pos = pos + length
+                if target is not None:
+                    if target[0] == _MESSAGE:
+                        self._walk(buf, pos, next_pos, target[1], out)
+                    elif target[2] == "string":
+                        out[target[1]] = bytes(buf[pos:next_pos]).decode("utf-8", "replace")
+                    else:
+                        out[target[1]] = bytes(buf[pos:next_pos])
+                pos = next_pos
+            elif wire_type == _WIRE_FIXED64 or wire_type == _WIRE_FIXED32:
+                size = 8 if wire_type == _WIRE_FIXED64 else 4
+                if target is not None:
+                    out[target[1]] = _FIXED[target[2]].unpack_from(buf, pos)[0]
+                pos += size
+            else:
+                raise ValueError(f"不支持的wire类型: {wire_type}")
+        if pos != end:
+            raise ValueError("protobuf数据被截断")
+
+    def validate_against_proto(self, proto_file=None):
+        """
+        与douyin.proto核对字段路径的编号和类型，返回不一致项列表（为空表示一致）
+        """
+        proto_fields = load_proto_fields(proto_file)
+        problems = []
+        for out_name, resolved in self._paths.items():
+            for cls, name, number, proto_type in resolved:
+                fields = proto_fields.get(cls.__name__)
+                if fields is None:
+                    problems.append(f"{out_name}: douyin.proto中没有消息 {cls.__name__}")
+                    continue
+                camel = _to_camel(name)
+                found = fields.get(camel) or fields.get(name)
+                if found is None:
+                    problems.append(f"{out_name}: {cls.__name__} 中没有字段 {camel}")
+                    continue
+                proto_number, declared_type = found
+                if proto_number != number:
+                    problems.append(f"{out_name}: {cls.__name__}.{camel} 编号 {proto_number} != {number}")
+                if proto_type not in ("message", "enum") and declared_type != proto_type:
+                    problems.append(f"{out_name}: {cls.__name__}.{camel} 类型 {declared_type} != {proto_type}")
+        return problems
+
+
+def _to_camel(name):
+    head, *rest = name.split("_")
+    return head + "".join(p[:1].upper() + p[1:] for p in rest)
+
+
+_MESSAGE_RE = re.compile(r"message\s+(\w+)\s*\{(.*?)\n\}", re.S)
+_FIELD_RE = re.compile(r"^\s*(repeated\s+)?([\w.]+)\s+(\w+)\s*=\s*(\d+)\s*;", re.M)
+
+
+def load_proto_fields(proto_file=None):
+    """解析douyin.proto，返回 {消息名: {字段名: (编号, 类型)}}"""
+    if proto_file is None:
+        proto_file = os.path.join(os.path.dirname(__file__), "douyin.proto")
+    with open(proto_file, "r", encoding="utf8") as f:
+        text = f.read()
+    text = re.sub(r"//[^\n]*", "", text)
+    result = {}
+    for name, body in _MESSAGE_RE.findall(text):
+        result[name] = {field: (int(number), type_) for _, type_, field, number in _FIELD_RE.findall(body)}
+    return result
+
+
+# ---- 外层信封：PushFrame / Response ----
+# 只取出ack和分发需要的字段，messages_list中未订阅的消息不复制payload
+
+def _skip(buf, pos, wire_type):
+    if wire_type == _WIRE_VARINT:
+        while buf[pos] >= 0x80:
+            pos += 1
+        return pos + 1
+    if wire_type == _WIRE_LENGTH:
+        length, pos = _read_varint(buf, pos)
+        return pos + length
+    if wire_type == _WIRE_FIXED64:
+        return pos + 8
+    if wire_type == _WIRE_FIXED32:
+        return pos + 4
+    raise ValueError(f"不支持的wire类型: {wire_type}")
+
+
+class FrameEnvelope:
+    """PushFrame的 log_id / payload_type / headers / payload（payload为memoryview，不复制）"""
+    __slots__ = ("log_id", "payload_type", "headers", "payload")
+
+    def __init__(self):
+        self.log_id = 0
+        self.payload_type = ""
+        self.headers = {}
+        self.payload = b""
+
+
+class ResponseEnvelope:
+    """Response的 need_ack / internal_ext，messages为 [(method, payload或None), ...]"""
+    __slots__ = ("need_ack", "internal_ext", "messages")
+
+    def __init__(self):
+        self.need_ack = False
+        self.internal_ext = ""
+        self.messages = []
+
+
+def scan_push_frame(data):
+    """PushFrame字段：2 log_id，5 headers_list(key=1, value=2)，7 payload_type，8 payload"""
+    buf = memoryview(data)
+    frame = FrameEnvelope()
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if number == 2 and wire_type == _WIRE_VARINT:
+            frame.log_id, pos = _read_varint(buf, pos)
+        elif wire_type == _WIRE_LENGTH and number in (5, 7, 8):
+            length, pos = _read_varint(buf, pos)
+            next_pos = pos + length
+            if number == 8:
+                frame.payload = buf[pos:next_pos]
+            elif number == 7:
+                frame.payload_type = str(buf[pos:next_pos], "utf-8")
+            else:
+                header = {1: "", 2: ""}
+                while pos < next_pos:
+                    key, pos = _read_varint(buf, pos)
+                    if key & 7 == _WIRE_LENGTH and (key >> 3) in header:
+                        length, pos = _read_varint(buf, pos)
+                        header[key >> 3] = str(buf[pos:pos + length], "utf-8", "replace")
+                        pos += length
+                    else:
+                        pos = _skip(buf, pos, key & 7)
+                frame.headers[header[1]] = header[2]
+            pos = next_pos
+        else:
+            pos = _skip(buf, pos, wire_type)
+    return frame
+
+
+def scan_response(data, wanted):
+    """
+    Response字段：1 messages_list(method=1, payload=2)，5 internal_ext，9 need_ack
+    :param wanted: wanted(method) 为False的消息payload置为None，不复制
+    """
+    buf = memoryview(data)
+    response = ResponseEnvelope()
+    messages = response.messages
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if number == 1 and wire_type == _WIRE_LENGTH:
+            length, pos = _read_varint(buf, pos)
+            next_pos = pos + length
+            method, start, stop = "", 0, 0
+            while pos < next_pos:
+                key, pos = _read_varint(buf, pos)
+                if key == 0x0A:  # 1 method
+                    length, pos = _read_varint(buf, pos)
+                    method = str(buf[pos:pos + length], "utf-8")
+                    pos += length
+                elif key == 0x12:  # 2 payload
+                    length, pos = _read_varint(buf, pos)
+                    start, stop = pos, pos + length
+                    pos = stop
+                else:
+                    pos = _skip(buf, pos, key & 7)
+            messages.append((method, bytes(buf[start:stop]) if wanted(method) else None))
+            pos = next_pos
+        elif number == 5 and wire_type == _WIRE_LENGTH:
+            length, pos = _read_varint(buf, pos)
+            response.internal_ext = str(buf[pos:pos + length], "utf-8")
+            pos += length
+        elif number == 9 and wire_type == _WIRE_VARINT:
+            value, pos = _read_varint(buf, pos)
+            response.need_ack = bool(value)
+        else:
+            pos = _skip(buf, pos, wire_type)
+    if pos != end:
+        raise ValueError("protobuf数据被截断")
+    return response
+
+
+# ---- 热点消息类型的预置解码器 ----
+CHAT_DECODER = FieldDecoder(ChatMessage, {
+    "msg_id": "common.msg_id",
+    "room_id": "common.room_id",
+    "user_id": "user.id",
+    "nick_name": "user.nick_name",
+    "content": "content",
+})
+
+GIFT_DECODER = FieldDecoder(GiftMessage, {
+    "msg_id": "common.msg_id",
+    "room_id": "common.room_id",
+    "user_id": "user.id",
+    "nick_name": "user.nick_name",
+    "gift_id": "gift_id",
+    "gift_name": "gift.name",
+    "diamond_count": "gift.diamond_count",
+    "combo": "gift.combo",
+    "repeat_count": "repeat_count",
+    "combo_count": "combo_count",
+    "group_count": "group_count",
+    "group_id": "group_id",
+    "repeat_end": "repeat_end",
+    "total_count": "total_count",
+})
+
+LIKE_DECODER = FieldDecoder(LikeMessage, {
+    "msg_id": "common.msg_id",
+    "room_id": "common.room_id",
+    "user_id": "user.id",
+    "nick_name": "user.nick_name",
+    "count": "count",
+    "total": "total",
+})
+
+MEMBER_DECODER = FieldDecoder(MemberMessage, {
+    "msg_id": "common.msg_id",
+    "room_id": "common.room_id",
+    "user_id": "user.id",
+    "nick_name": "user.nick_name",
+    "member_count": "member_count",
+    "action": "action",
+})
+
+CONTROL_DECODER = FieldDecoder(ControlMessage, {
+    "msg_id": "common.msg_id",
+    "room_id": "common.room_id",
+    "status": "status",
+})
+
+# method -> 解码器
+FAST_DECODERS = {
+    "WebcastChatMessage": CHAT_DECODER,
+    "WebcastGiftMessage": GIFT_DECODER,
+    "WebcastLikeMessage": LIKE_DECODER,
+    "WebcastMemberMessage": MEMBER_DECODER,
+    "WebcastControlMessage": CONTROL_DECODER,
+}
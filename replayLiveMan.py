@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# coding:utf-8
+# @FileName:    replayLiveMan.py
+# @Project:     douyinLiveWebFetcher
+
+import argparse
+import threading
+import time
+
+import config
+from benchmarks.fake_redis import FakeRedis
+from frame_recorder import FrameReplay, recorded_files
+from liveMan import DouyinLiveWebFetcher
+from redis_helper import use_client
+from room_supervisor import ENDED, LIVE
+
+# 排队等待解码的帧数达到该值时暂停读取录制文件，避免整个录制文件被读入内存
+_MAX_LANE_DEPTH = 64
+
+
+def use_replay_redis(mode=None):
+    """
+    按 REPLAY_REDIS 选择回放时补充信息使用的redis，fake时换成进程内空redis
+    :return: 是否使用了进程内redis（此时不订阅键空间通知）
+    """
+    mode = config.REPLAY_REDIS if mode is None else mode
+    if mode not in ("fake", "live"):
+        raise ValueError(f"未知的REPLAY_REDIS: {mode}，可选 fake / live")
+    if mode == "live":
+        return False
+    use_client(FakeRedis())
+    return True
+
+
+class ReplaySocket:
+    """代替抖音websocket连接：接收ack但不发送"""
+
+    def __init__(self):
+        self.acks = 0
+
+    def send(self, data, opcode=None):
+        self.acks += 1
+
+
+class ReplayDouyinLiveWebFetcher(DouyinLiveWebFetcher):
+    """
+    离线回放版直播间抓取对象：从录制文件读取原始推送帧，走与线上相同的 _wsOnMessage 解析→补充信息→推送流程，
+    不需要网络。回调约定与DouyinLiveWebFetcher一致。
+    """
+
+    def __init__(self, live_id, paths=None, speed=None):
+        super().__init__(live_id)
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None  # 回放时不再录制
+        if paths is None:
+            paths = recorded_files(config.REPLAY_DIR, live_id)
+        self.replay = FrameReplay(paths, config.REPLAY_SPEED if speed is None else speed)
+        self.socket = ReplaySocket()
+        self.state = ENDED
+        self.last_error = None
+        self.elapsed = 0.0
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lane.max_depth = 0  # 回放不丢帧，由读取端按积压限速
+
+    def start(self, callback):
+        self.callback = callback
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"replay-{self.live_id}")
+        self._thread.start()
+
+    def stop(self):
+        self._closed = True
+        self._stopped.set()
+        self._releaseResources()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def connection_stats(self):
+        stats = {
+            "state": self.state,
+            "acks": self.socket.acks,
+            "elapsed": self.elapsed,
+            "last_error": self.last_error,
+            "replay": self.replay.stats(),
+        }
+        stats.update(self._frameStats())
+        return stats
+
+    def _run(self):
+        self.state = LIVE
+        print(f"【回放】{self.live_id}：{len(self.replay.paths)}个录制文件，速度 {self.replay.speed or '最快'}")
+        start = time.monotonic()
+        try:
+            self.replay.play(self._onFrame, self._stopped)
+            self.wait_idle()  # 高帧率时部分帧在解码线程池中处理
+        except Exception as e:
+            self.last_error = str(e)
+            print("【X】回放失败: ", e)
+        finally:
+            self.elapsed = time.monotonic() - start
+            self.state = ENDED
+            print(f"【回放】{self.live_id} 结束：{self.replay.frames}帧，用时{self.elapsed:.2f}秒")
+
+    def _onFrame(self, message):
+        # 解码线程池跟不上时等待积压下降
+        while self._lane.depth >= _MAX_LANE_DEPTH and not self._stopped.is_set():
+            time.sleep(0.001)
+        self._wsOnMessage(self.socket, message)
+
+
+if __name__ == '__main__':
+    # 用法：python replayLiveMan.py <live_id> [--dir recordings] [--speed 0]
+    parser = argparse.ArgumentParser(description="回放录制的抖音直播间推送帧")
+    parser.add_argument("live_id")
+    parser.add_argument("--dir", default=config.REPLAY_DIR)
+    parser.add_argument("--speed", type=float, default=config.REPLAY_SPEED, help="1原速，N倍速，0最快")
+    parser.add_argument("--redis", default=config.REPLAY_REDIS, choices=("fake", "live"),
+                        help="fake 进程内空redis（默认，不访问网络），live 线上redis")
+    args = parser.parse_args()
+    use_replay_redis(args.redis)
+
+    counter = {"messages": 0}
+
+    def _count(message):
+        counter["messages"] += 1
+
+    fetcher = ReplayDouyinLiveWebFetcher(args.live_id, recorded_files(args.dir, args.live_id), args.speed)
+    fetcher.start(_count)
+    fetcher.join()
+    stats = fetcher.connection_stats()
+    elapsed = stats["elapsed"] or 1e-9
+    print(f"推送消息 {counter['messages']} 条，{stats['replay']['frames'] / elapsed:.0f} 帧/秒，"
+          f"{counter['messages'] / elapsed:.0f} 条/秒")
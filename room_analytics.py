@@ -0,0 +1,226 @@
+# room_analytics.py
+"""
+直播间实时统计，随聊天消息增量更新，每个直播间占用固定内存
+- SlidingCounter：按秒分桶的滑动窗口消息速率
+- HyperLogLog / WindowedHyperLogLog：近似去重的发言人数（全场 / 最近N秒）
+- SpaceSaving：近似Top-K活跃用户
+"""
+import heapq
+import math
+import threading
+import time
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash64(value):
+    """整数用户id的64位混合哈希（splitmix64终结函数），分布足够均匀且比hashlib快得多"""
+    x = int(value) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class _Window:
+    """把时间按 window/buckets 秒切成环形分桶，过期的桶在前进时重置"""
+
+    def __init__(self, window, buckets):
+        self.window = window
+        self.n = buckets
+        self.width = window / buckets
+        self._slot = None
+
+    def _reset(self, index):
+        raise NotImplementedError
+
+    def _advance(self, now):
+        slot = int(now / self.width)
+        if self._slot is None:
+            self._slot = slot
+        elif slot > self._slot:
+            for s in range(max(self._slot + 1, slot - self.n + 1), slot + 1):
+                self._reset(s % self.n)
+            self._slot = slot
+        return self._slot
+
+
+class SlidingCounter(_Window):
+    """滑动窗口计数"""
+
+    def __init__(self, window=300, buckets=300):
+        super().__init__(window, buckets)
+        self.counts = [0] * buckets
+
+    def _reset(self, index):
+        self.counts[index] = 0
+
+    def add(self, n=1, now=None):
+        self.counts[self._advance(time.monotonic() if now is None else now) % self.n] += n
+
+    def total(self, seconds=None, now=None):
+        """最近seconds秒（默认整个窗口）的计数"""
+        slot = self._advance(time.monotonic() if now is None else now)
+        k = self.n if seconds is None else min(self.n, max(1, math.ceil(seconds / self.width)))
+        return sum(self.counts[s % self.n] for s in range(slot - k + 1, slot + 1))
+
+    def rate(self, seconds=None, now=None):
+        """最近seconds秒的平均每秒数量"""
+        seconds = self.window if seconds is None else min(seconds, self.window)
+        return self.total(seconds, now) / seconds
+
+
+class HyperLogLog:
+    """
+    HyperLogLog基数估计，2^p个寄存器（每个1字节），标准误差约 1.04/sqrt(2^p)
+    p=12时4KB，误差约1.6%
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._rest = 64 - p
+        self._restMask = (1 << self._rest) - 1
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add_hash(self, h):
+        index = h >> self._rest
+        rank = self._rest - (h & self._restMask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def clear(self):
+        self.registers = bytearray(self.m)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("HyperLogLog精度不一致，无法合并")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @staticmethod
+    def estimate(registers, alpha):
+        m = len(registers)
+        total = math.fsum(2.0 ** -r for r in registers)
+        estimate = alpha * m * m / total
+        if estimate <= 2.5 * m:
+            zeros = registers.count(0)
+            if zeros:
+                return m * math.log(m / zeros)  # 小基数时使用线性计数
+        return estimate
+
+    def count(self):
+        return round(self.estimate(self.registers, self._alpha))
+
+
+class WindowedHyperLogLog(_Window):
+    """最近window秒的近似去重计数：每个分桶一个HyperLogLog，查询时合并"""
+
+    def __init__(self, window=300, buckets=5, p=10):
+        super().__init__(window, buckets)
+        self.slots = [HyperLogLog(p) for _ in range(buckets)]
+
+    def _reset(self, index):
+        self.slots[index].clear()
+
+    def add_hash(self, h, now=None):
+        self.slots[self._advance(time.monotonic() if now is None else now) % self.n].add_hash(h)
+
+    def count(self, now=None):
+        self._advance(time.monotonic() if now is None else now)
+        first = self.slots[0]
+        registers = bytearray(map(max, *(s.registers for s in self.slots))) if self.n > 1 else first.registers
+        return round(HyperLogLog.estimate(registers, first._alpha))
+
+
+class SpaceSaving:
+    """
+    Space-Saving近似Top-K：最多跟踪capacity个key，新key挤掉计数最小的key并继承其计数（记为误差上界）
+    计数 >= 真实值 >= 计数 - 误差；真实占比超过 1/capacity 的key一定在其中
+    最小堆中每个key一条记录，计数增加时不更新堆，淘汰时遇到过期记录再修正（均摊O(log capacity)）
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # (记录时的计数, key)，计数 <= 当前计数
+
+    def add(self, key, n=1):
+        """返回被挤掉的key（没有则为None）"""
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return None
+        heap = self._heap
+        if len(counts) < self.capacity:
+            counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(heap, (n, key))
+            return None
+        while True:
+            count, evicted = heap[0]
+            current = counts[evicted]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, evicted))
+        del counts[evicted], self.errors[evicted]
+        counts[key] = count + n
+        self.errors[key] = count
+        heapq.heapreplace(heap, (count + n, key))
+        return evicted
+
+    def top(self, k):
+        ranked = heapq.nlargest(k, self.counts.items(), key=lambda item: item[1])
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+
+class RoomAnalytics:
+    """
+    单个直播间的聊天统计，observe_chat在抓取线程中调用，stats可在任意线程调用
+    :param window: 速率与近期去重人数的窗口（秒）
+    :param top_k: 返回的活跃用户数，内部跟踪 top_k * 100 个用户
+    """
+
+    def __init__(self, window=300, top_k=10, precision=12):
+        self.window = window
+        self.top_k = top_k
+        self.messages = 0
+        self._rate = SlidingCounter(window, max(1, int(window)))
+        self._recentUsers = WindowedHyperLogLog(window, 5, max(4, precision - 2))
+        self._users = HyperLogLog(precision)
+        self._top = SpaceSaving(top_k * 100)
+        self._names = {}  # 只保存Top-K跟踪中的用户昵称
+        self._lock = threading.Lock()
+
+    def observe_chat(self, user_id, nick_name, now=None):
+        now = time.monotonic() if now is None else now
+        h = hash64(user_id)
+        with self._lock:
+            self.messages += 1
+            self._rate.add(1, now)
+            self._recentUsers.add_hash(h, now)
+            self._users.add_hash(h)
+            evicted = self._top.add(user_id)
+            if evicted is not None:
+                self._names.pop(evicted, None)
+            self._names[user_id] = nick_name
+
+    def stats(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "ratePerSecond1m": round(self._rate.rate(60, now), 3),
+                "ratePerSecond": round(self._rate.rate(None, now), 3),
+                "windowSeconds": self.window,
+                "uniqueChatters": self._users.count(),
+                "uniqueChattersWindow": self._recentUsers.count(now),
+                "topChatters": [
+                    {"userId": str(user_id), "userName": self._names.get(user_id, ""), "count": count,
+                     "error": error}
+                    for user_id, count, error in self._top.top(self.top_k)
+                ],
+            }
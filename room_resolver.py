@@ -0,0 +1,175 @@
+# room_resolver.py
+import random
+import re
+import string
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+LIVE_URL = "https://live.douyin.com/"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
+             "Chrome/120.0.0.0 Safari/537.36"
+
+_ROOM_ID_RE = re.compile(r'roomId\\":\\"(\d+)\\"')
+
+
+def generateMsToken(length=107):
+    """
+    产生请求头部cookie中的msToken字段，其实为随机的107位字符
+    :param length:字符位数
+    :return:msToken
+    """
+    base_str = string.ascii_letters + string.digits + '=_'
+    return ''.join(random.choice(base_str) for _ in range(length))
+
+
+class ResolveError(Exception):
+    """ttwid / room_id 获取失败"""
+
+
+class _Call:
+    """同一个key的并发请求只发起一次，其余线程等待结果"""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RoomResolver:
+    """
+    进程级 ttwid / live_id→room_id 解析服务
+    - 共享连接池的requests.Session（keep-alive，避免每次新建TCP/TLS连接）
+    - TTL缓存，直播间抓取器销毁后缓存仍然有效
+    - 请求合并：同一冷门直播间同时进入多个观众只发起一次请求
+    - 失败按指数退避 + 随机抖动重试
+    """
+
+    def __init__(self, live_url=LIVE_URL, user_agent=USER_AGENT, ttwid_ttl=3600.0, room_id_ttl=300.0,
+                 retries=3, backoff=0.5, pool_size=20, timeout=10):
+        self.live_url = live_url
+        self.user_agent = user_agent
+        self.ttwid_ttl = ttwid_ttl
+        self.room_id_ttl = room_id_ttl
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache = {}  # key -> (过期时间, 值)
+        self._inflight = {}  # key -> _Call
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "requests": 0, "retries": 0, "errors": 0}
+
+    def _count(self, name):
+        # 多个抓取线程同时解析，计数需加锁
+        with self._lock:
+            self.stats[name] += 1
+
+    def _cached(self, key):
+        item = self._cache.get(key)
+        if item is not None and item[0] > time.monotonic():
+            return item[1]
+        return None
+
+    def _resolve(self, key, ttl, fetch):
+        """带TTL缓存、请求合并、重试的通用解析"""
+        with self._lock:
+            value = self._cached(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._with_retry(fetch)
+            with self._lock:
+                self._cache[key] = (time.monotonic() + ttl, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e if isinstance(e, ResolveError) else ResolveError(str(e))
+            raise call.error
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def _with_retry(self, fetch):
+        error = None
+        for attempt in range(self.retries):
+            if attempt:
+                self._count("retries")
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            try:
+                self._count("requests")
+                return fetch()
+            except Exception as e:
+                error = e
+        self._count("errors")
+        raise ResolveError(f"重试{self.retries}次后仍失败: {error}")
+
+    def _fetch_ttwid(self):
+        response = self.session.get(self.live_url, headers={"User-Agent": self.user_agent}, timeout=self.timeout)
+        response.raise_for_status()
+        ttwid = response.cookies.get('ttwid')
+        if not ttwid:
+            raise ResolveError("响应中没有ttwid")
+        return ttwid
+
+    def _fetch_room_id(self, live_id):
+        headers = {
+            "User-Agent": self.user_agent,
+            "cookie": f"ttwid={self.ttwid()}&msToken={generateMsToken()}; __ac_nonce=0123407cc00a9e438deb4",
+        }
+        response = self.session.get(self.live_url + live_id, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        match = _ROOM_ID_RE.search(response.text)
+        if match is None:
+            raise ResolveError("No match found for roomId")
+        return match.group(1)
+
+    def ttwid(self):
+        """
+        访问抖音网页版直播间首页获取响应cookie中的ttwid
+        """
+        return self._resolve("ttwid", self.ttwid_ttl, self._fetch_ttwid)
+
+    def room_id(self, live_id):
+        """
+        根据直播间的地址获取到真正的直播间roomId
+        """
+        return self._resolve(f"room:{live_id}", self.room_id_ttl, lambda: self._fetch_room_id(live_id))
+
+    def invalidate_room(self, live_id):
+        """下播/重新开播后room_id会变化，需要作废缓存"""
+        with self._lock:
+            self._cache.pop(f"room:{live_id}", None)
+
+    def invalidate_ttwid(self):
+        with self._lock:
+            self._cache.pop("ttwid", None)
+
+
+# 全局解析服务（单例）
+resolver = RoomResolver(ttwid_ttl=config.TTWID_TTL,
+                        room_id_ttl=config.ROOM_ID_TTL,
+                        retries=config.RESOLVE_RETRIES)
@@ -0,0 +1,224 @@
+# room_supervisor.py
+import random
+import threading
+import time
+
+import websocket
+
+import config
+from room_resolver import resolver
+from scheduler import scheduler
+
+# 直播间连接状态
+RESOLVING = "resolving"  # 获取ttwid / room_id
+SIGNING = "signing"  # 生成websocket签名
+CONNECTING = "connecting"  # websocket握手
+LIVE = "live"  # 已连接，接收弹幕
+BACKOFF = "backoff"  # 等待重连
+ENDED = "ended"  # 已关闭 / 已下播
+
+# 全进程同时进行的连接（解析+签名+握手）数量上限，避免重连风暴
+reconnect_gate = threading.BoundedSemaphore(config.MAX_CONCURRENT_CONNECTS)
+
+
+def reconnect_cause(state, stalled=False, errored=False):
+    """按断开时所处的阶段归类重连原因"""
+    if state == RESOLVING:
+        return "resolve"
+    if state == SIGNING:
+        return "sign"
+    if state == CONNECTING:
+        return "connect"
+    if stalled:
+        return "stall"  # ack超时，主动断开
+    return "error" if errored else "closed"
+
+
+class Backoff:
+    """指数退避 + 随机抖动"""
+
+    def __init__(self, base=1.0, cap=60.0, factor=2.0, jitter=0.5):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next(self):
+        delay = min(self.cap, self.base * (self.factor ** self.attempt))
+        self.attempt += 1
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class RoomSupervisor:
+    """
+    单个直播间的连接监管：一个线程循环执行 解析 -> 签名 -> 连接 -> 接收 -> 退避 -> ...，
+    取代原来在socket回调里递归调用_reconnect的方式，保证每个直播间同一时刻最多一个socket、一个心跳
+    """
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.state = ENDED
+        self.backoff = Backoff(base=config.RECONNECT_BASE_DELAY, cap=config.RECONNECT_MAX_DELAY)
+        self.reconnects = 0
+        self.reconnect_causes = {}  # 原因 -> 次数
+        self.last_error = None
+        self._stalled = False
+        self._errored = False
+        self._stopped = threading.Event()
+        self._thread = None
+        self._timers = []  # 连接存活期间的定时任务（心跳、ack超时检查）
+        self._statusPoll = None
+        self.room_status = None
+        self._gate_held = False
+        self._gate_lock = threading.Lock()
+        self._ws_lock = threading.Lock()  # 发布fetcher.ws与stop()关闭socket互斥
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"room-{self.fetcher.live_id}")
+        self._thread.start()
+        if config.ROOM_STATUS_INTERVAL > 0:
+            self._statusPoll = scheduler.call_every(config.ROOM_STATUS_INTERVAL, self._pollRoomStatus,
+                                                    blocking=True, name=f"status-{self.fetcher.live_id}")
+
+    def stop(self):
+        self._stopped.set()  # 打断退避等待
+        self._cancelTimers()
+        if self._statusPoll is not None:
+            self._statusPoll.cancel()
+        with self._ws_lock:
+            ws = getattr(self.fetcher, 'ws', None)
+        if ws is not None:
+            ws.close()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set() or self.fetcher._closed
+
+    def _set_state(self, state):
+        self.state = state
+
+    def _acquire_gate(self):
+        """等待连接名额（其他直播间可能长时间占用），期间可被stop()打断"""
+        while not reconnect_gate.acquire(timeout=0.5):
+            if self.stopped:
+                return False
+        with self._gate_lock:
+            self._gate_held = True
+        return True
+
+    def _release_gate(self):
+        with self._gate_lock:
+            if self._gate_held:
+                self._gate_held = False
+                reconnect_gate.release()
+
+    def _run(self):
+        fetcher = self.fetcher
+        while not self.stopped:
+            if not self._acquire_gate():
+                break
+            self._stalled = self._errored = False
+            try:
+                self._set_state(RESOLVING)
+                resolver.ttwid()
+                fetcher._onRoomResolved(resolver.room_id(fetcher.live_id))
+
+                self._set_state(SIGNING)
+                wss = fetcher._buildWssUrl()
+                headers = fetcher._wsHeaders()
+
+                self._set_state(CONNECTING)
+                ws = websocket.WebSocketApp(wss,
+                                            header=headers,
+                                            on_open=self._onOpen,
+                                            on_message=fetcher._wsOnMessage,
+                                            on_error=self._onError,
+                                            on_close=fetcher._wsOnClose)
+                with self._ws_lock:
+                    if self.stopped:
+                        break
+                    fetcher.ws = ws  # 之后的stop()一定能关闭这个socket
+                # 阻塞直到连接断开
+                ws.run_forever()
+            except Exception as e:
+                self._errored = True
+                self.last_error = str(e)
+                print("[抖音WebSocket] 连接失败:", e)
+            finally:
+                self._cancelTimers()
+                self._release_gate()
+
+            if self.stopped:
+                break
+            cause = reconnect_cause(self.state, self._stalled, self._errored)
+            self.reconnect_causes[cause] = self.reconnect_causes.get(cause, 0) + 1
+            self._set_state(BACKOFF)
+            self.reconnects += 1
+            delay = self.backoff.next()
+            print(f"[抖音WebSocket] 正在尝试重连中...（{delay:.1f}秒后）")
+            self._stopped.wait(delay)
+        self._set_state(ENDED)
+        if self._statusPoll is not None:
+            self._statusPoll.cancel()
+
+    def _onOpen(self, ws):
+        self._release_gate()
+        if self.stopped:
+            # stop()在run_forever开始前调用时close()不生效，连接建立后立即关闭
+            ws.close()
+            return
+        self.backoff.reset()
+        self._set_state(LIVE)
+        self.fetcher._wsOnOpen(ws)
+        self.fetcher.lastFrameAt = time.monotonic()
+        # 心跳与ack超时检查交给全局调度器，同一直播间只保留一组；
+        # 两者都会写socket（发送心跳 / 关闭连接），卡住的socket不能阻塞调度线程，作为阻塞任务执行
+        self._cancelTimers()
+        live_id = self.fetcher.live_id
+        self._timers.append(scheduler.call_every(config.HEARTBEAT_INTERVAL, self.fetcher._sendHeartbeat,
+                                                 first=0, blocking=True, name=f"hb-{live_id}"))
+        if config.ACK_TIMEOUT > 0:
+            self._timers.append(scheduler.call_every(config.ACK_TIMEOUT / 2, self._checkAckDeadline,
+                                                     blocking=True, name=f"ack-{live_id}"))
+
+    def _onError(self, ws, error):
+        self._errored = True
+        self.last_error = str(error)
+        self.fetcher._wsOnError(ws, error)
+
+    def _cancelTimers(self):
+        timers, self._timers = self._timers, []
+        for timer in timers:
+            timer.cancel()
+
+    def _checkAckDeadline(self):
+        """超过ACK_TIMEOUT没有收到任何推送（也就没有ack可回），视为连接假死，主动断开重连"""
+        if self.state != LIVE:
+            return
+        idle = time.monotonic() - self.fetcher.lastFrameAt
+        if idle > config.ACK_TIMEOUT:
+            print(f"⚠️ [抖音WebSocket] {idle:.0f}秒未收到推送，断开重连")
+            self._stalled = True
+            ws = getattr(self.fetcher, 'ws', None)
+            if ws is not None:
+                ws.close()
+
+    def _pollRoomStatus(self):
+        if not self.stopped:
+            self.room_status = self.fetcher.get_room_status()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "reconnects": self.reconnects,
+            "reconnect_causes": dict(self.reconnect_causes),
+            "backoff_attempt": self.backoff.attempt,
+            "last_error": self.last_error,
+            "room_status": self.room_status,
+        }
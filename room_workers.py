@@ -0,0 +1,498 @@
+# room_workers.py
+"""
+多进程模式（FETCHER_MODE=process）：直播间按一致性哈希分配到N个抓取进程，
+每个进程内部仍是线程模式的DouyinLiveWebFetcher，解压、protobuf解码、redis补充信息、JSON序列化都在子进程完成，
+子进程通过Unix socket把已序列化的消息批量发回uvicorn进程，主进程只负责分发给前端。
+
+帧格式：4字节长度（大端，不含自身） + 1字节类型 + 内容
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import threading
+
+import config
+from encoded_message import EncodedMessage
+from metrics import with_label
+
+# 帧类型
+HELLO = 1  # 子进程 -> 主进程：进程编号
+START = 2  # 主进程 -> 子进程：开始抓取直播间
+STOP = 3  # 主进程 -> 子进程：停止抓取直播间
+BATCH = 4  # 子进程 -> 主进程：同一直播间的一批已序列化消息
+STATS = 5  # 子进程 -> 主进程：各直播间统计与指标（JSON）
+
+_HEADER = struct.Struct(">IB")
+_U32 = struct.Struct(">I")
+_U16 = struct.Struct(">H")
+
+# 子进程每次最多合并发送的消息数
+_SEND_BATCH = 1000
+
+
+def pack_frame(kind, body=b""):
+    return _HEADER.pack(len(body) + 1, kind) + body
+
+
+def pack_batch(live_id, items):
+    """
+    BATCH内容：2字节live_id长度 + live_id + 若干条(2字节msgId长度 + msgId + 4字节长度 + utf-8文本)
+    :param items: [(msgId或None, utf-8文本), ...]，msgId为空时长度为0
+    """
+    room = live_id.encode("utf-8")
+    parts = [_U16.pack(len(room)), room]
+    for msg_id, text in items:
+        msg_id = msg_id.encode("utf-8") if msg_id else b""
+        parts.append(_U16.pack(len(msg_id)))
+        parts.append(msg_id)
+        parts.append(_U32.pack(len(text)))
+        parts.append(text)
+    return pack_frame(BATCH, b"".join(parts))
+
+
+def unpack_batch(body):
+    """:return: (live_id, [(msgId或None, text), ...])"""
+    view = memoryview(body)
+    size = _U16.unpack_from(view, 0)[0]
+    live_id = str(view[2:2 + size], "utf-8")
+    pos = 2 + size
+    items = []
+    end = len(view)
+    while pos < end:
+        size = _U16.unpack_from(view, pos)[0]
+        pos += 2
+        msg_id = str(view[pos:pos + size], "utf-8") if size else None
+        pos += size
+        length = _U32.unpack_from(view, pos)[0]
+        pos += 4
+        items.append((msg_id, str(view[pos:pos + length], "utf-8")))
+        pos += length
+    return live_id, items
+
+
+class HashRing:
+    """一致性哈希环，每个节点放置replicas个虚拟节点"""
+
+    def __init__(self, replicas=64):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}  # 哈希值 -> 节点
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if h not in self._nodes:
+                self._nodes[h] = node
+                bisect.insort(self._keys, h)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if self._nodes.get(h) == node:
+                del self._nodes[h]
+                self._keys.pop(bisect.bisect_left(self._keys, h))
+
+    def node_for(self, key):
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[idx]]
+
+    def __len__(self):
+        return len(set(self._nodes.values()))
+
+
+# ---------------- 子进程 ----------------
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if not n:
+            raise ConnectionError("主进程已断开")
+        got += n
+    return buf
+
+
+def _read_frame(sock):
+    length, kind = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return kind, bytes(_recv_exact(sock, length - 1)) if length > 1 else b""
+
+
+class _RoomWorker:
+    """子进程：接收START/STOP指令，运行直播间抓取器，合并发送消息"""
+
+    def __init__(self, index, socket_path):
+        from liveMan import DouyinLiveWebFetcher
+        self._fetcher_cls = DouyinLiveWebFetcher
+        self.index = index
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.fetchers = {}
+        self.outbox = queue.Queue(maxsize=config.WORKER_OUTBOX_SIZE)
+        self.dropped = {}  # live_id -> outbox已满丢弃的消息数
+        self._send_lock = threading.Lock()
+
+    def _send(self, data):
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def run(self):
+        from blacklist_filter import blacklist_filter
+        from enrich_cache import invalidator
+        from scheduler import scheduler
+        from sign_pool import get_signer
+
+        self._send(pack_frame(HELLO, _U32.pack(self.index)))
+        threading.Thread(target=self._sender, daemon=True, name="worker-sender").start()
+        threading.Thread(target=get_signer().warm_up, daemon=True).start()
+        invalidator.start()
+        blacklist_filter.start()
+        # 序列化与sendall可能阻塞，不能在调度线程内执行
+        scheduler.call_every(config.WORKER_STATS_INTERVAL, self._sendStats, blocking=True, name="worker-stats")
+        try:
+            while True:
+                kind, body = _read_frame(self.sock)
+                live_id = body.decode("utf-8")
+                if kind == START:
+                    self._start(live_id)
+                elif kind == STOP:
+                    fetcher = self.fetchers.pop(live_id, None)
+                    if fetcher is not None:
+                        fetcher.stop()
+        except ConnectionError:
+            pass
+        finally:
+            for fetcher in list(self.fetchers.values()):
+                fetcher.stop()
+
+    def _start(self, live_id):
+        if live_id in self.fetchers:
+            return
+        fetcher = self._fetcher_cls(live_id)
+        fetcher.start(callback=lambda msg: self._enqueue(live_id, (msg.msg_id, msg.json_bytes)))
+        self.fetchers[live_id] = fetcher
+        print(f"【worker-{self.index}】开始抓取直播间 {live_id}")
+
+    def _enqueue(self, live_id, item):
+        try:
+            self.outbox.put_nowait((live_id, item))
+        except queue.Full:
+            count = self.dropped.get(live_id, 0)
+            if count % 1000 == 0:
+                print(f"⚠️ 【worker-{self.index}】主进程读取跟不上，丢弃直播间 {live_id} 的消息")
+            self.dropped[live_id] = count + 1
+
+    def _sender(self):
+        """阻塞取第一条，再把已积压的消息按直播间合并成BATCH帧一次写出"""
+        while True:
+            rooms = {}
+            live_id, item = self.outbox.get()
+            rooms.setdefault(live_id, []).append(item)
+            for _ in range(_SEND_BATCH - 1):
+                try:
+                    live_id, item = self.outbox.get_nowait()
+                except queue.Empty:
+                    break
+                rooms.setdefault(live_id, []).append(item)
+            try:
+                self._send(b"".join(pack_batch(room, items) for room, items in rooms.items()))
+            except OSError:
+                return
+
+    def _sendStats(self):
+        from metrics import registry
+        stats = {
+            "rooms": {
+                live_id: {
+                    "methods": fetcher.registry.stats(),
+                    "dedupe": fetcher.deduper.stats(),
+                    "analytics": fetcher.analytics.stats(),
+                    "gifts": fetcher.gifts.stats(),
+                    "connection": dict(fetcher.connection_stats(), outbox_dropped=self.dropped.get(live_id, 0)),
+                }
+                for live_id, fetcher in list(self.fetchers.items())
+            },
+            "metrics": registry.collect(),  # 解码、redis等延迟直方图
+            "outbox": self.outbox.qsize(),
+        }
+        self._send(pack_frame(STATS, json.dumps(stats, ensure_ascii=False).encode("utf-8")))
+
+
+def worker_main(index, socket_path):
+    """子进程入口"""
+    try:
+        _RoomWorker(index, socket_path).run()
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------------- 主进程 ----------------
+
+class _WorkerHandle:
+    __slots__ = ("index", "process", "writer", "rooms", "stats", "metrics", "restarts")
+
+    def __init__(self, index, process):
+        self.index = index
+        self.process = process
+        self.writer = None  # 子进程连上来之后才可用
+        self.rooms = set()
+        self.stats = {}
+        self.metrics = []
+        self.restarts = 0
+
+
+class _RemoteStats:
+    """与本地抓取器的registry / deduper接口一致，返回子进程最近一次上报的统计"""
+
+    def __init__(self, fetcher, section):
+        self._fetcher = fetcher
+        self._section = section
+
+    def stats(self):
+        return self._fetcher.remote_stats().get(self._section, {})
+
+
+class RemoteRoomFetcher:
+    """
+    子进程中直播间抓取器的代理，接口与DouyinLiveWebFetcher一致（start / stop / connection_stats / registry / deduper / analytics / gifts），
+    ConnectionManager无需关心直播间运行在哪个进程。只能在事件循环线程中调用。
+    """
+
+    def __init__(self, pool, live_id):
+        self.pool = pool
+        self.live_id = live_id
+        self.callback = None
+        self.registry = _RemoteStats(self, "methods")
+        self.deduper = _RemoteStats(self, "dedupe")
+        self.analytics = _RemoteStats(self, "analytics")
+        self.gifts = _RemoteStats(self, "gifts")
+
+    def start(self, callback):
+        self.callback = callback
+        self.pool.attach(self)
+
+    def stop(self):
+        self.pool.detach(self)
+
+    def remote_stats(self):
+        return self.pool.room_stats(self.live_id)
+
+    def connection_stats(self):
+        stats = dict(self.remote_stats().get("connection", {}))
+        stats["worker"] = self.pool.placement.get(self.live_id)
+        return stats
+
+
+class WorkerPool:
+    """
+    主进程侧的抓取进程池
+    - 直播间按一致性哈希分配，已分配的直播间固定在原进程（进程重启后不迁回，避免抖动）
+    - 子进程退出后，其直播间重新分配到存活进程，并自动拉起新进程
+    """
+
+    def __init__(self, size, socket_path, watch_interval=1.0):
+        self.size = max(1, size)
+        self.socket_path = socket_path
+        self.watch_interval = watch_interval
+        self.ring = HashRing()
+        self.workers = {}  # 编号 -> _WorkerHandle
+        self.rooms = {}  # live_id -> RemoteRoomFetcher
+        self.placement = {}  # live_id -> 进程编号
+        self._pending = set()  # 暂无可用进程、等待分配的直播间
+        self._ctx = multiprocessing.get_context("spawn")
+        self._server = None
+        self._watcher = None
+        self._closing = False
+        self.messages = 0
+        self.rebalanced = 0
+
+    async def start(self, ready_timeout=30.0):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._onWorker, path=self.socket_path)
+        for index in range(self.size):
+            self._spawn(index)
+        # 等待子进程连上来，避免启动期间的直播间全部落到第一个就绪的进程
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ready_timeout
+        while len(self.ring) < self.size and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        self._watcher = loop.create_task(self._watch())
+        print(f"✅ 已启动 {len(self.ring)}/{self.size} 个抓取进程")
+
+    async def close(self):
+        self._closing = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._server is not None:
+            self._server.close()
+        for handle in self.workers.values():
+            if handle.writer is not None:
+                handle.writer.close()
+                handle.writer = None
+            if handle.process.is_alive():
+                handle.process.terminate()
+        await asyncio.sleep(0.1)  # 让各连接的读协程处理完断开后退出
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def fetcher(self, live_id):
+        return RemoteRoomFetcher(self, live_id)
+
+    def _spawn(self, index):
+        process = self._ctx.Process(target=worker_main, args=(index, self.socket_path),
+                                    daemon=True, name=f"room-worker-{index}")
+        process.start()
+        old = self.workers.get(index)
+        handle = self.workers[index] = _WorkerHandle(index, process)
+        if old is not None:
+            handle.restarts = old.restarts + 1
+
+    async def _watch(self):
+        """拉起已退出的子进程"""
+        while not self._closing:
+            await asyncio.sleep(self.watch_interval)
+            for index, handle in list(self.workers.items()):
+                if handle.process.is_alive():
+                    continue
+                self._onWorkerLost(handle)
+                if not self._closing:
+                    print(f"⚠️ 抓取进程 worker-{index} 已退出（exitcode={handle.process.exitcode}），重新启动")
+                    self._spawn(index)
+
+    async def _onWorker(self, reader, writer):
+        try:
+            kind, body = await self._readFrame(reader)
+            if kind != HELLO:
+                writer.close()
+                return
+            handle = self.workers[_U32.unpack(body)[0]]
+        except (asyncio.IncompleteReadError, ConnectionError, KeyError):
+            writer.close()
+            return
+
+        handle.writer = writer
+        self.ring.add(handle.index)
+        for live_id in list(self._pending):
+            self._place(live_id)
+        try:
+            while True:
+                kind, body = await self._readFrame(reader)
+                if kind == BATCH:
+                    self._deliver(body)
+                elif kind == STATS:
+                    report = json.loads(body)
+                    handle.stats = report["rooms"]
+                    handle.metrics = report["metrics"]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if handle.writer is writer:
+                self._onWorkerLost(handle)
+            writer.close()
+
+    @staticmethod
+    async def _readFrame(reader):
+        length, kind = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        body = await reader.readexactly(length - 1) if length > 1 else b""
+        return kind, body
+
+    def _deliver(self, body):
+        live_id, items = unpack_batch(body)
+        fetcher = self.rooms.get(live_id)
+        if fetcher is None or fetcher.callback is None:
+            return
+        self.messages += len(items)
+        for msg_id, text in items:
+            try:
+                fetcher.callback(EncodedMessage(text, msg_id=msg_id))
+            except Exception as e:
+                print(f"回调执行失败: {e}")
+
+    def _onWorkerLost(self, handle):
+        """子进程断开：移出哈希环，其直播间重新分配"""
+        if handle.writer is None:
+            return
+        handle.writer = None
+        self.ring.remove(handle.index)
+        orphans, handle.rooms = handle.rooms, set()
+        if handle.process.is_alive():
+            handle.process.kill()  # 连接已断但进程仍在，交给_watch重启
+        for live_id in orphans:
+            self.placement.pop(live_id, None)
+            if live_id in self.rooms:
+                self.rebalanced += 1
+                self._place(live_id)
+
+    def _place(self, live_id):
+        index = self.ring.node_for(live_id)
+        handle = self.workers.get(index) if index is not None else None
+        if handle is None or handle.writer is None:
+            self._pending.add(live_id)
+            return
+        self._pending.discard(live_id)
+        self.placement[live_id] = index
+        handle.rooms.add(live_id)
+        handle.writer.write(pack_frame(START, live_id.encode("utf-8")))
+
+    def attach(self, fetcher):
+        self.rooms[fetcher.live_id] = fetcher
+        if fetcher.live_id not in self.placement:
+            self._place(fetcher.live_id)
+
+    def detach(self, fetcher):
+        live_id = fetcher.live_id
+        if self.rooms.get(live_id) is fetcher:
+            del self.rooms[live_id]
+        self._pending.discard(live_id)
+        index = self.placement.pop(live_id, None)
+        handle = self.workers.get(index)
+        if handle is not None:
+            handle.rooms.discard(live_id)
+            if handle.writer is not None:
+                handle.writer.write(pack_frame(STOP, live_id.encode("utf-8")))
+
+    def room_stats(self, live_id):
+        handle = self.workers.get(self.placement.get(live_id))
+        return handle.stats.get(live_id, {}) if handle is not None else {}
+
+    def metric_families(self):
+        """各抓取进程最近一次上报的指标，追加worker标签"""
+        families = []
+        for index, handle in self.workers.items():
+            families.extend(with_label(handle.metrics, "worker", index))
+        return families
+
+    def stats(self):
+        return {
+            "workers": {
+                index: {
+                    "pid": handle.process.pid,
+                    "alive": handle.process.is_alive(),
+                    "connected": handle.writer is not None,
+                    "rooms": sorted(handle.rooms),
+                    "restarts": handle.restarts,
+                }
+                for index, handle in self.workers.items()
+            },
+            "pending": sorted(self._pending),
+            "messages": self.messages,
+            "rebalanced": self.rebalanced,
+        }
+
+
+# 全局抓取进程池（单例，仅FETCHER_MODE=process时启动）
+worker_pool = WorkerPool(config.WORKER_PROCESSES, config.WORKER_SOCKET)
@@ -0,0 +1,132 @@
+# scheduler.py
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+class TimerHandle:
+    """定时任务句柄，cancel()后不再执行"""
+    __slots__ = ("fn", "interval", "blocking", "due", "cancelled", "name")
+
+    def __init__(self, fn, interval, blocking, due, name):
+        self.fn = fn
+        self.interval = interval
+        self.blocking = blocking
+        self.due = due
+        self.cancelled = False
+        self.name = name
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    全进程共用的小顶堆定时器：所有直播间的心跳、ack超时检查、开播状态轮询都由一个线程驱动，
+    取代每个连接一个sleep线程的做法。
+    - 非阻塞任务（如发送心跳）直接在调度线程执行，必须足够快
+    - 阻塞任务（如HTTP轮询）提交到小线程池执行
+    - 记录调度延迟（实际执行时间 - 计划时间）
+    """
+
+    def __init__(self, blocking_workers=4):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="scheduler-io")
+        self._lag_count = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._lag_last = 0.0
+        self._errors = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="scheduler")
+            self._thread.start()
+
+    def _push(self, handle):
+        heapq.heappush(self._heap, (handle.due, next(self._seq), handle))
+
+    def call_later(self, delay, fn, blocking=False, name=None):
+        """delay秒后执行一次fn()"""
+        return self._schedule(fn, delay, None, blocking, name)
+
+    def call_every(self, interval, fn, first=None, blocking=False, name=None):
+        """每interval秒执行一次fn()，首次在first秒后（默认interval）"""
+        return self._schedule(fn, interval if first is None else first, interval, blocking, name)
+
+    def _schedule(self, fn, delay, interval, blocking, name):
+        handle = TimerHandle(fn, interval, blocking, time.monotonic() + delay, name)
+        with self._cond:
+            self._ensure_started()
+            self._push(handle)
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due, _, handle = self._heap[0]
+                    if handle.cancelled:
+                        heapq.heappop(self._heap)
+                        continue
+                    now = time.monotonic()
+                    if due > now:
+                        self._cond.wait(due - now)
+                        continue
+                    heapq.heappop(self._heap)
+                    break
+                if handle.interval is not None:
+                    # 按计划时间推进，避免漂移；落后太多则从当前时间重新计时
+                    handle.due = due + handle.interval
+                    if handle.due <= now:
+                        handle.due = now + handle.interval
+                    self._push(handle)
+
+            lag = now - due
+            self._lag_count += 1
+            self._lag_total += lag
+            self._lag_last = lag
+            if lag > self._lag_max:
+                self._lag_max = lag
+
+            if handle.blocking:
+                self._executor.submit(self._call, handle)
+            else:
+                self._call(handle)
+
+    def _call(self, handle):
+        if handle.cancelled:
+            return
+        try:
+            handle.fn()
+        except Exception as e:
+            self._errors += 1
+            print(f"❌ 定时任务[{handle.name or handle.fn}]执行失败: {e}")
+
+    def stats(self):
+        with self._cond:
+            pending = sum(1 for _, _, h in self._heap if not h.cancelled)
+        return {
+            "pending": pending,
+            "runs": self._lag_count,
+            "errors": self._errors,
+            "lag_last": self._lag_last,
+            "lag_max": self._lag_max,
+            "lag_avg": self._lag_total / self._lag_count if self._lag_count else 0.0,
+        }
+
+
+# 全局调度器（单例）
+scheduler = Scheduler(blocking_workers=config.SCHEDULER_IO_WORKERS)
@@ -0,0 +1,181 @@
+# sign_pool.py
+import codecs
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from py_mini_racer import MiniRacer
+
+import config
+
+
+class SignerPool:
+    """
+    进程级签名服务：
+    1. 预先eval好sign.js的MiniRacer上下文池，所有直播间共享，避免每次连接都重新读文件、建V8上下文
+    2. 以签名参数串的md5为key的有界TTL缓存
+    """
+
+    def __init__(self, script_file='sign.js', size=2, cache_size=1024, cache_ttl=600.0):
+        self.script_file = script_file
+        self.size = max(1, size)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._script = None
+        self._idle = queue.LifoQueue()  # 空闲上下文，后进先出保持热上下文
+        self._created = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # md5_param -> (过期时间, signature)
+        self._cache_lock = threading.Lock()
+        # 统计信息
+        self._stats = {
+            "sign_count": 0,
+            "sign_errors": 0,
+            "sign_latency_total": 0.0,
+            "sign_latency_max": 0.0,
+            "pool_wait_total": 0.0,
+            "pool_wait_max": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+
+    def _load_script(self):
+        if self._script is None:
+            with codecs.open(self.script_file, 'r', encoding='utf8') as f:
+                self._script = f.read()
+        return self._script
+
+    def _new_context(self):
+        ctx = MiniRacer()
+        ctx.eval(self._load_script())
+        return ctx
+
+    def warm_up(self):
+        """预先创建满池的上下文，建议在服务启动时调用"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            try:
+                self._idle.put(self._new_context())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._new_context()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # 池已满，等待其他线程归还
+        return self._idle.get()
+
+    def _release(self, ctx):
+        self._idle.put(ctx)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            item = self._cache.get(key)
+            if item is None:
+                self._stats["cache_misses"] += 1
+                return None
+            expire_at, signature = item
+            if expire_at < time.monotonic():
+                del self._cache[key]
+                self._stats["cache_misses"] += 1
+                return None
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return signature
+
+    def _cache_put(self, key, signature):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, signature)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def sign(self, md5_param):
+        """
+        对签名参数串的md5进行签名
+        :param md5_param: 签名参数串的md5
+        :return: signature
+        """
+        signature = self._cache_get(md5_param)
+        if signature is not None:
+            return signature
+
+        wait_start = time.perf_counter()
+        ctx = self._acquire()
+        sign_start = time.perf_counter()
+        try:
+            signature = ctx.call("get_sign", md5_param)
+        except Exception:
+            with self._lock:
+                self._stats["sign_errors"] += 1
+            raise
+        finally:
+            self._release(ctx)
+        end = time.perf_counter()
+
+        waited = sign_start - wait_start
+        latency = end - sign_start
+        with self._lock:
+            self._stats["sign_count"] += 1
+            self._stats["sign_latency_total"] += latency
+            self._stats["sign_latency_max"] = max(self._stats["sign_latency_max"], latency)
+            self._stats["pool_wait_total"] += waited
+            self._stats["pool_wait_max"] = max(self._stats["pool_wait_max"], waited)
+
+        if signature:
+            self._cache_put(md5_param, signature)
+        return signature
+
+    def stats(self):
+        """签名池统计：池等待耗时、签名耗时、缓存命中"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pool_size"] = self.size
+            stats["pool_created"] = self._created
+            stats["pool_idle"] = self._idle.qsize()
+        with self._cache_lock:
+            stats["cache_entries"] = len(self._cache)
+        count = stats["sign_count"]
+        stats["sign_latency_avg"] = stats["sign_latency_total"] / count if count else 0.0
+        stats["pool_wait_avg"] = stats["pool_wait_total"] / count if count else 0.0
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_signer(script_file='sign.js'):
+    """获取进程级共享的签名池（按脚本文件区分）"""
+    pool = _pools.get(script_file)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(script_file)
+            if pool is None:
+                pool = SignerPool(script_file,
+                                  size=config.SIGN_POOL_SIZE,
+                                  cache_size=config.SIGN_CACHE_SIZE,
+                                  cache_ttl=config.SIGN_CACHE_TTL)
+                _pools[script_file] = pool
+    return pool
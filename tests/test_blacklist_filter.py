@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import blacklist_filter
+from benchmarks.fake_redis import FakeRedis
+from enrich_cache import enrich_cache, invalidator
+from redis_helper import use_client
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+    previous = use_client(client)
+    monkeypatch.setattr(enrich_cache, "invalidation_live", True)
+    yield client
+    use_client(previous)
+
+
+def _black(client, user_id):
+    client.set(f"black:{user_id}", json.dumps({"orderNameId": "1", "blackLevel": 2}))
+
+
+def test_filter_skips_users_not_in_blacklist(redis):
+    _black(redis, 1001)
+    bf = blacklist_filter.BlacklistFilter(blacklist_filter.INT_SET)
+    bf.rebuild()
+    assert bf.might_contain(1001)
+    assert not bf.might_contain(2002)
+
+
+def test_notifications_off_queries_redis_for_everyone(redis, monkeypatch):
+    bf = blacklist_filter.BlacklistFilter(blacklist_filter.INT_SET)
+    bf.rebuild()
+    monkeypatch.setattr(enrich_cache, "invalidation_live", False)
+    # 通知不可用时新加入黑名单的用户不会进入过滤器，必须查询redis
+    _black(redis, 3003)
+    assert bf.might_contain(3003)
+    assert not bf.usable
+
+
+def test_resubscribe_queries_redis_until_rebuilt(redis, monkeypatch):
+    bf = blacklist_filter.BlacklistFilter(blacklist_filter.BLOOM, capacity=100)
+    bf.rebuild()
+    monkeypatch.setattr(invalidator, "subscriptions", invalidator.subscriptions + 1)
+    # 重新订阅期间可能漏掉通知
+    _black(redis, 4004)
+    assert bf.might_contain(4004)
+    bf.rebuild()
+    assert bf.might_contain(4004)
+    assert not bf.might_contain(5005)